@@ -0,0 +1,76 @@
+"""Per-item annotation latency of VOCDetection: xml vs AnnotationStore.
+
+Times the annotation part of pull_item (ET.parse + VOCAnnotationTransform
+vs AnnotationStore.objects + from_columns) and the whole pull_item with
+the SSD test transform, and checks that both give the same targets.
+Needs a VOCdevkit; the store is built on first use.
+
+    python benchmark/bench_annotations.py --voc_root ~/data/VOCdevkit/ --image_set 2007 test
+"""
+from __future__ import print_function
+import sys
+import time
+import argparse
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import numpy as np
+from data import VOC_ROOT, VOCDetection, BaseTransform, MEANS
+from data.voc0712 import ET
+
+
+parser = argparse.ArgumentParser(description='VOC annotation loading benchmark')
+parser.add_argument('--voc_root', default=VOC_ROOT,
+                    help='Location of VOC root directory')
+parser.add_argument('--image_set', default=['2007', 'test'], nargs=2,
+                    help='Year and image set, e.g. 2007 test')
+parser.add_argument('--num_items', default=500, type=int,
+                    help='Number of items timed')
+args = parser.parse_args()
+
+
+def xml_targets(dataset, indices):
+    for i in indices:
+        img_id = dataset.ids[i]
+        height, width = dataset.store.size(i)
+        target = ET.parse(dataset._annopath % img_id).getroot()
+        yield np.array(dataset.target_transform(target, width, height))
+
+
+def store_targets(dataset, indices):
+    for i in indices:
+        height, width = dataset.store.size(i)
+        yield dataset.target_transform.from_columns(
+            *dataset.store.objects(i), width=width, height=height)
+
+
+def per_item(fn, *fn_args):
+    start = time.time()
+    count = sum(1 for _ in fn(*fn_args))
+    return (time.time() - start) / max(count, 1)
+
+
+def pull_items(dataset, indices):
+    for i in indices:
+        yield dataset.pull_item(i)
+
+
+if __name__ == '__main__':
+    transform = BaseTransform(300, MEANS)
+    xml_set = VOCDetection(args.voc_root, [tuple(args.image_set)], transform,
+                           use_store=False)
+    store_set = VOCDetection(args.voc_root, [tuple(args.image_set)], transform)
+    xml_set.store = None
+    indices = list(range(min(args.num_items, len(store_set))))
+
+    same = all(np.allclose(a, b) for a, b in zip(xml_targets(store_set, indices),
+                                                  store_targets(store_set, indices)))
+    t_xml = per_item(xml_targets, store_set, indices)
+    t_store = per_item(store_targets, store_set, indices)
+    print('annotation | xml: {:8.1f} us | store: {:8.1f} us | speedup: {:6.2f}x | '
+          'identical targets: {}'.format(1e6 * t_xml, 1e6 * t_store,
+                                         t_xml / t_store, same))
+    t_xml = per_item(pull_items, xml_set, indices)
+    t_store = per_item(pull_items, store_set, indices)
+    print('pull_item  | xml: {:8.1f} us | store: {:8.1f} us | speedup: {:6.2f}x'.format(
+        1e6 * t_xml, 1e6 * t_store, t_xml / t_store))
@@ -0,0 +1,72 @@
+"""Per-worker throughput of SSDAugmentation vs FusedSSDAugmentation.
+
+Runs both training augmentations in a single process (what one DataLoader
+worker does) on VOC sized synthetic images, and prints samples/s together
+with summary statistics of the outputs (pixel mean/std per channel, boxes
+per image, box area) to compare the output distributions.
+
+    python benchmark/bench_augmentation.py --num_samples 500
+"""
+from __future__ import print_function
+import sys
+import time
+import argparse
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import cv2
+import numpy as np
+from data import MEANS
+from utils.augmentations import SSDAugmentation, FusedSSDAugmentation
+
+
+parser = argparse.ArgumentParser(description='SSD augmentation benchmark')
+parser.add_argument('--num_samples', default=500, type=int,
+                    help='Number of augmented samples per method')
+parser.add_argument('--num_images', default=20, type=int,
+                    help='Number of distinct synthetic images')
+parser.add_argument('--size', default=300, type=int,
+                    help='Output size')
+parser.add_argument('--seed', default=0, type=int,
+                    help='numpy random seed')
+args = parser.parse_args()
+
+
+def synthetic_samples(num_images):
+    """Smooth 500x375 images with 1-6 percent coord boxes each"""
+    rng = np.random.RandomState(args.seed)
+    samples = []
+    for _ in range(num_images):
+        img = rng.randint(0, 256, (375 // 25, 500 // 25, 3)).astype(np.uint8)
+        img = cv2.resize(img, (500, 375), interpolation=cv2.INTER_CUBIC)
+        n = rng.randint(1, 7)
+        xy = rng.uniform(0, 0.7, (n, 2))
+        wh = rng.uniform(0.05, 0.3, (n, 2))
+        samples.append((img, np.hstack((xy, xy + wh)), rng.randint(0, 20, n)))
+    return samples
+
+
+def run(transform, samples):
+    np.random.seed(args.seed)
+    pixels, num_boxes, areas = [], [], []
+    start = time.time()
+    for i in range(args.num_samples):
+        img, boxes, labels = samples[i % len(samples)]
+        img, boxes, labels = transform(img, boxes.copy(), labels.copy())
+        pixels.append(img[::10, ::10].reshape(-1, 3))
+        num_boxes.append(len(boxes))
+        areas.extend((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]))
+    elapsed = time.time() - start
+    pixels = np.concatenate(pixels)
+    return (args.num_samples / elapsed, pixels.mean(0), pixels.std(0),
+            np.mean(num_boxes), np.mean(areas))
+
+
+if __name__ == '__main__':
+    samples = synthetic_samples(args.num_images)
+    for name, transform in (('SSDAugmentation', SSDAugmentation(args.size, MEANS)),
+                            ('FusedSSDAugmentation', FusedSSDAugmentation(args.size, MEANS))):
+        rate, mean, std, boxes, area = run(transform, samples)
+        print('{:22s} | {:8.1f} samples/s | pixel mean {} std {} | '
+              'boxes/img {:.2f} | box area {:.3f}'.format(
+                  name, rate, np.round(mean, 1), np.round(std, 1), boxes, area))
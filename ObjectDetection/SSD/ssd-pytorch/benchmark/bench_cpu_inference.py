@@ -0,0 +1,90 @@
+"""CPU inference profile sweep for a test phase SSD300.
+
+Times a forward pass including Detect for every combination of intra-op
+thread count, batch size and layout (NCHW, channels_last, channels_last +
+torch.jit.freeze) under torch.inference_mode, and prints the fastest
+configuration per image for the host. --save_profile writes it as the json
+profile read by eval.py / demo/live.py --cpu_profile (utils/cpu_inference.py).
+
+    python benchmark/bench_cpu_inference.py --threads 1 2 4 8 --batch_sizes 1 4 8 --save_profile weights/cpu_profile.json
+"""
+from __future__ import print_function
+import os
+import sys
+import copy
+import time
+import argparse
+import warnings
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+from ssd import build_ssd
+from utils.cpu_inference import CPUInference, load_profile, save_profile
+
+
+parser = argparse.ArgumentParser(description='SSD CPU inference profile sweep')
+parser.add_argument('--trained_model', default=None, type=str,
+                    help='Trained state_dict, default random weights')
+parser.add_argument('--threads', default=None, type=int, nargs='+',
+                    help='Intra-op thread counts, default powers of two up '
+                         'to the number of cpus')
+parser.add_argument('--batch_sizes', default=[1, 4, 8], type=int, nargs='+',
+                    help='Batch sizes to benchmark')
+parser.add_argument('--interop_threads', default=None, type=int,
+                    help='Inter-op threads, set once for the whole sweep')
+parser.add_argument('--iters', default=3, type=int,
+                    help='Timed iterations per configuration')
+parser.add_argument('--save_profile', default=None, type=str,
+                    help='Write the fastest configuration to this json file')
+args = parser.parse_args()
+
+LAYOUTS = [('nchw', False, False), ('channels_last', True, False),
+           ('channels_last+freeze', True, True)]
+
+
+def timeit(model, x):
+    model(x)
+    start = time.time()
+    for _ in range(args.iters):
+        model(x)
+    return (time.time() - start) / args.iters
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore")
+    torch.manual_seed(0)
+    net = build_ssd('test', 300, 21)
+    if args.trained_model:
+        net.load_state_dict(torch.load(args.trained_model, map_location='cpu'))
+    else:
+        for m in net.modules():
+            if isinstance(m, torch.nn.Conv2d):
+                torch.nn.init.normal_(m.weight, std=0.02)
+    net.eval()
+    threads = args.threads or [2 ** i for i in range(16)
+                               if 2 ** i <= (os.cpu_count() or 1)]
+
+    best = None
+    for num_threads in threads:
+        for batch_size in args.batch_sizes:
+            x = torch.randn(batch_size, 3, 300, 300)
+            for name, channels_last, freeze in LAYOUTS:
+                profile = load_profile()
+                profile.update(num_threads=num_threads,
+                               interop_threads=args.interop_threads,
+                               channels_last=channels_last, freeze=freeze,
+                               batch_size=batch_size)
+                model = CPUInference(copy.deepcopy(net), profile)
+                per_image = timeit(model, x) / batch_size
+                print('threads {:3d} | batch {:3d} | {:20s}: {:8.1f} ms/img | '
+                      '{:6.1f} img/s'.format(num_threads, batch_size, name,
+                                             1000 * per_image, 1 / per_image))
+                if best is None or per_image < best[0]:
+                    best = (per_image, profile)
+
+    per_image, profile = best
+    print('best: {} ({:.1f} ms/img)'.format(profile, 1000 * per_image))
+    if args.save_profile:
+        save_profile(profile, args.save_profile)
+        print('Saved profile to {:s}'.format(args.save_profile))
@@ -0,0 +1,85 @@
+"""Training DataLoader throughput in batches/s, with augmentation on and off.
+
+Augmentation on is the SSDAugmentation of train.py, off is only the resize
+and mean subtraction of BaseTransform, so the difference is the cost of the
+augmentation itself. For both it compares detection_collate (a list of
+per-image targets) with padded_collate (one [batch,max_objs,5] tensor),
+workers respawned every epoch with persistent workers, and the prefetch
+factors. Each setting runs --epochs passes over --num_images images, the
+epoch boundaries (and the worker start-up) are part of the timing.
+
+    python benchmark/bench_data_loader.py --voc_root ~/data/VOCdevkit/ --batch_size 32 --num_workers 4 --prefetch_factors 2 4
+"""
+from __future__ import print_function
+import sys
+import time
+import argparse
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+import torch.utils.data as data
+from data import VOC_ROOT, VOCDetection, MEANS, BaseTransform, \
+    detection_collate, padded_collate
+from utils.augmentations import SSDAugmentation
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+parser = argparse.ArgumentParser(description='SSD DataLoader throughput benchmark')
+parser.add_argument('--voc_root', default=VOC_ROOT,
+                    help='Location of VOC root directory')
+parser.add_argument('--image_set', default=['2007', 'trainval'], nargs=2,
+                    help='Year and image set, e.g. 2007 trainval')
+parser.add_argument('--num_images', default=512, type=int,
+                    help='Images per epoch (first N of the image set)')
+parser.add_argument('--epochs', default=3, type=int,
+                    help='Timed epochs per setting')
+parser.add_argument('--batch_size', default=32, type=int,
+                    help='Batch size')
+parser.add_argument('--num_workers', default=4, type=int,
+                    help='Number of DataLoader workers')
+parser.add_argument('--prefetch_factors', default=[2, 4], type=int, nargs='+',
+                    help='Batches prefetched per worker')
+parser.add_argument('--pin_memory', default=torch.cuda.is_available(), type=str2bool,
+                    help='Collate into pinned memory (only useful with a gpu)')
+args = parser.parse_args()
+
+
+def timed(dataset, collate_fn, persistent, prefetch_factor):
+    """batches/s over args.epochs epochs, worker start-up included"""
+    options = {'num_workers': args.num_workers, 'pin_memory': args.pin_memory}
+    if args.num_workers > 0:
+        options.update(persistent_workers=persistent,
+                       prefetch_factor=prefetch_factor)
+    loader = data.DataLoader(dataset, args.batch_size, shuffle=True,
+                             collate_fn=collate_fn, **options)
+    num_batches = 0
+    start = time.time()
+    for _ in range(args.epochs):
+        for images, targets in loader:
+            num_batches += 1
+    return num_batches / (time.time() - start)
+
+
+if __name__ == '__main__':
+    image_sets = [tuple(args.image_set)]
+    transforms = (('on', SSDAugmentation(300, MEANS)),
+                  ('off', BaseTransform(300, MEANS)))
+    print('workers: {:d} | batch: {:d} | images/epoch: {:d} | epochs: {:d} | '
+          'pin_memory: {}'.format(args.num_workers, args.batch_size,
+                                  args.num_images, args.epochs, args.pin_memory))
+    for name, transform in transforms:
+        dataset = VOCDetection(args.voc_root, image_sets, transform)
+        dataset = data.Subset(dataset, range(min(args.num_images, len(dataset))))
+        for collate_name, collate_fn in (('list', detection_collate),
+                                         ('padded', padded_collate)):
+            for persistent in (False, True):
+                for prefetch_factor in args.prefetch_factors:
+                    rate = timed(dataset, collate_fn, persistent, prefetch_factor)
+                    print('augmentation {:3s} | {:6s} targets | persistent {:5s} | '
+                          'prefetch {:d} | {:6.2f} batches/s'.format(
+                              name, collate_name, str(persistent), prefetch_factor,
+                              rate))
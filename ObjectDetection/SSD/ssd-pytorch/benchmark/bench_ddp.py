@@ -0,0 +1,102 @@
+"""Scaling of CPU data-parallel SSD training with torch.distributed gloo.
+
+Runs the train.py step (forward, MultiBoxLoss, backward with the gradient
+all-reduce of DistributedDataParallel, SGD step) on synthetic batches with
+1, 2, 4, ... processes on this host. Every process is pinned to its own
+block of cores (utils.distributed.pin_threads), and the global batch is
+split across the processes as in train.py --distributed true.
+
+    python benchmark/bench_ddp.py --processes 1 2 4 --batch_size 32
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+import warnings
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import torch.optim as optim
+from torch.nn.parallel import DistributedDataParallel
+from data import voc
+from ssd import build_ssd
+from layers.modules import MultiBoxLoss
+from utils.distributed import pin_threads
+
+
+parser = argparse.ArgumentParser(description='SSD gloo data-parallel scaling benchmark')
+parser.add_argument('--processes', default=[1, 2, 4], type=int, nargs='+',
+                    help='Numbers of processes to benchmark')
+parser.add_argument('--batch_size', default=32, type=int,
+                    help='Global batch size, split across the processes')
+parser.add_argument('--threads_per_process', default=None, type=int,
+                    help='Intra-op threads per process, default cores / processes')
+parser.add_argument('--iters', default=5, type=int,
+                    help='Timed iterations')
+parser.add_argument('--port', default=29517, type=int,
+                    help='Rendezvous port on localhost')
+args = parser.parse_args()
+
+
+def synthetic_batch(batch_size, max_objs=8):
+    images = torch.randn(batch_size, 3, voc['min_dim'], voc['min_dim'])
+    targets = []
+    for _ in range(batch_size):
+        n = int(torch.randint(1, max_objs + 1, ()))
+        xy = torch.rand(n, 2) * 0.7
+        wh = torch.rand(n, 2) * 0.3 + 0.02
+        label = torch.randint(0, voc['num_classes'] - 1, (n, 1)).float()
+        targets.append(torch.cat((xy, xy + wh, label), 1))
+    return images, targets
+
+
+def worker(rank, world_size, result):
+    warnings.filterwarnings("ignore")
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(args.port + world_size)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    threads = pin_threads(rank, world_size, args.threads_per_process)
+    torch.manual_seed(rank)
+    ssd_net = build_ssd('train', voc['min_dim'], voc['num_classes'])
+    net = DistributedDataParallel(ssd_net)
+    optimizer = optim.SGD(ssd_net.parameters(), lr=1e-4, momentum=0.9)
+    criterion = MultiBoxLoss(voc['num_classes'], 0.5, True, 0, True, 3, 0.5,
+                             False, False)
+    images, targets = synthetic_batch(args.batch_size // world_size)
+
+    def step():
+        optimizer.zero_grad()
+        loss_l, loss_c = criterion(net(images), targets)
+        (loss_l + loss_c).backward()
+        optimizer.step()
+
+    step()
+    dist.barrier()
+    start = time.time()
+    for _ in range(args.iters):
+        step()
+    dist.barrier()
+    if rank == 0:
+        result.put(((time.time() - start) / args.iters, threads))
+    dist.destroy_process_group()
+
+
+if __name__ == '__main__':
+    ctx = mp.get_context('spawn')
+    base = None
+    for world_size in args.processes:
+        if args.batch_size % world_size:
+            print('skipping {:d} processes: batch size {:d} is not divisible'.format(
+                world_size, args.batch_size))
+            continue
+        result = ctx.SimpleQueue()
+        mp.spawn(worker, args=(world_size, result), nprocs=world_size)
+        t, threads = result.get()
+        base = base or t
+        print('processes {:2d} x {:2d} threads | {:8.1f} ms/iter | {:7.1f} img/s | '
+              'speedup {:5.2f}x'.format(world_size, threads, 1000 * t,
+                                        args.batch_size / t, base / t))
@@ -0,0 +1,125 @@
+"""Peak memory and time-to-mAP: all_boxes lists + detections.pkl vs the
+columnar detection store of eval.py.
+
+Synthetic Detect layer outputs for --num_images VOC sized images (about
+--dets_per_image detections each) are collected batch by batch, either into
+all_boxes[cls][image] arrays that are pickled at the end, or streamed as
+columns into a DetectionStore; then the VOC07 mAP is computed from each.
+Peak memory is the tracemalloc peak of numpy and Python allocations.
+Classes are evaluated in the main process, so they are traced too.
+
+    python benchmark/bench_det_store.py --num_images 4952 --dets_per_image 200
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import pickle
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import numpy as np
+from utils.voc_eval import add_detections, detection_columns, \
+    evaluate_all_boxes, evaluate_columns
+from utils.detection_store import DetectionStore
+
+
+parser = argparse.ArgumentParser(description='SSD detection store benchmark')
+parser.add_argument('--num_images', default=4952, type=int,
+                    help='Number of evaluated images (VOC07 test: 4952)')
+parser.add_argument('--dets_per_image', default=200, type=int,
+                    help='Mean detections per image over all classes')
+parser.add_argument('--batch_size', default=8, type=int,
+                    help='Images per Detect layer output')
+parser.add_argument('--chunk_images', default=500, type=int,
+                    help='Images per chunk of the detection store')
+args = parser.parse_args()
+
+NUM_CLASSES = 21
+TOP_K = 200
+
+
+def batches():
+    """Seeded synthetic [batch,num_classes,top_k,5] Detect outputs and sizes"""
+    rng = np.random.RandomState(0)
+    per_class = args.dets_per_image / float(NUM_CLASSES - 1)
+    for start in range(0, args.num_images, args.batch_size):
+        num = min(args.batch_size, args.num_images - start)
+        dets = np.zeros((num, NUM_CLASSES, TOP_K, 5), np.float32)
+        counts = np.minimum(rng.poisson(per_class, (num, NUM_CLASSES)), TOP_K)
+        counts[:, 0] = 0
+        valid = np.arange(TOP_K)[None, None, :] < counts[:, :, None]
+        xy = rng.rand(num, NUM_CLASSES, TOP_K, 2) * 0.7
+        dets[..., 0] = np.where(valid, -np.sort(-rng.rand(num, NUM_CLASSES, TOP_K)), 0)
+        dets[..., 1:3] = xy
+        dets[..., 3:5] = xy + 0.05 + rng.rand(num, NUM_CLASSES, TOP_K, 2) * 0.25
+        yield start, dets, [(375, 500)] * num
+
+
+def ground_truth():
+    rng = np.random.RandomState(1)
+    counts = rng.randint(1, 6, args.num_images)
+    num = counts.sum()
+    xy = rng.rand(num, 2) * 350
+    return {'image': np.repeat(np.arange(args.num_images), counts),
+            'label': rng.randint(0, NUM_CLASSES - 1, num),
+            'boxes': np.floor(np.hstack((xy, xy + 20 + rng.rand(num, 2) * 120))),
+            'difficult': rng.rand(num) < 0.1}
+
+
+def all_boxes_path(gt, folder):
+    all_boxes = [[[] for _ in range(args.num_images)] for _ in range(NUM_CLASSES)]
+    for start, dets, sizes in batches():
+        add_detections(all_boxes, dets, sizes, start)
+    with open(path.join(folder, 'detections.pkl'), 'wb') as f:
+        pickle.dump(all_boxes, f, pickle.HIGHEST_PROTOCOL)
+    return evaluate_all_boxes(all_boxes, gt, processes=1)
+
+
+def store_path(gt, folder):
+    store = DetectionStore(path.join(folder, 'detections'), args.num_images,
+                           args.chunk_images, resume=False)
+    for start, dets, sizes in batches():
+        store.append(detection_columns(dets, sizes, start), len(sizes))
+    store.flush()
+    return evaluate_columns(store.columns(), gt, args.num_images, NUM_CLASSES,
+                            processes=1)
+
+
+def measured(run, gt):
+    folder = tempfile.mkdtemp()
+    try:
+        tracemalloc.start()
+        start = time.time()
+        results = run(gt, folder)
+        elapsed = time.time() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return np.mean([ap for _, _, ap in results]), elapsed, peak
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    gt = ground_truth()
+    # the same synthetic batches are generated by both paths; baseline
+    # without collecting anything
+    tracemalloc.start()
+    start = time.time()
+    for _ in batches():
+        pass
+    generate = time.time() - start
+    _, base_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('images: {:d} | ~{:d} dets/image | generating the outputs: {:.2f}s, '
+          'peak {:.1f} MB'.format(args.num_images, args.dets_per_image, generate,
+                                  base_peak / 2. ** 20))
+    for name, run in (('all_boxes + pickle', all_boxes_path),
+                      ('detection store', store_path)):
+        mean_ap, elapsed, peak = measured(run, gt)
+        print('{:18s} | time-to-mAP {:6.2f}s | peak {:7.1f} MB | mAP {:.4f}'.format(
+            name, elapsed, peak / 2. ** 20, mean_ap))
@@ -0,0 +1,99 @@
+"""Per-batch benchmark of the Detect layer (decode + nms) at test time.
+
+Compares the original per-image, per-class box_utils.nms() loop with the
+batched Detect layer (box_utils.nms_batch()), and checks that both return
+the same [batch,num_classes,top_k,5] detections.
+
+    python benchmark/bench_detect.py --batch_sizes 1 8 --conf_thresh 0.01
+"""
+from __future__ import print_function
+import sys
+import time
+import argparse
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+import torch.nn.functional as F
+from data import voc
+from layers import Detect, PriorBox
+from layers.box_utils import decode, nms
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+parser = argparse.ArgumentParser(description='SSD Detect layer benchmark')
+parser.add_argument('--batch_sizes', default=[1, 8], type=int, nargs='+',
+                    help='Batch sizes to benchmark')
+parser.add_argument('--conf_thresh', default=0.01, type=float,
+                    help='Detection confidence threshold (eval.py uses 0.01)')
+parser.add_argument('--nms_thresh', default=0.45, type=float,
+                    help='NMS IoU threshold')
+parser.add_argument('--top_k', default=200, type=int,
+                    help='Maximum number of detections per class')
+parser.add_argument('--iters', default=5, type=int,
+                    help='Timed iterations per batch size')
+parser.add_argument('--cuda', default=torch.cuda.is_available(), type=str2bool,
+                    help='Run on the GPU')
+args = parser.parse_args()
+
+
+def loop_detect(loc_data, conf_data, prior_data):
+    """The original Detect.forward: nms() per image and per class."""
+    num, num_priors, num_classes = conf_data.size()
+    output = torch.zeros(num, num_classes, args.top_k, 5)
+    conf_preds = conf_data.transpose(2, 1)
+    for i in range(num):
+        decoded_boxes = decode(loc_data[i], prior_data, voc['variance'])
+        conf_scores = conf_preds[i].clone()
+        for cl in range(1, num_classes):
+            c_mask = conf_scores[cl].gt(args.conf_thresh)
+            scores = conf_scores[cl][c_mask]
+            if scores.size(0) == 0:
+                continue
+            l_mask = c_mask.unsqueeze(1).expand_as(decoded_boxes)
+            boxes = decoded_boxes[l_mask].view(-1, 4)
+            ids, count = nms(boxes, scores, args.nms_thresh, args.top_k)
+            output[i, cl, :count] = \
+                torch.cat((scores[ids[:count]].unsqueeze(1),
+                           boxes[ids[:count]]), 1)
+    return output
+
+
+def random_predictions(batch_size, num_priors, device):
+    loc = torch.randn(batch_size, num_priors, 4, device=device) * 0.5
+    conf = F.softmax(torch.randn(batch_size, num_priors, voc['num_classes'],
+                                 device=device) * 2, dim=-1)
+    return loc, conf
+
+
+def timeit(fn, *fn_args):
+    fn(*fn_args)
+    if args.cuda:
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(args.iters):
+        fn(*fn_args)
+    if args.cuda:
+        torch.cuda.synchronize()
+    return (time.time() - start) / args.iters
+
+
+if __name__ == '__main__':
+    device = torch.device('cuda' if args.cuda else 'cpu')
+    priors = PriorBox(voc).forward().to(device)
+    detect = Detect(voc['num_classes'], 0, args.top_k, args.conf_thresh,
+                    args.nms_thresh)
+    for batch_size in args.batch_sizes:
+        loc, conf = random_predictions(batch_size, priors.size(0), device)
+        out_loop = loop_detect(loc, conf, priors)
+        out_batch = detect(loc, conf, priors)
+        same = torch.allclose(out_loop, out_batch, atol=1e-6)
+        t_loop = timeit(loop_detect, loc, conf, priors)
+        t_batch = timeit(detect, loc, conf, priors)
+        print('batch {:4d} | loop nms: {:8.2f} ms | nms_batch: {:8.2f} ms | '
+              'speedup: {:6.2f}x | identical detections: {}'.format(
+                  batch_size, 1000 * t_loop, 1000 * t_batch,
+                  t_loop / t_batch, same))
@@ -0,0 +1,98 @@
+"""CPU latency of the eager SSD vs its TorchScript and ONNX Runtime exports.
+
+Exports a test phase SSD300 (random weights unless --trained_model is given)
+with utils/export.py, times a forward pass including Detect for every
+runtime and batch size, and compares the exported detections with the
+eager ones.
+
+    python benchmark/bench_export.py --batch_sizes 1 16 --threads 4
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+import tempfile
+import warnings
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import numpy as np
+import torch
+from ssd import build_ssd
+from utils.export import export_torchscript, export_onnx, onnx_session
+
+
+parser = argparse.ArgumentParser(description='SSD export latency benchmark')
+parser.add_argument('--trained_model', default=None, type=str,
+                    help='Trained state_dict, default random weights')
+parser.add_argument('--batch_sizes', default=[1, 16], type=int, nargs='+',
+                    help='Batch sizes to benchmark')
+parser.add_argument('--threads', default=None, type=int,
+                    help='Intra-op threads of torch and onnxruntime, '
+                         'default the torch default')
+parser.add_argument('--iters', default=5, type=int,
+                    help='Timed iterations per batch size')
+args = parser.parse_args()
+
+
+def timeit(fn, x):
+    fn(x)
+    start = time.time()
+    for _ in range(args.iters):
+        fn(x)
+    return (time.time() - start) / args.iters
+
+
+def compare(ref, out):
+    """max abs difference and number of detections of ref / out"""
+    return (np.abs(ref - out).max(), int((ref[..., 0] > 0).sum()),
+            int((out[..., 0] > 0).sum()))
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    net = build_ssd('test', 300, 21)
+    if args.trained_model:
+        net.load_state_dict(torch.load(args.trained_model, map_location='cpu'))
+    else:
+        for m in net.modules():
+            if isinstance(m, torch.nn.Conv2d):
+                torch.nn.init.normal_(m.weight, std=0.02)
+    net.eval()
+
+    tmp_dir = tempfile.mkdtemp()
+    ts_path = os.path.join(tmp_dir, 'ssd300.pt')
+    onnx_path = os.path.join(tmp_dir, 'ssd300.onnx')
+    export_torchscript(net, ts_path)
+    scripted = torch.jit.load(ts_path)
+    try:
+        export_onnx(net, onnx_path)
+        session = onnx_session(onnx_path, torch.get_num_threads())
+    except ImportError as e:
+        print('ONNX Runtime skipped: {}'.format(e))
+        session = None
+
+    runtimes = [('eager', lambda x: net(torch.from_numpy(x)).numpy()),
+                ('torchscript', lambda x: scripted(torch.from_numpy(x)).numpy())]
+    if session is not None:
+        runtimes.append(('onnxruntime',
+                         lambda x: session.run(None, {'images': x})[0]))
+    print('threads: {:d}'.format(torch.get_num_threads()))
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            x = np.random.randn(batch_size, 3, 300, 300).astype(np.float32)
+            ref = runtimes[0][1](x)
+            t_eager = None
+            for name, fn in runtimes:
+                t = timeit(fn, x)
+                t_eager = t_eager or t
+                diff, n_ref, n_out = compare(ref, fn(x))
+                print('batch {:3d} | {:11s}: {:8.1f} ms ({:6.1f} ms/img) | '
+                      'vs eager {:5.2f}x | max diff {:.2e} | detections '
+                      '{:d}/{:d}'.format(batch_size, name, 1000 * t,
+                                         1000 * t / batch_size, t_eager / t,
+                                         diff, n_out, n_ref))
@@ -0,0 +1,88 @@
+"""Per-batch benchmark of hard negative mining in MultiBoxLoss.
+
+Compares the double sort (sort the losses, then sort the indices to get the
+rank of every prior) with box_utils.hard_negative_mask(), which only runs a
+topk over the max(num_neg) highest losses, and checks that both select
+exactly the same negatives.
+
+    python benchmark/bench_hard_negative.py --batch_sizes 32 128 --cuda false
+"""
+from __future__ import print_function
+import sys
+import time
+import argparse
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+from data import voc
+from layers.box_utils import hard_negative_mask
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+parser = argparse.ArgumentParser(description='SSD hard negative mining benchmark')
+parser.add_argument('--batch_sizes', default=[32, 128], type=int, nargs='+',
+                    help='Batch sizes to benchmark')
+parser.add_argument('--num_priors', default=8732, type=int,
+                    help='Number of priors per image (8732 for SSD300)')
+parser.add_argument('--max_pos', default=60, type=int,
+                    help='Maximum number of positive priors per image')
+parser.add_argument('--negpos_ratio', default=3, type=int,
+                    help='Negative:positive ratio')
+parser.add_argument('--iters', default=20, type=int,
+                    help='Timed iterations per batch size')
+parser.add_argument('--cuda', default=torch.cuda.is_available(), type=str2bool,
+                    help='Run on the GPU')
+args = parser.parse_args()
+
+
+def random_losses(batch_size, device):
+    """Per prior confidence losses with positives zeroed, as in MultiBoxLoss."""
+    conf = torch.randn(batch_size * args.num_priors, voc['num_classes'],
+                       device=device)
+    conf_t = torch.randint(0, voc['num_classes'],
+                           (batch_size * args.num_priors, 1), device=device)
+    loss_c = (torch.logsumexp(conf, 1, keepdim=True) - conf.gather(1, conf_t))
+    loss_c = loss_c.view(batch_size, -1)
+    # a variable number of positives per image, some images without any
+    num_pos = torch.randint(0, args.max_pos + 1, (batch_size, 1), device=device)
+    pos = torch.rand_like(loss_c).argsort(1) < num_pos
+    loss_c[pos] = 0
+    return loss_c, pos
+
+
+def double_sort(loss_c, num_neg):
+    _, loss_idx = loss_c.sort(dim=1, descending=True, stable=True)
+    _, idx_rank = loss_idx.sort(1)
+    return idx_rank < num_neg.expand_as(idx_rank)
+
+
+def timeit(fn, *fn_args):
+    fn(*fn_args)
+    if args.cuda:
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(args.iters):
+        fn(*fn_args)
+    if args.cuda:
+        torch.cuda.synchronize()
+    return (time.time() - start) / args.iters
+
+
+if __name__ == '__main__':
+    device = torch.device('cuda' if args.cuda else 'cpu')
+    for batch_size in args.batch_sizes:
+        loss_c, pos = random_losses(batch_size, device)
+        num_pos = pos.long().sum(1, keepdim=True)
+        num_neg = torch.clamp(args.negpos_ratio * num_pos, max=pos.size(1) - 1)
+        same = torch.equal(double_sort(loss_c, num_neg),
+                           hard_negative_mask(loss_c, num_neg))
+        t_sort = timeit(double_sort, loss_c, num_neg)
+        t_topk = timeit(hard_negative_mask, loss_c, num_neg)
+        print('batch {:4d} | double sort: {:8.2f} ms | topk: {:8.2f} ms | '
+              'speedup: {:6.2f}x | identical negatives: {}'.format(
+                  batch_size, 1000 * t_sort, 1000 * t_topk,
+                  t_sort / t_topk, same))
@@ -0,0 +1,91 @@
+"""Per-batch benchmark of prior matching in MultiBoxLoss.
+
+Compares the per-image box_utils.match() loop (targets built on CPU, then
+moved to the device) with the batched box_utils.match_batch(), and checks
+that both produce exactly the same loc_t/conf_t.
+
+    python benchmark/bench_match.py --batch_sizes 8 32 --cuda false
+"""
+from __future__ import print_function
+import sys
+import time
+import argparse
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+from data import voc
+from layers import PriorBox
+from layers.box_utils import match, match_batch, pad_targets
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+parser = argparse.ArgumentParser(description='SSD prior matching benchmark')
+parser.add_argument('--batch_sizes', default=[8, 32], type=int, nargs='+',
+                    help='Batch sizes to benchmark')
+parser.add_argument('--max_objs', default=12, type=int,
+                    help='Maximum number of ground truth boxes per image')
+parser.add_argument('--iters', default=20, type=int,
+                    help='Timed iterations per batch size')
+parser.add_argument('--cuda', default=torch.cuda.is_available(), type=str2bool,
+                    help='Run on the GPU')
+args = parser.parse_args()
+
+
+def random_targets(batch_size, max_objs):
+    targets = []
+    for _ in range(batch_size):
+        n = int(torch.randint(1, max_objs + 1, (1,)))
+        xy = torch.rand(n, 2) * 0.7
+        wh = torch.rand(n, 2) * 0.3 + 0.02
+        labels = torch.randint(0, voc['num_classes'] - 1, (n, 1)).float()
+        targets.append(torch.cat((xy, xy + wh, labels), 1))
+    return targets
+
+
+def loop_match(targets, priors, device):
+    num, num_priors = len(targets), priors.size(0)
+    loc_t = torch.Tensor(num, num_priors, 4)
+    conf_t = torch.LongTensor(num, num_priors)
+    for idx in range(num):
+        match(0.5, targets[idx][:, :-1], priors, voc['variance'],
+              targets[idx][:, -1], loc_t, conf_t, idx)
+    return loc_t.to(device), conf_t.to(device)
+
+
+def batch_match(targets, priors, device):
+    truths, num_objs = pad_targets(targets, device)
+    return match_batch(0.5, truths[:, :, :-1], priors.to(device),
+                       voc['variance'], truths[:, :, -1], num_objs)
+
+
+def timeit(fn, *fn_args):
+    fn(*fn_args)
+    if args.cuda:
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(args.iters):
+        fn(*fn_args)
+    if args.cuda:
+        torch.cuda.synchronize()
+    return (time.time() - start) / args.iters
+
+
+if __name__ == '__main__':
+    device = torch.device('cuda' if args.cuda else 'cpu')
+    priors = PriorBox(voc).forward()
+    for batch_size in args.batch_sizes:
+        targets = random_targets(batch_size, args.max_objs)
+        loc_a, conf_a = loop_match(targets, priors, device)
+        loc_b, conf_b = batch_match(targets, priors, device)
+        pos = conf_a > 0
+        same = torch.equal(conf_a, conf_b) and torch.equal(loc_a[pos], loc_b[pos])
+        t_loop = timeit(loop_match, targets, priors, device)
+        t_batch = timeit(batch_match, targets, priors, device)
+        print('batch {:4d} | loop match: {:8.2f} ms | match_batch: {:8.2f} ms | '
+              'speedup: {:6.2f}x | identical targets: {}'.format(
+                  batch_size, 1000 * t_loop, 1000 * t_batch,
+                  t_loop / t_batch, same))
@@ -0,0 +1,76 @@
+"""Loader throughput and bytes per batch: DataLoader vs RingLoader.
+
+Both loaders run FusedSSDAugmentation on VOCDetection; the default path
+moves float32 images through the worker queues and collates them with
+detection_collate, RingLoader moves uint8 images through the shared-memory
+batch ring and normalizes the batch in the main process.
+
+    python benchmark/bench_ring_loader.py --voc_root ~/data/VOCdevkit/ --batch_size 32 --num_workers 4
+"""
+from __future__ import print_function
+import sys
+import time
+import argparse
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+import torch.utils.data as data
+from data import VOC_ROOT, VOCDetection, MEANS, detection_collate, RingLoader
+from utils.augmentations import FusedSSDAugmentation
+
+
+parser = argparse.ArgumentParser(description='SSD batch ring benchmark')
+parser.add_argument('--voc_root', default=VOC_ROOT,
+                    help='Location of VOC root directory')
+parser.add_argument('--image_set', default=['2007', 'trainval'], nargs=2,
+                    help='Year and image set, e.g. 2007 trainval')
+parser.add_argument('--batch_size', default=32, type=int,
+                    help='Batch size')
+parser.add_argument('--num_workers', default=4, type=int,
+                    help='Number of DataLoader workers')
+parser.add_argument('--num_batches', default=20, type=int,
+                    help='Number of timed batches')
+args = parser.parse_args()
+
+
+def tensor_bytes(obj):
+    if torch.is_tensor(obj):
+        return obj.numel() * obj.element_size()
+    if isinstance(obj, (list, tuple)):
+        return sum(tensor_bytes(o) for o in obj)
+    return 0
+
+
+def timed(loader, ring=None):
+    batches = iter(loader)
+    next(batches)  # start the workers
+    moved = 0
+    start = time.time()
+    for _ in range(args.num_batches):
+        images, targets = next(batches)
+        # bytes written by the workers for this batch and sent to the main
+        # process: the images (uint8 in the ring or float32) and the targets
+        moved += tensor_bytes(targets) + (images.numel() if ring is not None
+                                          else tensor_bytes(images))
+    elapsed = time.time() - start
+    return args.num_batches / elapsed, moved / args.num_batches
+
+
+if __name__ == '__main__':
+    image_sets = [tuple(args.image_set)]
+    dataset = VOCDetection(args.voc_root, image_sets,
+                           FusedSSDAugmentation(300, MEANS))
+    loader = data.DataLoader(dataset, args.batch_size, shuffle=True,
+                             num_workers=args.num_workers,
+                             collate_fn=detection_collate)
+    rate, moved = timed(loader)
+    print('DataLoader | {:6.2f} batches/s | {:8.2f} MB/batch'.format(rate, moved / 2 ** 20))
+
+    dataset = VOCDetection(args.voc_root, image_sets,
+                           FusedSSDAugmentation(300, MEANS, normalize=False))
+    loader = RingLoader(dataset, args.batch_size, 300, MEANS[::-1],
+                        num_workers=args.num_workers)
+    rate, moved = timed(loader, loader.ring)
+    print('RingLoader | {:6.2f} batches/s | {:8.2f} MB/batch | ring {:.1f} MB'.format(
+        rate, moved / 2 ** 20, loader.ring.nbytes / 2 ** 20))
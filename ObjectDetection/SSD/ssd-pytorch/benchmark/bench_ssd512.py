@@ -0,0 +1,118 @@
+"""SSD300 vs SSD512 on the CPU: latency, throughput, memory and mAP.
+
+Every size runs in its own spawned process, so the peak resident memory
+(ru_maxrss) of one does not hide the other. The process reports:
+  - the model parameters and priors
+  - the RSS after building the model
+  - the peak RSS while detecting --batch_sizes batches
+  - ms/img and images/s of the test phase model (network + Detect)
+With --weights300 / --weights512 and a VOC root, it also reports the VOC07
+mAP on the first --eval_images test images; random weights skip the mAP.
+
+    python benchmark/bench_ssd512.py --batch_sizes 1 8 --threads 4
+    python benchmark/bench_ssd512.py --voc_root ~/data/VOCdevkit/ --weights300 weights/ssd300_mAP_77.43_v2.pth --weights512 weights/ssd512_voc.pth --eval_images 500
+"""
+from __future__ import print_function
+import sys
+import time
+import resource
+import argparse
+import warnings
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+
+parser = argparse.ArgumentParser(description='SSD300 vs SSD512 CPU benchmark')
+parser.add_argument('--sizes', default=[300, 512], type=int, nargs='+',
+                    help='Input sizes to compare')
+parser.add_argument('--batch_sizes', default=[1, 8], type=int, nargs='+',
+                    help='Batch sizes to time')
+parser.add_argument('--iters', default=5, type=int,
+                    help='Timed batches per batch size')
+parser.add_argument('--threads', default=None, type=int,
+                    help='torch.set_num_threads, default the torch default')
+parser.add_argument('--voc_root', default=None,
+                    help='VOC root directory, for the mAP')
+parser.add_argument('--weights300', default=None, type=str,
+                    help='Trained SSD300 state_dict, for the mAP')
+parser.add_argument('--weights512', default=None, type=str,
+                    help='Trained SSD512 state_dict, for the mAP')
+parser.add_argument('--eval_images', default=500, type=int,
+                    help='Evaluate on the first N VOC07 test images')
+args = parser.parse_args()
+
+
+def rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def voc07_map(net, size):
+    """VOC07 11 point mAP on the first args.eval_images test images"""
+    from data import VOCDetection, BaseTransform, VOC_CLASSES
+    from utils.voc_eval import detection_columns, ground_truth_from_store, \
+        evaluate_columns
+    from utils.detection_store import concat_columns
+    dataset = VOCDetection(args.voc_root, [('2007', 'test')],
+                           BaseTransform(size, (104, 117, 123)))
+    num_images = min(args.eval_images, len(dataset))
+    chunks = []
+    with torch.no_grad():
+        for start in range(0, num_images, 8):
+            items = [dataset.pull_item(i) for i in range(start, min(start + 8, num_images))]
+            detections = net(torch.stack([im for im, _, _, _ in items], 0)).numpy()
+            chunks.append(detection_columns(detections, [(h, w) for _, _, h, w in items],
+                                            start))
+    gt = ground_truth_from_store(dataset.store, list(VOC_CLASSES))
+    keep = gt['image'] < num_images
+    results = evaluate_columns(concat_columns(chunks), {k: v[keep] for k, v in gt.items()},
+                               num_images, len(VOC_CLASSES) + 1, processes=1)
+    return np.mean([ap for _, _, ap in results])
+
+
+def run(size, weights):
+    """Measurements of one input size, in a fresh process"""
+    warnings.filterwarnings('ignore')
+    from ssd import build_ssd
+    from utils.checkpoint import model_state
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    net = build_ssd('test', size, 21)
+    if weights:
+        net.load_state_dict(model_state(torch.load(weights, map_location='cpu')))
+    net.eval()
+    result = {'params': sum(p.numel() for p in net.parameters()) / 1e6,
+              'priors': net.priors.size(0), 'model_rss': rss_mb(), 'ms_per_img': {}}
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            x = torch.randn(batch_size, 3, size, size)
+            net(x)
+            start = time.time()
+            for _ in range(args.iters):
+                net(x)
+            result['ms_per_img'][batch_size] = \
+                (time.time() - start) / args.iters / batch_size * 1000
+    result['peak_rss'] = rss_mb()
+    result['map'] = voc07_map(net, size) if weights and args.voc_root else None
+    return result
+
+
+if __name__ == '__main__':
+    context = mp.get_context('spawn')
+    weights = {300: args.weights300, 512: args.weights512}
+    print('threads: {} | batches: {}'.format(args.threads or torch.get_num_threads(),
+                                             args.batch_sizes))
+    for size in args.sizes:
+        with context.Pool(1) as pool:
+            r = pool.apply(run, (size, weights.get(size)))
+        print('SSD{:d} | {:5.1f}M params | {:5d} priors | RSS model {:6.1f} MB, '
+              'peak {:6.1f} MB | mAP {}'.format(
+                  size, r['params'], r['priors'], r['model_rss'], r['peak_rss'],
+                  '{:.4f}'.format(r['map']) if r['map'] is not None else '-'))
+        for batch_size, ms in sorted(r['ms_per_img'].items()):
+            print('    batch {:3d} | {:8.1f} ms/img | {:6.2f} img/s'.format(
+                batch_size, ms, 1000. / ms))
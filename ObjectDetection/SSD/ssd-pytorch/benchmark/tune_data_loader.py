@@ -0,0 +1,138 @@
+"""DataLoader autotuner for train.py: worker counts x prefetch factors x
+pinned memory on the VOCDetection + SSDAugmentation pipeline, no model.
+
+Every setting runs --warmup batches (worker start-up) and then times
+--num_batches batches. It reports samples/s and the cpu utilization of the
+host over the timed part (/proc/stat, all processes). The recommendation is
+the setting with the fewest workers, then the smallest prefetch factor,
+reaching --tolerance of the best samples/s, so cores are left for the
+training step. --save_profile writes it for train.py --loader_profile.
+
+    python benchmark/tune_data_loader.py --voc_root ~/data/VOCdevkit/ --batch_size 32 --save_profile weights/loader_profile.json
+    python train.py --loader_profile weights/loader_profile.json
+"""
+from __future__ import print_function
+import os
+import sys
+import time
+import argparse
+import warnings
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+import torch.utils.data as data
+from data import VOC_ROOT, VOCDetection, MEANS, padded_collate
+from utils.augmentations import SSDAugmentation, FusedSSDAugmentation
+from utils.loader_profile import save_loader_profile, cpu_times
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+def default_workers():
+    cpus = os.cpu_count() or 1
+    workers, n = [0], 1
+    while n <= cpus:
+        workers.append(n)
+        n *= 2
+    return workers
+
+
+parser = argparse.ArgumentParser(description='SSD DataLoader autotuner')
+parser.add_argument('--voc_root', default=VOC_ROOT,
+                    help='Location of VOC root directory')
+parser.add_argument('--image_sets', default=['2007', 'trainval', '2012', 'trainval'],
+                    nargs='+', help='Year and image set pairs, as train.py')
+parser.add_argument('--batch_size', default=32, type=int,
+                    help='Batch size of train.py')
+parser.add_argument('--fused_augmentation', default=False, type=str2bool,
+                    help='Tune FusedSSDAugmentation instead of SSDAugmentation')
+parser.add_argument('--workers', default=default_workers(), type=int, nargs='+',
+                    help='Worker counts, default 0 and powers of two up to the cpu count')
+parser.add_argument('--prefetch_factors', default=[2, 4], type=int, nargs='+',
+                    help='Batches prefetched per worker')
+parser.add_argument('--pin_memory', default=[False, True] if torch.cuda.is_available()
+                    else [False], type=str2bool, nargs='+',
+                    help='Pinned memory settings, default both with a gpu')
+parser.add_argument('--warmup', default=2, type=int,
+                    help='Untimed batches per setting')
+parser.add_argument('--num_batches', default=10, type=int,
+                    help='Timed batches per setting')
+parser.add_argument('--tolerance', default=0.95, type=float,
+                    help='Recommend the cheapest setting within this fraction of the best')
+parser.add_argument('--save_profile', default=None, type=str,
+                    help='Write the recommended settings to this json file')
+args = parser.parse_args()
+
+
+def settings():
+    for num_workers in args.workers:
+        # prefetch_factor only applies with workers
+        for prefetch_factor in (args.prefetch_factors if num_workers else [2]):
+            for pin_memory in args.pin_memory:
+                yield num_workers, prefetch_factor, pin_memory
+
+
+def measure(dataset, num_workers, prefetch_factor, pin_memory):
+    """samples/s and host cpu utilization (0-1) of one setting"""
+    # sampling with replacement never ends an epoch, whatever the dataset size
+    sampler = data.RandomSampler(dataset, replacement=True, num_samples=args.batch_size
+                                 * (args.warmup + args.num_batches))
+    options = {'prefetch_factor': prefetch_factor} if num_workers else {}
+    loader = data.DataLoader(dataset, args.batch_size, sampler=sampler,
+                             num_workers=num_workers, pin_memory=pin_memory,
+                             collate_fn=padded_collate, **options)
+    batches = iter(loader)
+    for _ in range(args.warmup):
+        next(batches)
+    cpu_start = cpu_times()
+    start = time.time()
+    samples = 0
+    for images, _ in batches:
+        samples += images.size(0)
+    elapsed = time.time() - start
+    cpu_end = cpu_times()
+    utilization = float('nan')
+    if cpu_start is not None and cpu_end is not None and cpu_end[1] > cpu_start[1]:
+        utilization = float(cpu_end[0] - cpu_start[0]) / (cpu_end[1] - cpu_start[1])
+    return samples / elapsed, utilization
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore")
+    image_sets = list(zip(args.image_sets[::2], args.image_sets[1::2]))
+    augmentation = FusedSSDAugmentation if args.fused_augmentation else SSDAugmentation
+    dataset = VOCDetection(args.voc_root, image_sets, augmentation(300, MEANS))
+    cpus = os.cpu_count() or 1
+    print('host: {:d} cpus | batch size: {:d} | {:s}'.format(
+        cpus, args.batch_size, augmentation.__name__))
+
+    results = []
+    for num_workers, prefetch_factor, pin_memory in settings():
+        rate, utilization = measure(dataset, num_workers, prefetch_factor, pin_memory)
+        results.append((num_workers, prefetch_factor, pin_memory, rate, utilization))
+        print('workers {:2d} | prefetch {:d} | pinned {:5s} | {:8.1f} samples/s | '
+              '{:6.2f} batches/s | cpu {:5.1f}% ({:.1f} cores)'.format(
+                  num_workers, prefetch_factor, str(pin_memory), rate,
+                  rate / args.batch_size, utilization * 100, utilization * cpus))
+
+    best = max(r[3] for r in results)
+    # cheapest setting close to the best: fewest workers, smallest prefetch
+    num_workers, prefetch_factor, pin_memory, rate, utilization = min(
+        (r for r in results if r[3] >= args.tolerance * best),
+        key=lambda r: (r[0], r[1], -r[3]))
+    print('recommended: --num_workers {:d} --prefetch_factor {:d} --pin_memory {} '
+          '({:.1f} samples/s, best {:.1f})'.format(
+              num_workers, prefetch_factor, str(pin_memory).lower(), rate, best))
+    if args.save_profile:
+        save_loader_profile({
+            'num_workers': num_workers,
+            'prefetch_factor': prefetch_factor,
+            'pin_memory': pin_memory,
+            'measured': {'cpus': cpus, 'batch_size': args.batch_size,
+                         'augmentation': augmentation.__name__,
+                         'samples_per_s': rate, 'cpu_utilization': utilization},
+        }, args.save_profile)
+        print('Saved loader profile to {:s}'.format(args.save_profile))
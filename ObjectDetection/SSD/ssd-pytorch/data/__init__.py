@@ -1,6 +1,7 @@
 from .voc0712 import VOCDetection, VOCAnnotationTransform, VOC_CLASSES, VOC_ROOT
 from .coco import COCODetection, COCOAnnotationTransform, COCO_CLASSES, COCO_ROOT, get_label_map
 from .config import *
+from .batch_ring import RingLoader
 import torch
 import cv2
 import numpy as np
@@ -26,6 +27,51 @@ def detection_collate(batch):
     return torch.stack(imgs, 0), targets
 
 
+def padded_collate(batch):
+    """Collate fn producing one zero padded target tensor per batch instead of
+    a list of per-image tensors, so the targets are a single (pinnable) tensor
+    and MultiBoxLoss matches them without padding them again.
+
+    Arguments:
+        batch: (tuple) A tuple of tensor images and [num_objs,5] annotations
+
+    Return:
+        A tuple containing:
+            1) (tensor) batch of images stacked on their 0 dim
+            2) (tuple of tensors) targets [batch,max_objs,5] zero padded to
+                                  the largest image of the batch and
+                                  num_objs [batch]
+    """
+    imgs = torch.stack([sample[0] for sample in batch], 0)
+    # explicit cpu: train.py may set a cuda default tensor type
+    num_objs = torch.tensor([len(sample[1]) for sample in batch], dtype=torch.long,
+                            device='cpu')
+    targets = torch.zeros(len(batch), max(int(num_objs.max()), 1), 5, device='cpu')
+    for j, sample in enumerate(batch):
+        if len(sample[1]):
+            targets[j, :len(sample[1])] = torch.as_tensor(sample[1], dtype=torch.float32)
+    return imgs, (targets, num_objs)
+
+
+def matched_collate(batch):
+    """Collate fn for samples whose targets were already matched against the
+    default boxes in the DataLoader workers (utils.augmentations.MatchPriors).
+
+    Arguments:
+        batch: (tuple) A tuple of tensor images and [num_priors,5] targets
+            (encoded loc targets followed by the matched class label)
+
+    Return:
+        A tuple containing:
+            1) (tensor) batch of images stacked on their 0 dim
+            2) (tuple of tensors) loc_t [batch,num_priors,4] and
+                                  conf_t [batch,num_priors]
+    """
+    imgs = torch.stack([sample[0] for sample in batch], 0)
+    targets = torch.from_numpy(np.stack([sample[1] for sample in batch], 0)).float()
+    return imgs, (targets[:, :, :4].contiguous(), targets[:, :, 4].long())
+
+
 def base_transform(image, size, mean):
     x = cv2.resize(image, (size, size)).astype(np.float32)
     x -= mean
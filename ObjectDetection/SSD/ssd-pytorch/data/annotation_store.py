@@ -0,0 +1,181 @@
+"""Columnar annotation store shared by the VOC and COCO datasets
+
+The annotations of a whole image set are converted once into a few flat
+numpy arrays, so pull_item() only slices arrays instead of parsing XML
+(VOC) or querying pycocotools (COCO) for every sample of every epoch:
+
+    boxes.npy      float32 [num_objs,4]     xmin, ymin, xmax, ymax in pixels
+    labels.npy     int16   [num_objs]       class index / category id
+    difficult.npy  bool    [num_objs]       VOC difficult / COCO iscrowd flag
+    offsets.npy    int64   [num_images+1]   objects of image i are
+                                            offsets[i]:offsets[i+1]
+    sizes.npy      int32   [num_images,2]   height, width
+    meta.json      ids, file names and classes of the image set
+
+The arrays are opened with np.load(mmap_mode='r'): DataLoader workers
+share the page cache instead of each holding a copy of the annotations.
+
+Several processes may build the same store at once (DDP ranks, a training
+and an evaluation job on one dataset root). Each writes its own temporary
+directory and publishes it under <path>.lock: a complete store with the
+same ids that is already there is kept and opened instead, only a stale
+one is replaced.
+"""
+import os
+import os.path as osp
+import json
+import shutil
+import tempfile
+import contextlib
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Windows: no lock, publishing is still atomic per rename
+    fcntl = None
+
+COLUMNS = ('boxes', 'labels', 'difficult', 'offsets', 'sizes')
+
+
+@contextlib.contextmanager
+def _locked(path):
+    """Exclusive lock of the store directory `path` across processes"""
+    with open(path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class AnnotationStore(object):
+    """Read-only view of an annotation store directory written by write()
+
+    Arguments:
+        path (string): store directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(osp.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.ids = self.meta['ids']
+        self._columns = None
+
+    @staticmethod
+    def exists(path):
+        return osp.isfile(osp.join(path, 'meta.json'))
+
+    @staticmethod
+    def open(path):
+        """The store at `path`, None if there is none (or it was replaced by
+        another process while opening it)"""
+        try:
+            return AnnotationStore(path)
+        except (IOError, OSError, ValueError):
+            return None
+
+    @staticmethod
+    def write(path, ids, boxes, labels, difficult, sizes, **meta):
+        """Write a store from per-image lists of objects
+
+        Arguments:
+            path (string): store directory; an existing store with the same
+                ids is kept (another process built it), any other replaced
+            ids (list): json serializable id of every image
+            boxes (list of arrays): [num_objs,4] pixel boxes per image
+            labels (list of arrays): [num_objs] labels per image
+            difficult (list of arrays): [num_objs] flags per image
+            sizes (list): (height, width) per image
+            meta: extra json serializable fields, e.g. classes, file_names
+        """
+        counts = [len(l) for l in labels]
+        columns = {
+            'boxes': np.concatenate(
+                [np.asarray(b, dtype=np.float32).reshape(-1, 4) for b in boxes]
+                + [np.zeros((0, 4), np.float32)]),
+            'labels': np.concatenate(
+                [np.asarray(l, dtype=np.int16) for l in labels]
+                + [np.zeros(0, np.int16)]),
+            'difficult': np.concatenate(
+                [np.asarray(d, dtype=bool) for d in difficult]
+                + [np.zeros(0, bool)]),
+            'offsets': np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            'sizes': np.asarray(sizes, dtype=np.int32).reshape(-1, 2),
+        }
+        # write into a temporary directory first, so that readers never see
+        # a half written store
+        parent = osp.dirname(osp.abspath(path))
+        if not osp.exists(parent):
+            os.makedirs(parent, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(prefix=osp.basename(path) + '.tmp', dir=parent)
+        for name in COLUMNS:
+            np.save(osp.join(tmp_path, name + '.npy'), columns[name])
+        # json round trip: tuple ids become lists, as read back by __init__
+        meta['ids'] = json.loads(json.dumps(list(ids)))
+        with open(osp.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        with _locked(path):
+            if AnnotationStore.exists(path):
+                existing = AnnotationStore(path)
+                if existing.ids == meta['ids']:
+                    shutil.rmtree(tmp_path)
+                    return existing
+                # stale: moved aside before it is removed, so path always
+                # holds a complete store or none
+                old_path = path + '.old%d' % os.getpid()
+                os.rename(path, old_path)
+                shutil.rmtree(old_path)
+            elif osp.exists(path):
+                # left over without meta.json, never a published store
+                shutil.rmtree(path)
+            os.rename(tmp_path, path)
+        return AnnotationStore(path)
+
+    @property
+    def columns(self):
+        # opened lazily, so a store pickled into spawned workers reopens the
+        # memory map instead of copying the arrays; plain ndarray views of
+        # the maps, slicing np.memmap objects is several times slower
+        if self._columns is None:
+            self._columns = {name: np.asarray(np.load(
+                osp.join(self.path, name + '.npy'), mmap_mode='r'))
+                for name in COLUMNS}
+        return self._columns
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_columns'] = None
+        return state
+
+    def __len__(self):
+        return len(self.ids)
+
+    def objects(self, index):
+        """Return the boxes [n,4], labels [n] and difficult flags [n] of an image"""
+        columns = self.columns
+        start, end = columns['offsets'][index:index + 2]
+        return (columns['boxes'][start:end], columns['labels'][start:end],
+                columns['difficult'][start:end])
+
+    def size(self, index):
+        """Return the (height, width) of an image"""
+        height, width = self.columns['sizes'][index]
+        return int(height), int(width)
+
+    def num_objects(self, keep_difficult=True):
+        """Number of objects of every image [num_images], without the
+        difficult (VOC) / crowd (COCO) ones unless keep_difficult"""
+        columns = self.columns
+        counts = np.diff(columns['offsets'])
+        if not keep_difficult:
+            image = np.repeat(np.arange(len(counts)), counts)
+            counts = counts - np.bincount(image[columns['difficult']],
+                                          minlength=len(counts))
+        return counts
+
+    def aspect_ratios(self):
+        """Width / height of every image [num_images]"""
+        sizes = self.columns['sizes'].astype(np.float64)
+        return sizes[:, 1] / sizes[:, 0]
@@ -0,0 +1,148 @@
+"""Shared-memory batch ring for SSD training
+
+The default DataLoader path pickles a float32 3x300x300 tensor per sample
+from the worker to the main process, then detection_collate builds a list
+of per-sample target tensors and stacks the images. RingLoader instead:
+  - lets every worker build a whole batch and write the uint8 images
+    straight into one slot of a ring of batches preallocated in shared
+    memory, so only the slot index and the targets are pickled
+  - pads the targets into a fixed [batch,max_objs,5] tensor plus the
+    number of objects per image, which MultiBoxLoss matches directly;
+    max_objs defaults to the most objects of an image in the dataset's
+    AnnotationStore, so no ground truth is dropped
+  - converts and normalizes the images once per batch in the main
+    process, optionally after moving the uint8 batch to the GPU
+
+The dataset must return uint8 images, e.g. with
+FusedSSDAugmentation(size, MEANS, normalize=False) as transform.
+"""
+import warnings
+import torch
+import torch.utils.data as data
+
+# max_objs of a dataset without an AnnotationStore
+DEFAULT_MAX_OBJS = 64
+
+
+def dataset_max_objs(dataset):
+    """Most objects of an image of `dataset` (difficult / crowd included),
+    from its AnnotationStore; DEFAULT_MAX_OBJS without a store"""
+    store = getattr(dataset, 'store', None)
+    if store is None or not len(store.ids):
+        return DEFAULT_MAX_OBJS
+    return max(int(store.num_objects().max()), 1)
+
+
+class BatchRing(object):
+    """num_slots uint8 image batches [batch,3,size,size] in shared memory"""
+
+    def __init__(self, num_slots, batch_size, size):
+        self.num_slots = num_slots
+        self.images = torch.zeros(num_slots, batch_size, 3, size, size,
+                                  dtype=torch.uint8, device='cpu').share_memory_()
+
+    @property
+    def nbytes(self):
+        return self.images.numel()
+
+
+class _NumberedBatchSampler(data.Sampler):
+    """Yields (batch number, indices), so a worker knows its ring slot"""
+
+    def __init__(self, batch_sampler):
+        self.batch_sampler = batch_sampler
+
+    def __iter__(self):
+        return iter(enumerate(self.batch_sampler))
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+
+class _RingDataset(data.Dataset):
+    """Builds a whole batch in the worker, images go into the ring"""
+
+    def __init__(self, dataset, ring, max_objs):
+        self.dataset = dataset
+        self.ring = ring
+        self.max_objs = max_objs
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, item):
+        number, indices = item
+        slot = number % self.ring.num_slots
+        targets = torch.zeros(len(indices), self.max_objs, 5, device='cpu')
+        num_objs = torch.zeros(len(indices), dtype=torch.long, device='cpu')
+        for j, index in enumerate(indices):
+            img, target = self.dataset[index]
+            self.ring.images[slot, j].copy_(img)
+            if len(target) > self.max_objs:
+                warnings.warn('image {} has {:d} objects, only the first max_objs={:d} '
+                              'are trained on'.format(index, len(target), self.max_objs))
+            target = torch.as_tensor(target[:self.max_objs], dtype=torch.float32)
+            targets[j, :len(target)] = target
+            num_objs[j] = len(target)
+        # drop the padding columns no image of the batch uses, on the cpu
+        targets = targets[:, :max(int(num_objs.max()), 1)]
+        return slot, len(indices), targets, num_objs
+
+
+class RingLoader(object):
+    """DataLoader replacement yielding normalized image batches and padded
+    targets, with the uint8 images passed through a shared-memory BatchRing
+
+    Arguments:
+        dataset: returns (uint8 [3,size,size] image, [num_objs,5] target)
+        batch_size (int): images per batch
+        size (int): image size
+        mean (tuple): per channel mean subtracted from the images, in the
+            channel order of the dataset's images
+        num_workers (int): DataLoader workers, each builds whole batches
+        shuffle (bool): reshuffle every epoch
+        max_objs (int): targets are padded to max_objs objects, default
+            dataset_max_objs(dataset); images with more objects are
+            truncated with a warning
+        prefetch_factor (int): batches prefetched per worker
+        persistent_workers (bool): keep the workers alive across epochs
+        device (torch.device): images are moved to device as uint8 and
+            normalized there
+    Yields:
+        images (tensor) [batch,3,size,size] float32, normalized
+        (targets [batch,objs,5], num_objs [batch]) on the cpu, objs the
+            most objects of an image of the batch (at most max_objs)
+    """
+
+    def __init__(self, dataset, batch_size, size, mean, num_workers=0,
+                 shuffle=True, max_objs=None, prefetch_factor=2, drop_last=False,
+                 persistent_workers=False, device=torch.device('cpu')):
+        sampler = (data.RandomSampler if shuffle else data.SequentialSampler)(
+            range(len(dataset)))
+        self.batch_sampler = data.BatchSampler(sampler, batch_size, drop_last)
+        # a slot is reused once every batch in flight has been handed out:
+        # num_workers * prefetch_factor dispatched plus the one being consumed
+        num_slots = num_workers * prefetch_factor + 1 if num_workers > 0 else 1
+        self.ring = BatchRing(num_slots, batch_size, size)
+        self.mean = torch.tensor(mean, dtype=torch.float32,
+                                 device=device).view(1, 3, 1, 1)
+        self.device = device
+        if max_objs is None:
+            max_objs = dataset_max_objs(dataset)
+        self.max_objs = max_objs
+        self.loader = data.DataLoader(
+            _RingDataset(dataset, self.ring, max_objs), batch_size=None,
+            sampler=_NumberedBatchSampler(self.batch_sampler),
+            num_workers=num_workers,
+            prefetch_factor=prefetch_factor if num_workers > 0 else None,
+            persistent_workers=persistent_workers and num_workers > 0)
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        for slot, num, targets, num_objs in self.loader:
+            # copy out of the slot before the next batch is requested
+            images = self.ring.images[slot, :num].to(self.device).float()
+            images -= self.mean
+            yield images, (targets, num_objs)
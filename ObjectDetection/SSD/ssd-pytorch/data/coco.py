@@ -1,4 +1,5 @@
 from .config import HOME
+from .annotation_store import AnnotationStore
 import os
 import os.path as osp
 import sys
@@ -72,6 +73,59 @@ class COCOAnnotationTransform(object):
 
         return res  # [[xmin, ymin, xmax, ymax, label_idx], ... ]
 
+    def from_columns(self, boxes, labels, difficult, width, height):
+        """Same result as __call__, from the columns of an AnnotationStore
+        Args:
+            boxes (array): [num_objs,4] pixel boxes xmin, ymin, xmax, ymax
+            labels (array): [num_objs] COCO category ids
+            difficult (array): [num_objs] iscrowd flags (kept, as in __call__)
+        Returns:
+            a [num_objs,5] array [[xmin, ymin, xmax, ymax, label_idx], ... ]
+        """
+        label_ind = self._label_ind
+        labels = np.asarray(labels)
+        unknown = labels >= len(label_ind)
+        if not unknown.any():
+            unknown = label_ind[labels] < 0
+        if unknown.any():
+            # unknown category ids raise, as the label_map lookup of __call__
+            raise KeyError(int(labels[unknown][0]))
+        target = np.empty((len(labels), 5))
+        target[:, :4] = boxes
+        target[:, :4] /= (width, height, width, height)
+        target[:, 4] = label_ind[labels]
+        return target
+
+    @property
+    def _label_ind(self):
+        # COCO category id -> label_idx lookup table
+        if not hasattr(self, '_label_ind_cache'):
+            self._label_ind_cache = np.full(max(self.label_map) + 1, -1)
+            for category_id, label in self.label_map.items():
+                self._label_ind_cache[category_id] = label - 1
+        return self._label_ind_cache
+
+
+def build_coco_store(path, coco, ids):
+    """Convert the COCO annotations of the images ids into an AnnotationStore
+    Args:
+        path (string): store directory
+        coco (COCO): pycocotools api of the image set
+        ids (list): COCO image ids
+    """
+    sizes, boxes, labels, crowd, file_names = [], [], [], [], []
+    for img_id in ids:
+        anns = [obj for obj in coco.imgToAnns[img_id] if 'bbox' in obj]
+        img = coco.imgs[img_id]
+        sizes.append((img['height'], img['width']))
+        file_names.append(img['file_name'])
+        boxes.append([[x, y, x + w, y + h] for x, y, w, h in
+                      (obj['bbox'] for obj in anns)])
+        labels.append([obj['category_id'] for obj in anns])
+        crowd.append([obj.get('iscrowd', 0) == 1 for obj in anns])
+    return AnnotationStore.write(path, ids, boxes, labels, crowd, sizes,
+                                 file_names=file_names)
+
 
 class COCODetection(data.Dataset):
     """`MS Coco Detection <http://mscoco.org/dataset/#detections-challenge2016>`_ Dataset.
@@ -82,19 +136,42 @@ class COCODetection(data.Dataset):
                                         raw images`
         target_transform (callable, optional): A function/transform that takes
         in the target (bbox) and transforms it.
+        store_dir (string, optional): directory of the AnnotationStore of
+            image_set, built from the json annotations on first use
+            (default: <root>/annotations/store_<image_set>)
+        use_store (bool, optional): read annotations from the store instead of
+            querying pycocotools for every sample (default: True)
     """
 
     def __init__(self, root, image_set='trainval35k', transform=None,
-                 target_transform=COCOAnnotationTransform(), dataset_name='MS COCO'):
+                 target_transform=COCOAnnotationTransform(), dataset_name='MS COCO',
+                 store_dir=None, use_store=True):
         sys.path.append(osp.join(root, COCO_API))
-        from pycocotools.coco import COCO
         self.root = osp.join(root, IMAGES, image_set)
-        self.coco = COCO(osp.join(root, ANNOTATIONS,
-                                  INSTANCES_SET.format(image_set)))
-        self.ids = list(self.coco.imgToAnns.keys())
+        self._annfile = osp.join(root, ANNOTATIONS, INSTANCES_SET.format(image_set))
+        self._coco = None
         self.transform = transform
         self.target_transform = target_transform
         self.name = dataset_name
+        self.store = None
+        if use_store and hasattr(target_transform, 'from_columns'):
+            if store_dir is None:
+                store_dir = osp.join(root, ANNOTATIONS, 'store_' + image_set)
+            self.store = AnnotationStore.open(store_dir)
+            if self.store is None:
+                self.store = build_coco_store(
+                    store_dir, self.coco, list(self.coco.imgToAnns.keys()))
+            # the json annotations are only loaded again by pull_anno()
+            self.ids = self.store.ids
+        else:
+            self.ids = list(self.coco.imgToAnns.keys())
+
+    @property
+    def coco(self):
+        if self._coco is None:
+            from pycocotools.coco import COCO
+            self._coco = COCO(self._annfile)
+        return self._coco
 
     def __getitem__(self, index):
         """
@@ -119,16 +196,24 @@ class COCODetection(data.Dataset):
                    target is the object returned by ``coco.loadAnns``.
         """
         img_id = self.ids[index]
-        target = self.coco.imgToAnns[img_id]
-        ann_ids = self.coco.getAnnIds(imgIds=img_id)
-
-        target = self.coco.loadAnns(ann_ids)
-        path = osp.join(self.root, self.coco.loadImgs(img_id)[0]['file_name'])
-        assert osp.exists(path), 'Image path does not exist: {}'.format(path)
-        img = cv2.imread(osp.join(self.root, path))
-        height, width, _ = img.shape
-        if self.target_transform is not None:
-            target = self.target_transform(target, width, height)
+        if self.store is not None:
+            # every lookup is an array slice of the memory mapped store
+            path = osp.join(self.root, self.store.meta['file_names'][index])
+            img = cv2.imread(path)
+            if img is None:
+                raise IOError('Cannot read image: {}'.format(path))
+            height, width, _ = img.shape
+            target = self.target_transform.from_columns(
+                *self.store.objects(index), width=width, height=height)
+        else:
+            path = osp.join(self.root, self.coco.loadImgs(img_id)[0]['file_name'])
+            assert osp.exists(path), 'Image path does not exist: {}'.format(path)
+            img = cv2.imread(path)
+            height, width, _ = img.shape
+            ann_ids = self.coco.getAnnIds(imgIds=img_id)
+            target = self.coco.loadAnns(ann_ids)
+            if self.target_transform is not None:
+                target = self.target_transform(target, width, height)
         if self.transform is not None:
             target = np.array(target)
             img, boxes, labels = self.transform(img, target[:, :4],
@@ -150,8 +235,10 @@ class COCODetection(data.Dataset):
         Return:
             cv2 img
         '''
-        img_id = self.ids[index]
-        path = self.coco.loadImgs(img_id)[0]['file_name']
+        if self.store is not None:
+            path = self.store.meta['file_names'][index]
+        else:
+            path = self.coco.loadImgs(self.ids[index])[0]['file_name']
         return cv2.imread(osp.join(self.root, path), cv2.IMREAD_COLOR)
 
     def pull_anno(self, index):
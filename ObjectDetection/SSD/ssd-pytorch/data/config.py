@@ -40,3 +40,42 @@ coco = {
     'clip': True,
     'name': 'COCO',
 }
+
+# SSD512: one more source feature map (conv12_2) and the default box scales
+# of the original Caffe models (conv4_3 0.07 / 0.04 of the input, then
+# 0.15 to 0.9 of it)
+voc512 = {
+    'num_classes': 21,
+    'lr_steps': (80000, 100000, 120000),
+    'max_iter': 120000,
+    'feature_maps': [64, 32, 16, 8, 4, 2, 1],
+    'min_dim': 512,
+    'steps': [8, 16, 32, 64, 128, 256, 512],
+    'min_sizes': [35.84, 76.8, 153.6, 230.4, 307.2, 384.0, 460.8],
+    'max_sizes': [76.8, 153.6, 230.4, 307.2, 384.0, 460.8, 537.6],
+    'aspect_ratios': [[2], [2, 3], [2, 3], [2, 3], [2, 3], [2], [2]],
+    'variance': [0.1, 0.2],
+    'clip': True,
+    'name': 'VOC',
+}
+
+coco512 = {
+    'num_classes': 201,
+    'lr_steps': (280000, 360000, 400000),
+    'max_iter': 400000,
+    'feature_maps': [64, 32, 16, 8, 4, 2, 1],
+    'min_dim': 512,
+    'steps': [8, 16, 32, 64, 128, 256, 512],
+    'min_sizes': [20.48, 51.2, 133.12, 215.04, 296.96, 378.88, 460.8],
+    'max_sizes': [51.2, 133.12, 215.04, 296.96, 378.88, 460.8, 542.72],
+    'aspect_ratios': [[2], [2, 3], [2, 3], [2, 3], [2, 3], [2], [2]],
+    'variance': [0.1, 0.2],
+    'clip': True,
+    'name': 'COCO',
+}
+
+# config of every input size and dataset, see ssd.build_ssd
+configs = {
+    300: {'VOC': voc, 'COCO': coco},
+    512: {'VOC': voc512, 'COCO': coco512},
+}
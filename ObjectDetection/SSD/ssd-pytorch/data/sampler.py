@@ -0,0 +1,81 @@
+"""Batch sampler over the AnnotationStore of a dataset
+
+AspectRatioBatchSampler reads the object counts and image sizes from the
+memory mapped store columns (no image or annotation is loaded) and
+  - skips images without objects: an empty target cannot be augmented and
+    contributes nothing but negatives
+  - puts images of similar aspect ratio (landscape, square, portrait, ...)
+    into the same batch, so per batch resizing/padding distorts less
+
+    sampler = AspectRatioBatchSampler.from_dataset(dataset, 32)
+    loader = data.DataLoader(dataset, batch_sampler=sampler, ...)
+"""
+import numpy as np
+import torch.utils.data as data
+
+# width / height bin edges: portrait < 0.75 <= ... < 1.33 <= landscape
+DEFAULT_GROUP_EDGES = (0.5, 0.75, 1.0, 1.33, 2.0)
+
+
+class AspectRatioBatchSampler(data.Sampler):
+    """Shuffled batches of images of the same aspect ratio group
+
+    Arguments:
+        aspect_ratios (array): width / height of every image
+        batch_size (int): images per batch
+        num_objs (array, optional): objects per image, images with none are
+            skipped (default: keep every image)
+        group_edges (tuple, optional): aspect ratio bin edges, None puts all
+            images into one group
+        shuffle (bool): reshuffle the images and the batch order every epoch
+        drop_last (bool): drop the incomplete last batch of every group
+    """
+
+    def __init__(self, aspect_ratios, batch_size, num_objs=None,
+                 group_edges=DEFAULT_GROUP_EDGES, shuffle=True, drop_last=False):
+        aspect_ratios = np.asarray(aspect_ratios)
+        self.indices = np.arange(len(aspect_ratios))
+        if num_objs is not None:
+            self.indices = self.indices[np.asarray(num_objs) > 0]
+        self.groups = np.digitize(aspect_ratios[self.indices], group_edges) \
+            if group_edges else np.zeros(len(self.indices), np.int64)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+
+    @classmethod
+    def from_dataset(cls, dataset, batch_size, skip_empty=True,
+                     group_edges=DEFAULT_GROUP_EDGES, **kwargs):
+        """Sampler of a VOCDetection / COCODetection reading an AnnotationStore;
+        VOC difficult objects only count if the target transform keeps them"""
+        if dataset.store is None:
+            raise ValueError('AspectRatioBatchSampler needs a dataset with an '
+                             'AnnotationStore (use_store=True)')
+        num_objs = dataset.store.num_objects(getattr(
+            dataset.target_transform, 'keep_difficult', True)) if skip_empty else None
+        return cls(dataset.store.aspect_ratios(), batch_size, num_objs,
+                   group_edges, **kwargs)
+
+    def _group_batches(self):
+        order = np.random.permutation(len(self.indices)) if self.shuffle \
+            else np.arange(len(self.indices))
+        batches = []
+        for group in np.unique(self.groups):
+            members = self.indices[order[self.groups[order] == group]]
+            end = len(members) - len(members) % self.batch_size \
+                if self.drop_last else len(members)
+            batches.extend(members[i:i + self.batch_size].tolist()
+                           for i in range(0, end, self.batch_size))
+        return batches
+
+    def __iter__(self):
+        batches = self._group_batches()
+        if self.shuffle:
+            batches = [batches[i] for i in np.random.permutation(len(batches))]
+        return iter(batches)
+
+    def __len__(self):
+        counts = np.bincount(self.groups) if len(self.groups) else np.zeros(0, np.int64)
+        if self.drop_last:
+            return int((counts // self.batch_size).sum())
+        return int(((counts + self.batch_size - 1) // self.batch_size).sum())
@@ -6,6 +6,7 @@ https://github.com/fmassa/vision/blob/voc_dataset/torchvision/datasets/voc.py
 Updated by: Ellis Brown, Max deGroot
 """
 from .config import HOME
+from .annotation_store import AnnotationStore
 import os.path as osp
 import sys
 import torch
@@ -76,6 +77,69 @@ class VOCAnnotationTransform(object):
 
         return res  # [[xmin, ymin, xmax, ymax, label_ind], ... ]
 
+    def from_columns(self, boxes, labels, difficult, width, height):
+        """Same result as __call__, from the columns of an AnnotationStore
+        Arguments:
+            boxes (array): [num_objs,4] 0-based pixel boxes
+            labels (array): [num_objs] indexes into VOC_CLASSES
+            difficult (array): [num_objs] difficult flags
+        Returns:
+            a [num_objs,5] array [[xmin, ymin, xmax, ymax, label_ind], ... ]
+        """
+        if not self.keep_difficult and difficult.any():
+            boxes, labels = boxes[~difficult], labels[~difficult]
+        target = np.empty((len(labels), 5))
+        target[:, :4] = boxes
+        target[:, :4] /= (width, height, width, height)
+        target[:, 4] = self._label_ind[labels]
+        return target
+
+    @property
+    def _label_ind(self):
+        # VOC_CLASSES index -> class_to_ind index
+        if not hasattr(self, '_label_ind_cache'):
+            self._label_ind_cache = np.array(
+                [self.class_to_ind[name] for name in VOC_CLASSES])
+        return self._label_ind_cache
+
+
+def parse_voc_xml(filename):
+    """Parse the image size and all objects (difficult ones included) of a
+    VOC xml file: (height, width), boxes [n,4], VOC_CLASSES indexes [n] and
+    difficult flags [n]
+    """
+    target = ET.parse(filename).getroot()
+    size = target.find('size')
+    boxes, labels, difficult = [], [], []
+    for obj in target.iter('object'):
+        difficult.append(int(obj.find('difficult').text) == 1)
+        labels.append(VOC_CLASSES.index(obj.find('name').text.lower().strip()))
+        bbox = obj.find('bndbox')
+        boxes.append([int(bbox.find(pt).text) - 1
+                      for pt in ('xmin', 'ymin', 'xmax', 'ymax')])
+    return ((int(size.find('height').text), int(size.find('width').text)),
+            boxes, labels, difficult)
+
+
+def build_voc_store(path, ids, annopath):
+    """Convert the xml annotations of the images ids into an AnnotationStore
+    Arguments:
+        path (string): store directory
+        ids (list): (rootpath, image name) of every image
+        annopath (string): xml path pattern, formatted with an id
+    """
+    sizes, boxes, labels, difficult = [], [], [], []
+    for i, img_id in enumerate(ids):
+        size, b, l, d = parse_voc_xml(annopath % img_id)
+        sizes.append(size)
+        boxes.append(b)
+        labels.append(l)
+        difficult.append(d)
+        if i % 1000 == 0:
+            print('Converting annotation {:d}/{:d}'.format(i + 1, len(ids)))
+    return AnnotationStore.write(path, [list(img_id) for img_id in ids], boxes,
+                                 labels, difficult, sizes, classes=VOC_CLASSES)
+
 
 class VOCDetection(data.Dataset):
     """VOC Detection Dataset Object
@@ -92,12 +156,17 @@ class VOCDetection(data.Dataset):
             (eg: take in caption string, return tensor of word indices)
         dataset_name (string, optional): which dataset to load
             (default: 'VOC2007')
+        store_dir (string, optional): directory of the AnnotationStore of
+            image_sets, built from the xml files on first use
+            (default: <root>/annotation_store/<image_sets>)
+        use_store (bool, optional): read annotations from the store instead
+            of parsing the xml of every sample (default: True)
     """
 
     def __init__(self, root,
                  image_sets=[('2007', 'trainval'), ('2012', 'trainval')],
                  transform=None, target_transform=VOCAnnotationTransform(),
-                 dataset_name='VOC0712'):
+                 dataset_name='VOC0712', store_dir=None, use_store=True):
         self.root = root
         self.image_set = image_sets
         self.transform = transform
@@ -110,6 +179,17 @@ class VOCDetection(data.Dataset):
             rootpath = osp.join(self.root, 'VOC' + year)
             for line in open(osp.join(rootpath, 'ImageSets', 'Main', name + '.txt')):
                 self.ids.append((rootpath, line.strip()))
+        # the store holds the raw columns, a custom target_transform still
+        # gets the parsed xml
+        self.store = None
+        if use_store and hasattr(target_transform, 'from_columns'):
+            if store_dir is None:
+                store_dir = osp.join(self.root, 'annotation_store', '+'.join(
+                    'VOC%s_%s' % image_set for image_set in image_sets))
+            self.store = AnnotationStore.open(store_dir)
+            if self.store is None or \
+                    self.store.ids != [list(img_id) for img_id in self.ids]:
+                self.store = build_voc_store(store_dir, self.ids, self._annopath)
 
     def __getitem__(self, index):
         im, gt, h, w = self.pull_item(index)
@@ -124,12 +204,16 @@ class VOCDetection(data.Dataset):
         # print("index:" + str(index) + "img_id:" + str(img_id))
         # print("self._annopath" + self._annopath)
         # print("self._imgpath" + self._imgpath)
-        target = ET.parse(self._annopath % img_id).getroot()
         img = cv2.imread(self._imgpath % img_id)
         height, width, channels = img.shape
 
-        if self.target_transform is not None:
-            target = self.target_transform(target, width, height)
+        if self.store is not None:
+            target = self.target_transform.from_columns(
+                *self.store.objects(index), width=width, height=height)
+        else:
+            target = ET.parse(self._annopath % img_id).getroot()
+            if self.target_transform is not None:
+                target = self.target_transform(target, width, height)
 
         if self.transform is not None:
             target = np.array(target)
@@ -168,8 +252,12 @@ class VOCDetection(data.Dataset):
                 eg: ('001718', [('dog', (96, 13, 438, 332))])
         '''
         img_id = self.ids[index]
-        anno = ET.parse(self._annopath % img_id).getroot()
-        gt = self.target_transform(anno, 1, 1)
+        if self.store is not None:
+            gt = self.target_transform.from_columns(
+                *self.store.objects(index), width=1, height=1).tolist()
+        else:
+            anno = ET.parse(self._annopath % img_id).getroot()
+            gt = self.target_transform(anno, 1, 1)
         return img_id[1], gt
 
     def pull_tensor(self, index):
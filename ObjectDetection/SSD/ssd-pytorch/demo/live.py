@@ -9,8 +9,13 @@ import argparse
 parser = argparse.ArgumentParser(description='Single Shot MultiBox Detection')
 parser.add_argument('--weights', default='weights/ssd_300_VOC0712.pth',
                     type=str, help='Trained state_dict file path')
+parser.add_argument('--size', default=300, type=int, choices=[300, 512],
+                    help='Input size of the trained model: SSD300 or SSD512')
 parser.add_argument('--cuda', default=False, type=bool,
                     help='Use cuda in live demo')
+parser.add_argument('--cpu_profile', default=None, type=str,
+                    help='CPU inference profile json, default channels_last '
+                         'with the torch default threads')
 args = parser.parse_args()
 
 COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
@@ -73,13 +78,18 @@ if __name__ == '__main__':
 
     from data import BaseTransform, VOC_CLASSES as labelmap
     from ssd import build_ssd
+    from utils.cpu_inference import CPUInference, load_profile
 
-    net = build_ssd('test', 300, 21)    # initialize SSD
+    net = build_ssd('test', args.size, 21)    # initialize SSD
     net.load_state_dict(torch.load(args.weights))
+    net.eval()
+    if not args.cuda:
+        # channels_last, inference_mode and the threads of the profile
+        net = CPUInference(net, load_profile(args.cpu_profile))
     transform = BaseTransform(net.size, (104/256.0, 117/256.0, 123/256.0))
 
     fps = FPS().start()
-    cv2_demo(net.eval(), transform)
+    cv2_demo(net, transform)
     # stop the timer and display FPS information
     fps.stop()
 
@@ -0,0 +1,90 @@
+"""Headless SSD detection pipeline
+
+Capture, batched inference and sink stages in separate threads connected by
+bounded queues (utils/pipeline.py), no OpenCV window needed:
+
+    # video file -> json lines on stdout
+    python demo/pipeline.py --source video.mp4 --jsonl -
+    # webcam 0, live: drop the oldest frames when inference falls behind
+    python demo/pipeline.py --source 0 --capture_policy drop_oldest --video out.mp4
+    # image directory -> annotated images + json lines
+    python demo/pipeline.py --source images/ --images out/ --jsonl out/detections.jsonl
+"""
+from __future__ import print_function
+import sys
+import argparse
+import warnings
+from os import path
+sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
+
+import torch
+from data import BaseTransform, VOC_CLASSES as labelmap
+from ssd import build_ssd
+from utils.checkpoint import model_state
+from utils.cpu_inference import CPUInference, load_profile
+from utils.pipeline import Pipeline, DropQueue, open_source, JSONLSink, \
+    ImageSink, VideoSink
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+parser = argparse.ArgumentParser(description='Single Shot MultiBox Detection pipeline')
+parser.add_argument('--weights', default='weights/ssd_300_VOC0712.pth',
+                    type=str, help='Trained state_dict file path')
+parser.add_argument('--size', default=300, type=int, choices=[300, 512],
+                    help='Input size of the trained model: SSD300 or SSD512')
+parser.add_argument('--source', default='0', type=str,
+                    help='Video file, webcam index or image directory')
+parser.add_argument('--jsonl', default=None, type=str,
+                    help='Write detections as json lines to this file, - for stdout')
+parser.add_argument('--images', default=None, type=str,
+                    help='Write annotated frames as images into this directory')
+parser.add_argument('--video', default=None, type=str,
+                    help='Write annotated frames to this video file')
+parser.add_argument('--batch_size', default=4, type=int,
+                    help='Maximum frames per forward pass')
+parser.add_argument('--max_wait', default=0.01, type=float,
+                    help='Seconds inference waits for more frames to fill a batch')
+parser.add_argument('--queue_size', default=8, type=int,
+                    help='Capacity of the capture and result queues')
+parser.add_argument('--capture_policy', default='block', choices=DropQueue.POLICIES,
+                    help='What capture does when the inference stage falls behind')
+parser.add_argument('--result_policy', default='block', choices=DropQueue.POLICIES,
+                    help='What inference does when the sink stage falls behind')
+parser.add_argument('--thresh', default=0.6, type=float,
+                    help='Minimum score of a reported detection')
+parser.add_argument('--cuda', default=False, type=str2bool,
+                    help='Use cuda')
+parser.add_argument('--cpu_profile', default=None, type=str,
+                    help='CPU inference profile json, see utils/cpu_inference.py')
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore")
+    net = build_ssd('test', args.size, len(labelmap) + 1)
+    net.load_state_dict(model_state(torch.load(args.weights, map_location='cpu')))
+    net.eval()
+    if args.cuda:
+        net = net.cuda()
+        detector = lambda x: net(x.cuda())
+    else:
+        detector = CPUInference(net, load_profile(args.cpu_profile))
+    source = open_source(args.source)
+    sinks = []
+    if args.jsonl:
+        sinks.append(JSONLSink(args.jsonl, labelmap))
+    if args.images:
+        sinks.append(ImageSink(args.images, labelmap))
+    if args.video:
+        sinks.append(VideoSink(args.video, labelmap, source.fps))
+
+    pipeline = Pipeline(detector, BaseTransform(net.size, (104, 117, 123)),
+                        source, sinks, batch_size=args.batch_size,
+                        max_wait=args.max_wait, queue_size=args.queue_size,
+                        capture_policy=args.capture_policy,
+                        result_policy=args.result_policy, thresh=args.thresh)
+    stats = pipeline.run()
+    print(stats.report(), file=sys.stderr)
@@ -8,11 +8,17 @@ from __future__ import print_function
 
 import torch
 import torch.backends.cudnn as cudnn
-from torch.autograd import Variable
+import torch.utils.data as data
 from data import VOC_ROOT, VOCAnnotationTransform, VOCDetection, BaseTransform
 from data import VOC_CLASSES as labelmap
 
 from ssd import build_ssd
+from utils.checkpoint import model_state
+from utils.voc_eval import voc_ap, detection_columns, all_boxes_from_columns, \
+    ground_truth_from_store, evaluate_columns
+from utils.detection_store import DetectionStore
+from utils.raw_outputs import RawOutputWriter
+from utils.cpu_inference import CPUInference, load_profile
 
 import sys
 import os
@@ -41,8 +47,34 @@ parser.add_argument('--save_folder', default='eval/ssd300_mAP_77.43_v2.pth', typ
                     help='File path to save results')
 parser.add_argument('--cuda', default=True, type=str2bool,
                     help='Use cuda to train model')
+parser.add_argument('--size', default=300, type=int, choices=[300, 512],
+                    help='Input size of the trained model: SSD300 or SSD512')
 parser.add_argument('--voc_root', default=VOC_ROOT,
                     help='Location of VOC root directory')
+parser.add_argument('--batch_size', default=8, type=int,
+                    help='Batch size for evaluation')
+parser.add_argument('--num_workers', default=4, type=int,
+                    help='Number of workers used in dataloading')
+parser.add_argument('--results_files', default=False, type=str2bool,
+                    help='Write the per-class VOC results files and evaluate '
+                         'from them instead of evaluating in memory')
+parser.add_argument('--eval_processes', default=None, type=int,
+                    help='Processes evaluating classes in memory, '
+                         'default one per cpu')
+parser.add_argument('--raw_outputs', default=None, type=str,
+                    help='Directory to also cache the raw loc/conf outputs '
+                         'of every image in, for sweep.py')
+parser.add_argument('--raw_dtype', default='float16', choices=['float16', 'float32'],
+                    help='dtype of the cached raw outputs; float32 doubles the '
+                         'files, but sweep.py then gives the mAP of eval.py')
+parser.add_argument('--resume', default=True, type=str2bool,
+                    help='Continue an interrupted run from its detection store '
+                         '(<save_folder>/test/detections), not with --raw_outputs')
+parser.add_argument('--chunk_images', default=500, type=int,
+                    help='Images per chunk of the detection store')
+parser.add_argument('--cpu_profile', default=None, type=str,
+                    help='CPU inference profile json (channels_last, threads, '
+                         'jit freeze), see benchmark/bench_cpu_inference.py')
 
 args = parser.parse_args()
 
@@ -114,6 +146,20 @@ def parse_rec(filename):
     return objects
 
 
+def store_recs(store, imagenames):
+    """ Same records as parse_rec (name, bbox, difficult) for every image,
+    read from the AnnotationStore of the dataset instead of the xml files """
+    index = {img_id[1]: i for i, img_id in enumerate(store.ids)}
+    classes = store.meta['classes']
+    recs = {}
+    for imagename in imagenames:
+        boxes, labels, difficult = store.objects(index[imagename])
+        recs[imagename] = [{'name': classes[l], 'bbox': b, 'difficult': int(d)}
+                           for b, l, d in zip(boxes.astype(int).tolist(),
+                                              labels.tolist(), difficult.tolist())]
+    return recs
+
+
 def get_output_dir(name, phase):
     """Return the directory where experimental artifacts are placed.
     If the directory does not exist, it is created.
@@ -143,7 +189,7 @@ def write_voc_results_file(all_boxes, dataset):
         with open(filename, 'wt') as f:
             for im_ind, index in enumerate(dataset.ids):
                 dets = all_boxes[cls_ind+1][im_ind]
-                if dets == []:
+                if len(dets) == 0:
                     continue
                 # the VOCdevkit expects 1-based indices
                 for k in range(dets.shape[0]):
@@ -153,19 +199,40 @@ def write_voc_results_file(all_boxes, dataset):
                                    dets[k, 2] + 1, dets[k, 3] + 1))
 
 
-def do_python_eval(output_dir='output', use_07=True):
+def do_python_eval(output_dir='output', use_07=True, store=None):
     cachedir = os.path.join(devkit_path, 'annotations_cache')
-    aps = []
     # The PASCAL VOC metric changed in 2010
     use_07_metric = use_07
     print('VOC07 metric? ' + ('Yes' if use_07_metric else 'No'))
     if not os.path.isdir(output_dir):
         os.mkdir(output_dir)
+    results = []
     for i, cls in enumerate(labelmap):
         filename = get_voc_results_file_template(set_type, cls)
-        rec, prec, ap = voc_eval(
+        results.append(voc_eval(
            filename, annopath, imgsetpath.format(set_type), cls, cachedir,
-           ovthresh=0.5, use_07_metric=use_07_metric)
+           ovthresh=0.5, use_07_metric=use_07_metric, store=store))
+    print_results(results, output_dir)
+
+
+def do_memory_eval(columns, dataset, output_dir='output', use_07=True):
+    """Same evaluation as do_python_eval, straight from the detection columns
+    and the dataset's AnnotationStore without the results files"""
+    use_07_metric = use_07
+    print('VOC07 metric? ' + ('Yes' if use_07_metric else 'No'))
+    if not os.path.isdir(output_dir):
+        os.mkdir(output_dir)
+    gt = ground_truth_from_store(dataset.store, list(labelmap))
+    results = evaluate_columns(columns, gt, len(dataset), len(labelmap) + 1,
+                               ovthresh=0.5, use_07_metric=use_07_metric,
+                               processes=args.eval_processes)
+    print_results(results, output_dir)
+
+
+def print_results(results, output_dir):
+    """Print and save the (rec, prec, ap) of every class"""
+    aps = []
+    for cls, (rec, prec, ap) in zip(labelmap, results):
         aps += [ap]
         print('AP for {} = {:.4f}'.format(cls, ap))
         with open(os.path.join(output_dir, cls + '_pr.pkl'), 'wb') as f:
@@ -184,47 +251,14 @@ def do_python_eval(output_dir='output', use_07=True):
     print('--------------------------------------------------------------')
 
 
-def voc_ap(rec, prec, use_07_metric=True):
-    """ ap = voc_ap(rec, prec, [use_07_metric])
-    Compute VOC AP given precision and recall.
-    If use_07_metric is true, uses the
-    VOC 07 11 point method (default:True).
-    """
-    if use_07_metric:
-        # 11 point metric
-        ap = 0.
-        for t in np.arange(0., 1.1, 0.1):
-            if np.sum(rec >= t) == 0:
-                p = 0
-            else:
-                p = np.max(prec[rec >= t])
-            ap = ap + p / 11.
-    else:
-        # correct AP calculation
-        # first append sentinel values at the end
-        mrec = np.concatenate(([0.], rec, [1.]))
-        mpre = np.concatenate(([0.], prec, [0.]))
-
-        # compute the precision envelope
-        for i in range(mpre.size - 1, 0, -1):
-            mpre[i - 1] = np.maximum(mpre[i - 1], mpre[i])
-
-        # to calculate area under PR curve, look for points
-        # where X axis (recall) changes value
-        i = np.where(mrec[1:] != mrec[:-1])[0]
-
-        # and sum (\Delta recall) * prec
-        ap = np.sum((mrec[i + 1] - mrec[i]) * mpre[i + 1])
-    return ap
-
-
 def voc_eval(detpath,
              annopath,
              imagesetfile,
              classname,
              cachedir,
              ovthresh=0.5,
-             use_07_metric=True):
+             use_07_metric=True,
+             store=None):
     """rec, prec, ap = voc_eval(detpath,
                            annopath,
                            imagesetfile,
@@ -242,6 +276,8 @@ cachedir: Directory for caching the annotations
 [ovthresh]: Overlap threshold (default = 0.5)
 [use_07_metric]: Whether to use VOC07's 11 point AP computation
    (default True)
+[store]: AnnotationStore of the image set, read instead of the xml
+   annotations and the annots.pkl cache (default None)
 """
 # assumes detections are in detpath.format(classname)
 # assumes annotations are in annopath.format(imagename)
@@ -255,7 +291,9 @@ cachedir: Directory for caching the annotations
     with open(imagesetfile, 'r') as f:
         lines = f.readlines()
     imagenames = [x.strip() for x in lines]
-    if not os.path.isfile(cachefile):
+    if store is not None:
+        recs = store_recs(store, imagenames)
+    elif not os.path.isfile(cachefile):
         # load annots
         recs = {}
         for i, imagename in enumerate(imagenames):
@@ -354,63 +392,102 @@ cachedir: Directory for caching the annotations
     return rec, prec, ap
 
 
+class PulledItems(data.Dataset):
+    """pull_item() of the dataset in the DataLoader workers: (image, height, width)"""
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        im, _, h, w = self.dataset.pull_item(index)
+        return im, h, w
+
+
+def eval_collate(batch):
+    """Stack the images of a batch, return the (height, width) of every image"""
+    return (torch.stack([sample[0] for sample in batch], 0),
+            [(sample[1], sample[2]) for sample in batch])
+
+
 def test_net(net, dataset):
     num_images = len(dataset)
-    # all detections are collected into:
-    #    all_boxes[cls][image] = N x 5 array of detections in
-    #    (x1, y1, x2, y2, score)
-    all_boxes = [[[] for _ in range(num_images)]
-                 for _ in range(len(labelmap)+1)]
-
+    detector = net
+    if args.cpu_profile and not args.cuda:
+        detector = CPUInference(net, load_profile(args.cpu_profile))
+        if args.raw_outputs and detector.profile['freeze']:
+            raise ValueError('--raw_outputs needs the Detect layer of an '
+                             'unfrozen model, set "freeze": false')
     # timers
     _t = {'im_detect': Timer(), 'misc': Timer()}
     output_dir = get_output_dir(args.save_folder, set_type)
-    det_file = os.path.join(output_dir, 'detections.pkl')
 
-    for i in range(num_images):
-        im, gt, h, w = dataset.pull_item(i)
-
-        x = Variable(im.unsqueeze(0))
+    # all detections are streamed in chunks into a columnar store:
+    #    image, class, score, (x1, y1, x2, y2)
+    # an interrupted run with the same model and images resumes after the
+    # last complete chunk; the raw outputs cache needs every image
+    store = DetectionStore(os.path.join(output_dir, 'detections'), num_images,
+                           args.chunk_images,
+                           resume=args.resume and not args.raw_outputs,
+                           ids=dataset.ids, num_classes=len(labelmap) + 1,
+                           size=args.size,
+                           trained_model=os.path.abspath(args.trained_model),
+                           model_mtime=os.path.getmtime(args.trained_model))
+    if store.completed:
+        print('Resuming after {:d}/{:d} images'.format(store.completed, num_images))
+
+    # images are loaded and transformed in the workers, batches go through
+    # the network and the batched Detect layer at once
+    data_loader = data.DataLoader(
+        data.Subset(PulledItems(dataset), range(store.completed, num_images)),
+        args.batch_size, num_workers=args.num_workers, shuffle=False,
+        collate_fn=eval_collate)
+    raw = None
+    if args.raw_outputs:
+        # the inputs of the Detect layer are the raw (loc, softmax conf)
+        # outputs of the network
+        raw = RawOutputWriter(args.raw_outputs, num_images, net.priors,
+                              len(labelmap) + 1, dtype=args.raw_dtype)
+        hook = net.detect.register_forward_pre_hook(
+            lambda module, inputs: raw.append(inputs[0], inputs[1]))
+    i = store.completed
+    image_sizes = []
+    for images, sizes in data_loader:
         if args.cuda:
-            x = x.cuda()
+            images = images.cuda()
         _t['im_detect'].tic()
         # detect
         with torch.no_grad():
-            # ssd.py forward方法上添加@staticmethod注解，即可使用方法民静态调用：detections = net.forward(net, x)
-            detections = net(x).data
+            detections = detector(images).cpu().numpy()
         detect_time = _t['im_detect'].toc(average=False)
 
-        # skip j = 0, because it's the background class
-        for j in range(1, detections.size(1)):
-            dets = detections[0, j, :]
-            mask = dets[:, 0].gt(0.).expand(5, dets.size(0)).t()
-            dets = torch.masked_select(dets, mask).view(-1, 5)
-            if dets.size(0) == 0:
-                continue
-            boxes = dets[:, 1:]
-            boxes[:, 0] *= w
-            boxes[:, 2] *= w
-            boxes[:, 1] *= h
-            boxes[:, 3] *= h
-            scores = dets[:, 0].cpu().numpy()
-            cls_dets = np.hstack((boxes.cpu().numpy(),
-                                  scores[:, np.newaxis])).astype(np.float32,
-                                                                 copy=False)
-            all_boxes[j][i] = cls_dets
-
-        print('im_detect: {:d}/{:d} {:.3f}s'.format(i + 1,
-                                                    num_images, detect_time))
-
-    with open(det_file, 'wb') as f:
-        pickle.dump(all_boxes, f, pickle.HIGHEST_PROTOCOL)
+        store.append(detection_columns(detections, sizes, i), len(sizes))
+        image_sizes += sizes
+        i += len(sizes)
+
+        print('im_detect: {:d}/{:d} {:.3f}s'.format(i, num_images, detect_time))
+
+    store.flush()
+    if raw is not None:
+        hook.remove()
+        raw.close(image_sizes,
+                  ids=dataset.ids, voc_root=args.voc_root,
+                  image_sets=[('2007', set_type)],
+                  variance=net.detect.variance)
+        print('Saved raw outputs to {:s}'.format(args.raw_outputs))
 
     print('Evaluating detections')
-    evaluate_detections(all_boxes, output_dir, dataset)
+    evaluate_detections(store.columns(), output_dir, dataset)
 
 
-def evaluate_detections(box_list, output_dir, dataset):
-    write_voc_results_file(box_list, dataset)
-    do_python_eval(output_dir)
+def evaluate_detections(columns, output_dir, dataset):
+    if args.results_files or dataset.store is None:
+        write_voc_results_file(all_boxes_from_columns(
+            columns, len(dataset), len(labelmap) + 1), dataset)
+        do_python_eval(output_dir, store=dataset.store)
+    else:
+        do_memory_eval(columns, dataset, output_dir)
 
 
 if __name__ == '__main__':
@@ -418,13 +495,13 @@ if __name__ == '__main__':
     warnings.filterwarnings("ignore")
     # load net
     num_classes = len(labelmap) + 1                      # +1 for background
-    net = build_ssd('test', 300, num_classes)            # initialize SSD
-    net.load_state_dict(torch.load(args.trained_model))
+    net = build_ssd('test', args.size, num_classes)      # initialize SSD
+    net.load_state_dict(model_state(torch.load(args.trained_model)))
     net.eval()
     print('Finished loading model!')
     # load data
     dataset = VOCDetection(args.voc_root, [('2007', set_type)],
-                           BaseTransform(300, dataset_mean),
+                           BaseTransform(args.size, dataset_mean),
                            VOCAnnotationTransform())
     if args.cuda:
         net = net.cuda()
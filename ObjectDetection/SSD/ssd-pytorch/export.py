@@ -0,0 +1,57 @@
+"""Export a trained SSD to TorchScript and ONNX for CPU inference
+
+    python export.py --trained_model weights/ssd300_mAP_77.43_v2.pth --output_dir weights/export
+
+writes <output_dir>/ssd<size>.pt (torch.jit.load) and
+<output_dir>/ssd<size>.onnx (onnxruntime, needs the onnx package), ssd300.*
+for the default --size 300. Both take a [batch,3,size,size] batch prepared
+like BaseTransform and return the [batch,21,top_k,5] detections of Detect,
+see utils/export.py.
+"""
+from __future__ import print_function
+
+import os
+import argparse
+import warnings
+
+import torch
+from data import VOC_CLASSES as labelmap
+from ssd import build_ssd
+from utils.checkpoint import model_state
+from utils.export import export_torchscript, export_onnx
+
+
+parser = argparse.ArgumentParser(
+    description='Single Shot MultiBox Detector TorchScript/ONNX export')
+parser.add_argument('--trained_model',
+                    default='weights/ssd300_mAP_77.43_v2.pth', type=str,
+                    help='Trained state_dict file path to open')
+parser.add_argument('--size', default=300, type=int, choices=[300, 512],
+                    help='Input size of the trained model: SSD300 or SSD512')
+parser.add_argument('--output_dir', default='weights/export', type=str,
+                    help='Directory to save the exported models in')
+parser.add_argument('--formats', default=['torchscript', 'onnx'], nargs='+',
+                    choices=['torchscript', 'onnx'],
+                    help='Formats to export')
+parser.add_argument('--opset', default=17, type=int,
+                    help='ONNX opset version')
+args = parser.parse_args()
+
+
+if __name__ == '__main__':
+    # 忽略打印警告
+    warnings.filterwarnings("ignore")
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    net = build_ssd('test', args.size, len(labelmap) + 1)
+    net.load_state_dict(model_state(torch.load(args.trained_model, map_location='cpu')))
+    net.eval()
+    print('Finished loading model!')
+    if 'torchscript' in args.formats:
+        path = os.path.join(args.output_dir, 'ssd{:d}.pt'.format(args.size))
+        export_torchscript(net, path)
+        print('Saved TorchScript model to {:s}'.format(path))
+    if 'onnx' in args.formats:
+        path = os.path.join(args.output_dir, 'ssd{:d}.onnx'.format(args.size))
+        export_onnx(net, path, opset_version=args.opset)
+        print('Saved ONNX model to {:s}'.format(path))
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import torch
+from torchvision.ops import batched_nms
 
 
 def point_form(boxes):
@@ -68,6 +69,95 @@ def jaccard(box_a, box_b):
     return inter / union  # [A,B]
 
 
+def batch_jaccard(box_a, box_b):
+    """Compute the jaccard overlap between a padded batch of ground truth boxes
+    and the prior boxes in one call. Same arithmetic as jaccard(), broadcast
+    over the batch dimension.
+    Args:
+        box_a: (tensor) Ground truth bounding boxes, Shape: [batch,max_objs,4]
+        box_b: (tensor) Prior boxes in point form, Shape: [num_priors,4]
+    Return:
+        jaccard overlap: (tensor) Shape: [batch,max_objs,num_priors]
+    """
+    # work on each coordinate separately so every intermediate is a plain
+    # [B,A,P] tensor instead of a strided [B,A,P,2] one
+    a_x1, a_y1, a_x2, a_y2 = box_a.permute(2, 0, 1).contiguous().unsqueeze(3)
+    b_x1, b_y1, b_x2, b_y2 = box_b.t().contiguous()
+    inter_w = torch.clamp(torch.min(a_x2, b_x2) - torch.max(a_x1, b_x1), min=0)
+    inter_h = torch.clamp(torch.min(a_y2, b_y2) - torch.max(a_y1, b_y1), min=0)
+    inter = inter_w * inter_h  # [B,A,P]
+    area_a = (a_x2 - a_x1) * (a_y2 - a_y1)  # [B,A,1]
+    area_b = (b_x2 - b_x1) * (b_y2 - b_y1)  # [P]
+    union = area_a + area_b - inter
+    return inter / union  # [B,A,P]
+
+
+def pad_targets(targets, device=None):
+    """Pad a list of per-image targets into one [batch,max_objs,5] tensor.
+    Args:
+        targets: (list of tensors) Shape: [num_objs,5] per image
+            (last idx is the label).
+        device: device the padded tensor is created on
+    Return:
+        padded targets (tensor) Shape: [batch,max_objs,5] (zero padding)
+        num_objs (tensor) number of valid objects per image, Shape: [batch]
+    """
+    num_objs = torch.tensor([t.size(0) for t in targets], dtype=torch.long,
+                            device=device)
+    max_objs = max(int(num_objs.max()), 1) if len(targets) else 1
+    padded = torch.zeros(len(targets), max_objs, 5, device=device)
+    for idx, t in enumerate(targets):
+        padded[idx, :t.size(0)] = t.to(device=device, dtype=padded.dtype)
+    return padded, num_objs
+
+
+def match_batch(threshold, truths, priors, variances, labels, num_objs):
+    """Batched version of match(): match every prior box of every image in the
+    batch with the ground truth box of the highest jaccard overlap and encode
+    the location targets, without a Python loop over images or objects.
+    Gives exactly the same targets as calling match() once per image.
+    Args:
+        threshold: (float) The overlap threshold used when mathing boxes.
+        truths: (tensor) Padded ground truth boxes, Shape: [batch,max_objs,4].
+        priors: (tensor) Prior boxes from priorbox layers, Shape: [n_priors,4].
+        variances: (tensor) Variances corresponding to each prior coord,
+            Shape: [num_priors, 4].
+        labels: (tensor) Padded class labels, Shape: [batch,max_objs].
+        num_objs: (tensor) Number of valid objects per image, Shape: [batch].
+    Return:
+        loc_t: (tensor) encoded location targets, Shape: [batch,num_priors,4]
+        conf_t: (tensor) matched class labels, Shape: [batch,num_priors]
+    """
+    num, max_objs = truths.size(0), truths.size(1)
+    obj_idx = torch.arange(max_objs, device=truths.device)
+    valid = obj_idx.unsqueeze(0) < num_objs.unsqueeze(1)  # [B,A]
+    # jaccard index of the valid objects only, scattered into [B,A,P];
+    # padded objects get -1 so they can never be the best truth of a prior
+    overlaps = truths.new_full((num, max_objs, priors.size(0)), -1)
+    overlaps[valid] = batch_jaccard(truths[valid].unsqueeze(0),
+                                    point_form(priors))[0]
+    # (Bipartite Matching)
+    # [B,num_objects] best prior for each ground truth
+    best_prior_overlap, best_prior_idx = overlaps.max(2)
+    # [B,num_priors] best ground truth for each prior
+    best_truth_overlap, best_truth_idx = overlaps.max(1)
+    # ensure every gt matches with its prior of max overlap; when several
+    # objects share a best prior the last one wins, as in match()
+    forced = torch.full_like(best_truth_idx, -1)
+    forced.scatter_reduce_(1, best_prior_idx,
+                           torch.where(valid, obj_idx, -1), reduce='amax')
+    is_forced = forced >= 0
+    best_truth_idx = torch.where(is_forced, forced, best_truth_idx)
+    best_truth_overlap = best_truth_overlap.masked_fill(is_forced, 2)
+
+    matches = truths.gather(
+        1, best_truth_idx.unsqueeze(2).expand(num, -1, 4))  # [B,P,4]
+    conf = labels.gather(1, best_truth_idx).long() + 1      # [B,P]
+    conf[best_truth_overlap < threshold] = 0  # label as background
+    loc = encode(matches, priors, variances)
+    return loc, conf
+
+
 def match(threshold, truths, priors, variances, labels, loc_t, conf_t, idx):
     """Match each prior box with the ground truth box of the highest jaccard
     overlap, encode the bounding boxes, then return the matched indices
@@ -117,23 +207,23 @@ def encode(matched, priors, variances):
     we have matched (based on jaccard overlap) with the prior boxes.
     Args:
         matched: (tensor) Coords of ground truth for each prior in point-form
-            Shape: [num_priors, 4].
+            Shape: [num_priors, 4] or [batch,num_priors,4].
         priors: (tensor) Prior boxes in center-offset form
             Shape: [num_priors,4].
         variances: (list[float]) Variances of priorboxes
     Return:
-        encoded boxes (tensor), Shape: [num_priors, 4]
+        encoded boxes (tensor), Shape: [num_priors, 4] or [batch,num_priors,4]
     """
 
     # dist b/t match center and prior's center
-    g_cxcy = (matched[:, :2] + matched[:, 2:])/2 - priors[:, :2]
+    g_cxcy = (matched[..., :2] + matched[..., 2:])/2 - priors[:, :2]
     # encode variance
     g_cxcy /= (variances[0] * priors[:, 2:])
     # match wh / prior wh
-    g_wh = (matched[:, 2:] - matched[:, :2]) / priors[:, 2:]
+    g_wh = (matched[..., 2:] - matched[..., :2]) / priors[:, 2:]
     g_wh = torch.log(g_wh) / variances[1]
     # return target for smooth_l1_loss
-    return torch.cat([g_cxcy, g_wh], 1)  # [num_priors,4]
+    return torch.cat([g_cxcy, g_wh], -1)  # [num_priors,4]
 
 
 # Adapted from https://github.com/Hakuyume/chainer-ssd
@@ -142,7 +232,7 @@ def decode(loc, priors, variances):
     the encoding we did for offset regression at train time.
     Args:
         loc (tensor): location predictions for loc layers,
-            Shape: [num_priors,4]
+            Shape: [num_priors,4] or [batch,num_priors,4]
         priors (tensor): Prior boxes in center-offset form.
             Shape: [num_priors,4].
         variances: (list[float]) Variances of priorboxes
@@ -151,10 +241,10 @@ def decode(loc, priors, variances):
     """
 
     boxes = torch.cat((
-        priors[:, :2] + loc[:, :2] * variances[0] * priors[:, 2:],
-        priors[:, 2:] * torch.exp(loc[:, 2:] * variances[1])), 1)
-    boxes[:, :2] -= boxes[:, 2:] / 2
-    boxes[:, 2:] += boxes[:, :2]
+        priors[:, :2] + loc[..., :2] * variances[0] * priors[:, 2:],
+        priors[:, 2:] * torch.exp(loc[..., 2:] * variances[1])), -1)
+    boxes[..., :2] -= boxes[..., 2:] / 2
+    boxes[..., 2:] += boxes[..., :2]
     return boxes
 
 
@@ -169,6 +259,33 @@ def log_sum_exp(x):
     return torch.log(torch.sum(torch.exp(x-x_max), 1, keepdim=True)) + x_max
 
 
+def hard_negative_mask(loss_c, num_neg):
+    """Select the num_neg highest-loss priors of every image in one pass.
+    Same selection as ranking with a descending stable sort followed by a
+    sort of the indices (idx_rank < num_neg), but only the top max(num_neg)
+    losses are found with topk; ties at the k-th loss go to the lower prior
+    index, as in the stable sort.
+    Args:
+        loss_c: (tensor) per prior confidence loss, positives already set to 0,
+            Shape: [batch,num_priors].
+        num_neg: (tensor) number of negatives to keep per image, Shape: [batch,1].
+    Return:
+        neg: (tensor) bool mask of the selected negatives, Shape: [batch,num_priors]
+    """
+    max_neg = int(num_neg.max())
+    if max_neg == 0:
+        return torch.zeros_like(loss_c, dtype=torch.bool)
+    top_loss, _ = loss_c.topk(max_neg, 1)
+    # k-th highest loss of every image, with its own k = num_neg
+    kth_loss = top_loss.gather(1, (num_neg - 1).clamp(min=0))
+    neg = loss_c > kth_loss
+    # fill the remaining slots with ties at the k-th loss, lowest index first
+    ties = loss_c == kth_loss
+    remaining = num_neg - neg.sum(1, keepdim=True)
+    neg |= ties & (ties.cumsum(1) <= remaining)
+    return neg & (num_neg > 0)
+
+
 # Original author: Francisco Massa:
 # https://github.com/fmassa/object-detection.torch
 # Ported to PyTorch by Max deGroot (02/01/2017)
@@ -237,3 +354,141 @@ def nms(boxes, scores, overlap=0.5, top_k=200):
         # keep only elements with an IoU <= overlap
         idx = idx[IoU.le(overlap)]
     return keep, count
+
+
+# above this many candidates per class the greedy kernel of
+# torchvision.ops.batched_nms is faster than the [K,K] IoU matrix
+NMS_MATRIX_MAX = 64
+
+
+def nms_batch(boxes, scores, conf_thresh, overlap=0.5, top_k=200):
+    """Batched multi-class version of nms(): suppress the boxes of every
+    class of every image at once, without a Python loop over images, classes
+    or kept boxes. Like nms() only the top_k highest scoring boxes above
+    conf_thresh are considered per class, and a box is suppressed when its
+    IoU with a kept, higher scoring box of the same class exceeds overlap.
+    Args:
+        boxes: (tensor) Decoded boxes, Shape: [batch,num_priors,4].
+        scores: (tensor) Class scores, Shape: [batch,num_priors,num_classes].
+        conf_thresh: (float) Minimum score of a candidate box.
+        overlap: (float) The overlap thresh for suppressing unnecessary boxes.
+        top_k: (int) The Maximum number of box preds to consider per class.
+    Return:
+        (tensor) Shape: [batch,num_classes,top_k,5], the kept (score, box)
+        of every class in descending score order followed by zeros.
+    """
+    num, num_priors, num_classes = scores.size()
+    output = scores.new_zeros(num, num_classes, top_k, 5)
+    top_scores, top_idx = scores.transpose(2, 1).topk(min(top_k, num_priors), 2)
+    valid = top_scores > conf_thresh
+    # only as many columns as the class with the most candidates
+    k = int(valid.sum(2).max()) if valid.numel() else 0
+    if k == 0:
+        return output
+    top_scores, top_idx, valid = \
+        top_scores[:, :, :k], top_idx[:, :, :k], valid[:, :, :k]
+    top_boxes = boxes.gather(1, top_idx.reshape(num, -1, 1).expand(-1, -1, 4))
+    top_boxes = top_boxes.view(num, num_classes, k, 4)
+
+    if k > NMS_MATRIX_MAX:
+        keep = _nms_offset(top_boxes, top_scores, valid, overlap)
+    else:
+        keep = _nms_matrix(top_boxes, valid, overlap)
+
+    # move the kept boxes to the front, still in descending score order
+    _, order = (~keep).to(torch.uint8).sort(dim=2, stable=True)
+    dets = torch.cat((top_scores.unsqueeze(3), top_boxes), 3)
+    dets = dets * keep.unsqueeze(3).to(dets.dtype)
+    output[:, :, :k] = dets.gather(2, order.unsqueeze(3).expand(-1, -1, -1, 5))
+    return output
+
+
+def _nms_matrix(boxes, valid, overlap):
+    """Greedy suppression from the IoU matrix of every (image, class).
+    boxes: [batch,num_classes,K,4] sorted by descending score,
+    valid: [batch,num_classes,K]. Returns the keep mask [batch,num_classes,K].
+    """
+    x1, y1, x2, y2 = boxes.unbind(3)
+    area = (x2 - x1) * (y2 - y1)
+    w = (torch.min(x2.unsqueeze(3), x2.unsqueeze(2)) -
+         torch.max(x1.unsqueeze(3), x1.unsqueeze(2))).clamp(min=0)
+    h = (torch.min(y2.unsqueeze(3), y2.unsqueeze(2)) -
+         torch.max(y1.unsqueeze(3), y1.unsqueeze(2))).clamp(min=0)
+    inter = w * h
+    iou = inter / (area.unsqueeze(3) + area.unsqueeze(2) - inter)
+    # box j can only be suppressed by a valid box i ranked before it
+    k = boxes.size(2)
+    over = (iou > overlap) & torch.ones(k, k, dtype=torch.bool,
+                                        device=boxes.device).triu(1)
+    over = (over & valid.unsqueeze(3)).to(boxes.dtype)
+    # keep_j = valid_j and no kept i < j overlaps j; iterating from all valid
+    # reaches the greedy result after at most (length of the longest
+    # suppression chain) steps
+    keep = valid
+    for _ in range(k):
+        suppressed = torch.matmul(keep.unsqueeze(2).to(boxes.dtype), over)
+        new_keep = valid & (suppressed.squeeze(2) == 0)
+        if torch.equal(new_keep, keep):
+            break
+        keep = new_keep
+    return keep
+
+
+def _nms_offset(boxes, scores, valid, overlap):
+    """Greedy suppression of all (image, class) groups in one call of
+    torchvision's nms kernel, which offsets the boxes of every group so that
+    boxes of different groups never overlap."""
+    num, num_classes, k = scores.size()
+    idx = valid.reshape(-1).nonzero().squeeze(1)
+    group = torch.arange(num * num_classes, device=boxes.device)
+    group = group.view(-1, 1).expand(-1, k).reshape(-1)
+    kept = batched_nms(boxes.reshape(-1, 4)[idx], scores.reshape(-1)[idx],
+                       group[idx], overlap)
+    keep = torch.zeros(num * num_classes * k, dtype=torch.bool,
+                       device=boxes.device)
+    keep[idx[kept]] = True
+    return keep.view(num, num_classes, k)
+
+
+def nms_batch_export(boxes, scores, conf_thresh, overlap=0.5, top_k=200):
+    """Graph friendly nms_batch(): the same kept boxes from tensor ops only,
+    so the post-processing can be traced into TorchScript and exported to
+    ONNX. Unlike nms_batch() nothing depends on a value read back from a
+    tensor: all top_k columns are kept instead of trimming to the longest
+    class, greedy suppression walks the top_k columns of the IoU matrix
+    (unrolled when traced) instead of iterating until nothing changes, and
+    the kept boxes are moved to the front with a scatter instead of a
+    stable sort.
+    Args and Return: see nms_batch().
+    """
+    num, num_priors, num_classes = scores.size()
+    k = min(top_k, num_priors)
+    top_scores, top_idx = scores.transpose(2, 1).topk(k, 2)
+    top_boxes = boxes.gather(1, top_idx.reshape(num, -1, 1).expand(-1, -1, 4))
+    top_boxes = top_boxes.view(num, num_classes, k, 4)
+    valid = top_scores > conf_thresh
+
+    x1, y1, x2, y2 = top_boxes.unbind(3)
+    area = (x2 - x1) * (y2 - y1)
+    w = (torch.min(x2.unsqueeze(3), x2.unsqueeze(2)) -
+         torch.max(x1.unsqueeze(3), x1.unsqueeze(2))).clamp(min=0)
+    h = (torch.min(y2.unsqueeze(3), y2.unsqueeze(2)) -
+         torch.max(y1.unsqueeze(3), y1.unsqueeze(2))).clamp(min=0)
+    inter = w * h
+    iou = inter / (area.unsqueeze(3) + area.unsqueeze(2) - inter)
+    # box j is kept if it is valid and no kept box ranked before it overlaps
+    over = (iou > overlap) & valid.unsqueeze(3)
+    keep = valid.clone()
+    for j in range(1, k):
+        keep[:, :, j] = keep[:, :, j] & \
+            ~(keep[:, :, :j] & over[:, :, :j, j]).any(2)
+
+    # kept box j goes to column (number of kept boxes before j), the others
+    # to a spare last column that is dropped
+    dets = torch.cat((top_scores.unsqueeze(3), top_boxes), 3)
+    pos = torch.where(keep, keep.long().cumsum(2) - 1,
+                      torch.full_like(top_idx, k))
+    output = scores.new_zeros(num, num_classes, top_k + 1, 5)
+    output.scatter_(2, pos.unsqueeze(3).expand(-1, -1, -1, 5),
+                    dets * keep.unsqueeze(3).to(dets.dtype))
+    return output[:, :, :top_k]
@@ -1,16 +1,19 @@
 import torch
-from torch.autograd import Function
-from ..box_utils import decode, nms
+import torch.nn as nn
+from ..box_utils import decode, nms_batch, nms_batch_export
 from data import voc as cfg
 
 
-class Detect(Function):
+class Detect(nn.Module):
     """At test time, Detect is the final layer of SSD.  Decode location preds,
     apply non-maximum suppression to location predictions based on conf
     scores and threshold to a top_k number of output predictions for both
     confidence score and locations.
+    While tracing (TorchScript / ONNX export) the suppression runs in
+    nms_batch_export(), which gives the same detections with tensor ops only.
     """
     def __init__(self, num_classes, bkg_label, top_k, conf_thresh, nms_thresh):
+        super(Detect, self).__init__()
         self.num_classes = num_classes
         self.background_label = bkg_label
         self.top_k = top_k
@@ -30,33 +33,27 @@ class Detect(Function):
                 Shape: [batch*num_priors,num_classes]
             prior_data: (tensor) Prior boxes and variances from priorbox layers
                 Shape: [1,num_priors,4]
+        Return:
+            (tensor) Shape: [batch,num_classes,top_k,5], per class the kept
+            (score, x1, y1, x2, y2) in descending score order, zero padded
         """
         num = loc_data.size(0)  # batch size
         num_priors = prior_data.size(0)
         output = torch.zeros(num, self.num_classes, self.top_k, 5)
-        conf_preds = conf_data.view(num, num_priors,
-                                    self.num_classes).transpose(2, 1)
+        conf_preds = conf_data.view(num, num_priors, self.num_classes)
 
-        # Decode predictions into bboxes.
-        for i in range(num):
-            decoded_boxes = decode(loc_data[i], prior_data, self.variance)
-            # For each class, perform nms
-            conf_scores = conf_preds[i].clone()
-
-            for cl in range(1, self.num_classes):
-                c_mask = conf_scores[cl].gt(self.conf_thresh)
-                scores = conf_scores[cl][c_mask]
-                if scores.size(0) == 0:
-                    continue
-                l_mask = c_mask.unsqueeze(1).expand_as(decoded_boxes)
-                boxes = decoded_boxes[l_mask].view(-1, 4)
-                # idx of highest scoring and non-overlapping boxes per class
-                ids, count = nms(boxes, scores, self.nms_thresh, self.top_k)
-                output[i, cl, :count] = \
-                    torch.cat((scores[ids[:count]].unsqueeze(1),
-                               boxes[ids[:count]]), 1)
-        flt = output.contiguous().view(num, -1, 5)
-        _, idx = flt[:, :, 0].sort(1, descending=True)
-        _, rank = idx.sort(1)
-        flt[(rank < self.top_k).unsqueeze(-1).expand_as(flt)].fill_(0)
+        # Decode predictions of the whole batch into bboxes.
+        decoded_boxes = decode(loc_data.view(num, num_priors, 4),
+                               prior_data, self.variance)
+        # nms of every class of every image at once, skipping the background
+        if torch.jit.is_tracing():
+            return torch.cat((
+                torch.zeros(num, 1, self.top_k, 5, dtype=conf_preds.dtype,
+                            device=conf_preds.device),
+                nms_batch_export(decoded_boxes, conf_preds[:, :, 1:],
+                                 self.conf_thresh, self.nms_thresh,
+                                 self.top_k)), 1)
+        output[:, 1:] = nms_batch(decoded_boxes, conf_preds[:, :, 1:],
+                                  self.conf_thresh, self.nms_thresh,
+                                  self.top_k).cpu()
         return output
@@ -1,20 +1,24 @@
 from __future__ import division
 from math import sqrt as sqrt
-from itertools import product as product
 import torch
 
+# cpu priors computed by PriorBox.forward(), keyed by the prior config
+_PRIOR_CACHE = {}
+
 
 class PriorBox(object):
     """Compute priorbox coordinates in center-offset form for each source
     feature map.
+    feature_maps: spatial size of every source feature map, e.g. from
+    SSD.feature_map_sizes(); defaults to cfg['feature_maps'].
     """
-    def __init__(self, cfg):
+    def __init__(self, cfg, feature_maps=None):
         super(PriorBox, self).__init__()
         self.image_size = cfg['min_dim']
         # number of priors for feature map location (either 4 or 6)
         self.num_priors = len(cfg['aspect_ratios'])
         self.variance = cfg['variance'] or [0.1]
-        self.feature_maps = cfg['feature_maps']
+        self.feature_maps = list(feature_maps or cfg['feature_maps'])
         self.min_sizes = cfg['min_sizes']
         self.max_sizes = cfg['max_sizes']
         self.steps = cfg['steps']
@@ -24,32 +28,56 @@ class PriorBox(object):
         for v in self.variance:
             if v <= 0:
                 raise ValueError('Variances must be greater than 0')
+        if len(self.feature_maps) != len(self.steps):
+            raise ValueError('{:d} feature maps but {:d} prior configs'.format(
+                len(self.feature_maps), len(self.steps)))
+
+    def _key(self):
+        return (self.image_size, tuple(self.feature_maps), tuple(self.min_sizes),
+                tuple(self.max_sizes), tuple(self.steps),
+                tuple(tuple(ar) for ar in self.aspect_ratios), self.clip)
 
     def forward(self):
+        """Return the [num_priors,4] priors (cx, cy, w, h) as a cpu float
+        tensor, whatever the default tensor type (train.py may set a cuda one
+        before the DataLoader workers fork). The priors of a config are
+        computed once and cached, every call returns a fresh copy of the
+        cached tensor.
+        """
+        key = self._key()
+        if key not in _PRIOR_CACHE:
+            _PRIOR_CACHE[key] = self._compute()
+        return _PRIOR_CACHE[key].clone()
+
+    def _compute(self):
         mean = []
         for k, f in enumerate(self.feature_maps):
-            for i, j in product(range(f), repeat=2):
-                f_k = self.image_size / self.steps[k]
-                # unit center x,y
-                cx = (j + 0.5) / f_k
-                cy = (i + 0.5) / f_k
-
-                # aspect_ratio: 1
-                # rel size: min_size
-                s_k = self.min_sizes[k]/self.image_size
-                mean += [cx, cy, s_k, s_k]
-
-                # aspect_ratio: 1
-                # rel size: sqrt(s_k * s_(k+1))
-                s_k_prime = sqrt(s_k * (self.max_sizes[k]/self.image_size))
-                mean += [cx, cy, s_k_prime, s_k_prime]
-
-                # rest of aspect ratios
-                for ar in self.aspect_ratios[k]:
-                    mean += [cx, cy, s_k*sqrt(ar), s_k/sqrt(ar)]
-                    mean += [cx, cy, s_k/sqrt(ar), s_k*sqrt(ar)]
+            f_k = self.image_size / self.steps[k]
+            # unit center x,y of every location, row by row
+            idx = torch.arange(f, dtype=torch.float64, device='cpu')
+            cy, cx = torch.meshgrid((idx + 0.5) / f_k, (idx + 0.5) / f_k,
+                                    indexing='ij')
+
+            # aspect_ratio: 1
+            # rel size: min_size
+            s_k = self.min_sizes[k]/self.image_size
+            sizes = [(s_k, s_k)]
+            # aspect_ratio: 1
+            # rel size: sqrt(s_k * s_(k+1))
+            s_k_prime = sqrt(s_k * (self.max_sizes[k]/self.image_size))
+            sizes += [(s_k_prime, s_k_prime)]
+            # rest of aspect ratios
+            for ar in self.aspect_ratios[k]:
+                sizes += [(s_k*sqrt(ar), s_k/sqrt(ar)), (s_k/sqrt(ar), s_k*sqrt(ar))]
+            sizes = torch.tensor(sizes, dtype=torch.float64, device='cpu')
+
+            # [f,f,num_sizes,4]: every size at every location
+            centers = torch.stack((cx, cy), -1).view(f, f, 1, 2)
+            mean.append(torch.cat((
+                centers.expand(f, f, len(sizes), 2),
+                sizes.expand(f, f, len(sizes), 2)), -1).view(-1, 4))
         # back to torch land
-        output = torch.Tensor(mean).view(-1, 4)
+        output = torch.cat(mean).float()
         if self.clip:
             output.clamp_(max=1, min=0)
         return output
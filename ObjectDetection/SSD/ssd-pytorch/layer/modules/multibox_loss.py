@@ -4,7 +4,7 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch.autograd import Variable
 from data import coco as cfg
-from ..box_utils import match, log_sum_exp
+from ..box_utils import match_batch, pad_targets, log_sum_exp, hard_negative_mask
 
 
 class MultiBoxLoss(nn.Module):
@@ -54,8 +54,14 @@ class MultiBoxLoss(nn.Module):
                 loc shape: torch.size(batch_size,num_priors,4)
                 priors shape: torch.size(num_priors,4)
 
-            targets (tensor): Ground truth boxes and labels for a batch,
-                shape: [batch_size,num_objs,5] (last idx is the label).
+            targets (list of tensors): Ground truth boxes and labels for a batch,
+                shape: [num_objs,5] per image (last idx is the label).
+                Or a tuple (loc_t, conf_t) of targets already matched in the
+                DataLoader workers (see utils.augmentations.MatchPriors),
+                shape: [batch_size,num_priors,4] and [batch_size,num_priors].
+                Or a tuple (targets, num_objs) of zero padded targets
+                (see data.batch_ring.RingLoader),
+                shape: [batch_size,max_objs,5] and [batch_size].
 
 
             MultiBoxLoss，用来求训练/测试时的损失，即通过输入图像 >> forward()方法来给出box回归损失和分类置信度损失：loss_l, loss_c
@@ -77,22 +83,23 @@ class MultiBoxLoss(nn.Module):
         num_priors = (priors.size(0))               # num_priors >> 8732
         num_classes = self.num_classes
 
-        # match priors (default boxes) and ground truth boxes
-        loc_t = torch.Tensor(num, num_priors, 4)
-        conf_t = torch.LongTensor(num, num_priors)
-        for idx in range(num):
-            truths = targets[idx][:, :-1].data
-            labels = targets[idx][:, -1].data
-            defaults = priors.data
-            match(self.threshold, truths, defaults, self.variance, labels,
-                  loc_t, conf_t, idx)
-        if self.use_gpu:
-            loc_t = loc_t.cuda()
-            conf_t = conf_t.cuda()
-
-        # wrap targets
-        loc_t = Variable(loc_t, requires_grad=False)
-        conf_t = Variable(conf_t, requires_grad=False)
+        if isinstance(targets, tuple) and targets[1].dim() == 2:
+            # targets were matched and encoded in the DataLoader workers
+            loc_t, conf_t = [t.to(loc_data.device) for t in targets]
+        else:
+            # match priors (default boxes) and ground truth boxes of the whole
+            # batch at once, on the same device as the predictions
+            if isinstance(targets, tuple):
+                # padded to the batch's largest image on the cpu (padded_collate,
+                # RingLoader): trimming here would sync with the device
+                truths, num_objs = [t.to(loc_data.device) for t in targets]
+            else:
+                truths, num_objs = pad_targets([t.data for t in targets],
+                                               loc_data.device)
+            loc_t, conf_t = match_batch(self.threshold, truths[:, :, :-1],
+                                        priors.data.to(loc_data.device),
+                                        self.variance, truths[:, :, -1],
+                                        num_objs)
 
         pos = conf_t > 0
         num_pos = pos.sum(dim=1, keepdim=True)
@@ -110,12 +117,12 @@ class MultiBoxLoss(nn.Module):
 
         # Hard Negative Mining
         loss_c = loss_c.view(num, -1)
+        loss_c = loss_c.detach()
         loss_c[pos] = 0  # filter out pos boxes for now
-        _, loss_idx = loss_c.sort(1, descending=True)
-        _, idx_rank = loss_idx.sort(1)
         num_pos = pos.long().sum(1, keepdim=True)
         num_neg = torch.clamp(self.negpos_ratio*num_pos, max=pos.size(1)-1)
-        neg = idx_rank < num_neg.expand_as(idx_rank)
+        # top num_neg losses per image via topk instead of sorting twice
+        neg = hard_negative_mask(loss_c, num_neg)
 
         # Confidence Loss Including Positive and Negative Examples
         pos_idx = pos.unsqueeze(2).expand_as(conf_data)
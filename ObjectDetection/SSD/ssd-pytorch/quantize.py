@@ -0,0 +1,168 @@
+"""Post-training static INT8 quantization of SSD300/SSD512 for CPU inference
+
+Calibrates the activation ranges on --num_calibration VOC images, drawn at
+random from the calibration set (--calibration_seed) and prepared by
+BaseTransform, saves the quantized checkpoint (load it with
+utils.quantization.load_quantized_ssd) and reports the CPU latency, model
+size and VOC07 mAP of the INT8 model against FP32.
+
+    python quantize.py --trained_model weights/ssd300_mAP_77.43_v2.pth --num_calibration 300
+"""
+from __future__ import print_function
+
+import io
+import time
+import argparse
+import warnings
+
+import numpy as np
+import torch
+import torch.utils.data as data
+from data import VOC_ROOT, VOCDetection, BaseTransform
+from data import VOC_CLASSES as labelmap
+from ssd import build_ssd
+from utils.checkpoint import model_state
+from utils.quantization import quantize_ssd
+from utils.voc_eval import add_detections, ground_truth_from_store, \
+    evaluate_all_boxes
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+parser = argparse.ArgumentParser(
+    description='Single Shot MultiBox Detector INT8 quantization')
+parser.add_argument('--trained_model',
+                    default='weights/ssd300_mAP_77.43_v2.pth', type=str,
+                    help='Trained state_dict file path to open')
+parser.add_argument('--size', default=300, type=int, choices=[300, 512],
+                    help='Input size of the trained model: SSD300 or SSD512')
+parser.add_argument('--save_path', default=None, type=str,
+                    help='File path to save the quantized state_dict, '
+                         'default weights/ssd<size>_int8.pth')
+parser.add_argument('--voc_root', default=VOC_ROOT,
+                    help='Location of VOC root directory')
+parser.add_argument('--calibration_set', default=['2007', 'trainval'], nargs=2,
+                    help='VOC year and image set the calibration images come from')
+parser.add_argument('--num_calibration', default=300, type=int,
+                    help='Number of calibration images')
+parser.add_argument('--calibration_seed', default=0, type=int,
+                    help='Seed of the random calibration subset')
+parser.add_argument('--backend', default='x86', type=str,
+                    choices=['x86', 'fbgemm', 'qnnpack', 'onednn'],
+                    help='Quantized engine')
+parser.add_argument('--eval', default=True, type=str2bool,
+                    help='Compare the VOC07 test mAP of FP32 and INT8')
+parser.add_argument('--eval_images', default=None, type=int,
+                    help='Evaluate on the first N test images only')
+parser.add_argument('--batch_size', default=8, type=int,
+                    help='Batch size for calibration and evaluation')
+parser.add_argument('--num_workers', default=4, type=int,
+                    help='Number of workers used in dataloading')
+parser.add_argument('--latency_iters', default=10, type=int,
+                    help='Timed batch 1 forward passes')
+args = parser.parse_args()
+
+dataset_mean = (104, 117, 123)
+
+
+class Images(data.Dataset):
+    """BaseTransform-ed images and (height, width) of the first `num` items,
+    or of `num` items drawn at random (fixed `seed`) with random=True"""
+
+    def __init__(self, dataset, num=None, random=False, seed=0):
+        self.dataset = dataset
+        self.num = len(dataset) if num is None else min(num, len(dataset))
+        if random:
+            generator = torch.Generator().manual_seed(seed)
+            self.indices = torch.randperm(len(dataset),
+                                          generator=generator)[:self.num].tolist()
+        else:
+            self.indices = list(range(self.num))
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, index):
+        im, _, h, w = self.dataset.pull_item(self.indices[index])
+        return im, h, w
+
+
+def images_collate(batch):
+    return (torch.stack([sample[0] for sample in batch], 0),
+            [(sample[1], sample[2]) for sample in batch])
+
+
+def image_batches(dataset, num=None, random=False):
+    """Batches of the first `num` images of dataset, or of a random subset
+    of `num` images (--calibration_seed) with random=True"""
+    return data.DataLoader(Images(dataset, num, random, args.calibration_seed),
+                           args.batch_size, num_workers=args.num_workers,
+                           collate_fn=images_collate)
+
+
+def model_size(net):
+    """Size of the serialized state_dict in MB"""
+    buffer = io.BytesIO()
+    torch.save(net.state_dict(), buffer)
+    return buffer.tell() / 1024. / 1024.
+
+
+def latency(net):
+    """Mean batch 1 forward time in ms"""
+    x = torch.randn(1, 3, args.size, args.size)
+    with torch.no_grad():
+        net(x)
+        start = time.time()
+        for _ in range(args.latency_iters):
+            net(x)
+    return (time.time() - start) / args.latency_iters * 1000
+
+
+def voc07_map(net, dataset):
+    """VOC07 11 point mAP of `net` on (the first --eval_images of) dataset"""
+    num_images = len(Images(dataset, args.eval_images))
+    all_boxes = [[[] for _ in range(num_images)]
+                 for _ in range(len(labelmap) + 1)]
+    i = 0
+    with torch.no_grad():
+        for images, sizes in image_batches(dataset, args.eval_images):
+            add_detections(all_boxes, net(images).numpy(), sizes, i)
+            i += len(sizes)
+    gt = ground_truth_from_store(dataset.store, list(labelmap))
+    keep = gt['image'] < num_images
+    results = evaluate_all_boxes(all_boxes, {k: v[keep] for k, v in gt.items()})
+    return np.mean([ap for rec, prec, ap in results])
+
+
+if __name__ == '__main__':
+    # 忽略打印警告
+    warnings.filterwarnings("ignore")
+    net = build_ssd('test', args.size, len(labelmap) + 1)
+    net.load_state_dict(model_state(torch.load(args.trained_model, map_location='cpu')))
+    net.eval()
+    print('Finished loading model!')
+
+    transform = BaseTransform(args.size, dataset_mean)
+    calibration_set = VOCDetection(args.voc_root, [tuple(args.calibration_set)],
+                                   transform)
+    print('Calibrating on {:d} images'.format(
+        min(args.num_calibration, len(calibration_set))))
+    qnet = quantize_ssd(net, (images for images, _ in image_batches(
+        calibration_set, args.num_calibration, random=True)), args.backend)
+    save_path = args.save_path or 'weights/ssd{:d}_int8.pth'.format(args.size)
+    torch.save(qnet.state_dict(), save_path)
+    print('Saved quantized model to {:s}'.format(save_path))
+
+    results = {'fp32': [latency(net), model_size(net)],
+               'int8': [latency(qnet), model_size(qnet)]}
+    if args.eval:
+        test_set = VOCDetection(args.voc_root, [('2007', 'test')], transform)
+        for name, model in (('fp32', net), ('int8', qnet)):
+            results[name].append(voc07_map(model, test_set))
+    print('threads: {:d}'.format(torch.get_num_threads()))
+    for name in ('fp32', 'int8'):
+        print('{:s} | latency {:7.1f} ms | size {:6.1f} MB'.format(
+            name, *results[name][:2]) + (' | VOC07 mAP {:.4f}'.format(
+                results[name][2]) if args.eval else ''))
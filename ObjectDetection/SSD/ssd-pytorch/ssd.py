@@ -3,8 +3,10 @@ import torch.nn as nn
 import torch.nn.functional as F
 from torch.autograd import Variable
 from layers import *
-from data import voc, coco
+from data import configs
+from utils.checkpoint import model_state
 import os
+import math
 
 
 class SSD(nn.Module):
@@ -20,7 +22,7 @@ class SSD(nn.Module):
     Args:
         phase: (string) Can be "test" or "train"
         size: input image size
-        base: VGG16 layers for input, size of either 300 or 500
+        base: VGG16 layers for input, size of either 300 or 512
         extras: extra layers that feed to multibox loc and conf layers
         head: "multibox head" consists of loc and conf conv layers
     """
@@ -29,9 +31,7 @@ class SSD(nn.Module):
         super(SSD, self).__init__()
         self.phase = phase
         self.num_classes = num_classes
-        self.cfg = (coco, voc)[num_classes == 21]
-        self.priorbox = PriorBox(self.cfg)
-        self.priors = Variable(self.priorbox.forward())
+        self.cfg = configs[size][('COCO', 'VOC')[num_classes == 21]]
         self.size = size
 
         # SSD network
@@ -42,6 +42,13 @@ class SSD(nn.Module):
         self.loc = nn.ModuleList(head[0])
         self.conf = nn.ModuleList(head[1])
 
+        # one grid of default boxes per source feature map, sized from the
+        # layers instead of the config
+        self.priorbox = PriorBox(self.cfg, self.feature_map_sizes())
+        # non-persistent buffer: follows .to()/.cuda()/.half() of the model,
+        # but is not part of the state_dict
+        self.register_buffer('priors', self.priorbox.forward(), persistent=False)
+
         if phase == 'test':
             self.softmax = nn.Softmax(dim=-1)
             self.detect = Detect(num_classes, 0, 200, 0.01, 0.45)
@@ -51,7 +58,7 @@ class SSD(nn.Module):
         """Applies network layers and ops on input image(s) x.
 
         Args:
-            x: input image or batch of images. Shape: [batch,3,300,300].
+            x: input image or batch of images. Shape: [batch,3,size,size].
 
         Return:
             Depending on phase:
@@ -101,7 +108,7 @@ class SSD(nn.Module):
                 loc.view(loc.size(0), -1, 4),                   # loc preds
                 self.softmax(conf.view(conf.size(0), -1,
                              self.num_classes)),                # conf preds
-                self.priors.type(type(x.data))                  # default boxes
+                self.priors                                     # default boxes
             )
         else:
             output = (
@@ -111,17 +118,48 @@ class SSD(nn.Module):
             )
         return output
 
+    def feature_map_sizes(self):
+        """Spatial size of every source feature map (conv4_3, fc7 and every
+        second extra layer) for a size x size input, computed from the
+        kernel, stride and padding of the layers without a forward pass"""
+        size = self.size
+        sizes = []
+        for k, layer in enumerate(self.vgg):
+            size = _output_size(layer, size)
+            if k == 22:  # conv4_3 relu
+                sizes.append(size)
+        sizes.append(size)  # fc7
+        for k, layer in enumerate(self.extras):
+            size = _output_size(layer, size)
+            if k % 2 == 1:
+                sizes.append(size)
+        return sizes
+
     def load_weights(self, base_file):
         other, ext = os.path.splitext(base_file)
         if ext == '.pkl' or '.pth':
             print('Loading weights into state dict...')
-            self.load_state_dict(torch.load(base_file,
-                                 map_location=lambda storage, loc: storage))
+            # model weights of a resumable training checkpoint
+            self.load_state_dict(model_state(torch.load(
+                base_file, map_location=lambda storage, loc: storage)))
             print('Finished!')
         else:
             print('Sorry only .pth and .pkl files supported.')
 
 
+def _output_size(layer, size):
+    """Output height/width of a square size x size input of a layer"""
+    if not isinstance(layer, (nn.Conv2d, nn.MaxPool2d)):
+        return size
+    kernel, stride, padding, dilation = [
+        v if isinstance(v, int) else v[0] for v in
+        (layer.kernel_size, layer.stride, layer.padding, layer.dilation)]
+    out = (size + 2 * padding - dilation * (kernel - 1) - 1) / float(stride) + 1
+    if getattr(layer, 'ceil_mode', False):
+        return int(math.ceil(out))
+    return int(math.floor(out))
+
+
 # This function is derived from torchvision VGG make_layers()
 # https://github.com/pytorch/vision/blob/master/torchvision/models/vgg.py
 def vgg(cfg, i, batch_norm=False):
@@ -153,10 +191,14 @@ def add_extras(cfg, i, batch_norm=False):
     in_channels = i
     flag = False
     for k, v in enumerate(cfg):
-        if in_channels != 'S':
+        if in_channels not in ('S', 'K'):
             if v == 'S':
                 layers += [nn.Conv2d(in_channels, cfg[k + 1],
                            kernel_size=(1, 3)[flag], stride=2, padding=1)]
+            elif v == 'K':
+                # SSD512 conv12_2: 4x4 kernel, 2x2 -> 1x1
+                layers += [nn.Conv2d(in_channels, cfg[k + 1],
+                           kernel_size=4, padding=1)]
             else:
                 layers += [nn.Conv2d(in_channels, v, kernel_size=(1, 3)[flag])]
             flag = not flag
@@ -184,15 +226,16 @@ def multibox(vgg, extra_layers, cfg, num_classes):
 base = {
     '300': [64, 64, 'M', 128, 128, 'M', 256, 256, 256, 'C', 512, 512, 512, 'M',
             512, 512, 512],
-    '512': [],
+    '512': [64, 64, 'M', 128, 128, 'M', 256, 256, 256, 'C', 512, 512, 512, 'M',
+            512, 512, 512],
 }
 extras = {
     '300': [256, 'S', 512, 128, 'S', 256, 128, 256, 128, 256],
-    '512': [],
+    '512': [256, 'S', 512, 128, 'S', 256, 128, 'S', 256, 128, 'S', 256, 128, 'K', 256],
 }
 mbox = {
     '300': [4, 6, 6, 6, 4, 4],  # number of boxes per feature map location
-    '512': [],
+    '512': [4, 6, 6, 6, 6, 4, 4],
 }
 
 
@@ -200,9 +243,9 @@ def build_ssd(phase, size=300, num_classes=21):
     if phase != "test" and phase != "train":
         print("ERROR: Phase: " + phase + " not recognized")
         return
-    if size != 300:
+    if size not in configs:
         print("ERROR: You specified size " + repr(size) + ". However, " +
-              "currently only SSD300 (size=300) is supported!")
+              "currently only SSD300 and SSD512 (size=300 or 512) are supported!")
         return
     base_, extras_, head_ = multibox(vgg(base[str(size)], 3),
                                      add_extras(extras[str(size)], 1024),
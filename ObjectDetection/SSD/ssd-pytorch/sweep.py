@@ -0,0 +1,116 @@
+"""Sweep the post-processing parameters of the Detect layer
+
+Reruns only decode + nms + AP over a grid of conf_thresh / nms_thresh / top_k
+on the raw outputs cached by `eval.py --raw_outputs <dir>`, so the network
+runs once for the whole sweep. Settings are evaluated in parallel processes,
+each reading the memory mapped outputs.
+
+    python eval.py --raw_outputs eval/raw_voc07_test
+    python sweep.py --raw_outputs eval/raw_voc07_test --conf_thresh 0.01 0.05 --nms_thresh 0.45 0.5 --top_k 100 200
+"""
+from __future__ import print_function
+
+import time
+import argparse
+import itertools
+import warnings
+from multiprocessing import Pool
+
+import numpy as np
+import torch
+from data import VOCDetection, VOC_CLASSES as labelmap
+from layers import Detect
+from utils.raw_outputs import RawOutputs
+from utils.voc_eval import add_detections, ground_truth_from_store, \
+    evaluate_all_boxes
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+parser = argparse.ArgumentParser(
+    description='Single Shot MultiBox Detector post-processing sweep')
+parser.add_argument('--raw_outputs', required=True, type=str,
+                    help='Raw outputs directory written by eval.py --raw_outputs')
+parser.add_argument('--conf_thresh', default=[0.01], type=float, nargs='+',
+                    help='Detection confidence thresholds to sweep')
+parser.add_argument('--nms_thresh', default=[0.45], type=float, nargs='+',
+                    help='NMS IoU thresholds to sweep')
+parser.add_argument('--top_k', default=[200], type=int, nargs='+',
+                    help='Maximum numbers of detections per class to sweep')
+parser.add_argument('--voc_root', default=None, type=str,
+                    help='Location of VOC root directory, default the one '
+                         'eval.py ran on')
+parser.add_argument('--batch_size', default=16, type=int,
+                    help='Images decoded and suppressed at once')
+parser.add_argument('--processes', default=None, type=int,
+                    help='Settings evaluated in parallel, default one per cpu')
+parser.add_argument('--use_07', default=True, type=str2bool,
+                    help='Use the VOC07 11 point AP')
+
+
+def run_setting(setting):
+    """Detect + AP of one (conf_thresh, nms_thresh, top_k) setting"""
+    conf_thresh, nms_thresh, top_k = setting
+    # one thread per process, the parallelism is across settings
+    torch.set_num_threads(1)
+    raw = RawOutputs(args.raw_outputs)
+    num_images = len(raw)
+    detect = Detect(len(labelmap) + 1, 0, top_k, conf_thresh, nms_thresh)
+    priors = torch.from_numpy(raw.priors)
+    all_boxes = [[[] for _ in range(num_images)]
+                 for _ in range(len(labelmap) + 1)]
+    detect_time = 0.
+    num_dets = 0
+    for start in range(0, num_images, args.batch_size):
+        end = min(start + args.batch_size, num_images)
+        loc, conf = raw.batch(start, end)
+        loc, conf = torch.from_numpy(loc), torch.from_numpy(conf)
+        t0 = time.time()
+        with torch.no_grad():
+            detections = detect(loc, conf, priors)
+        detect_time += time.time() - t0
+        num_dets += int((detections[:, 1:, :, 0] > 0).sum())
+        add_detections(all_boxes, detections.numpy(),
+                       raw.sizes[start:end].tolist(), start)
+    results = evaluate_all_boxes(all_boxes, gt, ovthresh=0.5,
+                                 use_07_metric=args.use_07, processes=1)
+    aps = [ap for rec, prec, ap in results]
+    return (conf_thresh, nms_thresh, top_k, np.mean(aps),
+            detect_time / num_images * 1000, num_dets / float(num_images))
+
+
+def init_worker(worker_args, worker_gt):
+    global args, gt
+    args, gt = worker_args, worker_gt
+
+
+if __name__ == '__main__':
+    warnings.filterwarnings("ignore")
+    args = parser.parse_args()
+    meta = RawOutputs(args.raw_outputs).meta
+    dataset = VOCDetection(args.voc_root or meta['voc_root'],
+                           [tuple(s) for s in meta['image_sets']])
+    if [i[1] for i in dataset.ids] != [i[1] for i in meta['ids']]:
+        raise ValueError('The raw outputs were not computed on the images of '
+                         + (args.voc_root or meta['voc_root']))
+    # ground truth grouped once, shared by all settings
+    gt = ground_truth_from_store(dataset.store, list(labelmap))
+    settings = list(itertools.product(args.conf_thresh, args.nms_thresh,
+                                      args.top_k))
+    print('Sweeping {:d} settings over {:d} images'.format(
+        len(settings), len(meta['ids'])))
+    t0 = time.time()
+    pool = Pool(args.processes, initializer=init_worker, initargs=(args, gt))
+    try:
+        results = pool.map(run_setting, settings, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    print('{:>11s} {:>10s} {:>6s} {:>8s} {:>14s} {:>11s}'.format(
+        'conf_thresh', 'nms_thresh', 'top_k', 'mAP', 'detect ms/img',
+        'dets/img'))
+    for result in sorted(results, key=lambda r: -r[3]):
+        print('{:11.3f} {:10.2f} {:6d} {:8.4f} {:14.2f} {:11.1f}'.format(*result))
+    print('Swept in {:.1f}s'.format(time.time() - t0))
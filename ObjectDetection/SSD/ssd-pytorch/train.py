@@ -1,17 +1,22 @@
 from data import *
-from utils.augmentations import SSDAugmentation
+from data.sampler import AspectRatioBatchSampler, DEFAULT_GROUP_EDGES
+from utils.augmentations import SSDAugmentation, FusedSSDAugmentation, MatchPriors, Compose
 from layers.modules import MultiBoxLoss
+from utils.loader_profile import load_loader_profile
+from utils.checkpoint import CheckpointWriter, model_state
+from utils.distributed import init_distributed, is_main_process, pin_threads, \
+    all_reduce_mean, local_rank_zero_first
 from ssd import build_ssd
 import os
 import time
 import torch
-from torch.autograd import Variable
 from torch.utils.tensorboard import SummaryWriter
 import torch.nn as nn
 import torch.optim as optim
 import torch.backends.cudnn as cudnn
 import torch.nn.init as init
 import torch.utils.data as data
+from torch.nn.parallel import DistributedDataParallel
 import argparse
 
 
@@ -39,6 +44,8 @@ parser.add_argument('--dataset', default='VOC', choices=['VOC', 'COCO'],
                     type=str, help='VOC or COCO')
 parser.add_argument('--dataset_root', default=VOC_ROOT,
                     help='Dataset root directory path')
+parser.add_argument('--size', default=300, type=int, choices=[300, 512],
+                    help='Input size: SSD300 or SSD512')
 parser.add_argument('--basenet', default='vgg16_reducedfc.pth',
                     help='Pretrained base model')
 parser.add_argument('--frozen', default=True,
@@ -46,13 +53,44 @@ parser.add_argument('--frozen', default=True,
 parser.add_argument('--batch_size', default=32, type=int,
                     help='Batch size for training')
 parser.add_argument('--resume', default=None, type=str,
-                    help='Checkpoint state_dict file to resume training from')
+                    help='Checkpoint file to resume training from, checkpoints saved by '
+                         'train.py also restore the optimizer and the iteration')
 parser.add_argument('--start_iter', default=0, type=int,
-                    help='Resume training at this iter')
+                    help='Resume training at this iter, for checkpoints without an iteration')
+parser.add_argument('--log_interval', default=10, type=int,
+                    help='Print and log the mean losses every log_interval iterations')
+parser.add_argument('--save_interval', default=1000, type=int,
+                    help='Save a checkpoint every save_interval iterations')
 parser.add_argument('--num_workers', default=6, type=int,
                     help='Number of workers used in loading data')
+parser.add_argument('--loader_profile', default=None, type=str,
+                    help='DataLoader profile json (workers, prefetch, pinned memory), see '
+                         'benchmark/tune_data_loader.py; explicit options override it')
+parser.add_argument('--prefetch_factor', default=2, type=int,
+                    help='Batches prefetched by every DataLoader worker')
+parser.add_argument('--persistent_workers', default=True, type=str2bool,
+                    help='Keep the DataLoader workers alive across epochs')
+parser.add_argument('--pin_memory', default=True, type=str2bool,
+                    help='Collate batches into pinned memory for asynchronous copies to the gpu')
+parser.add_argument('--skip_empty', default=False, type=str2bool,
+                    help='Skip images without (non difficult) objects, read from the AnnotationStore')
+parser.add_argument('--aspect_grouping', default=False, type=str2bool,
+                    help='Batch images of similar aspect ratio together (data.sampler)')
+parser.add_argument('--fused_augmentation', default=False, type=str2bool,
+                    help='Use the uint8 FusedSSDAugmentation instead of SSDAugmentation')
+parser.add_argument('--shm_ring', default=False, type=str2bool,
+                    help='Pass uint8 batches through a shared-memory ring (data.batch_ring), '
+                         'implies the fused augmentation')
+parser.add_argument('--match_in_workers', default=False, type=str2bool,
+                    help='Match and encode targets in the DataLoader workers')
 parser.add_argument('--cuda', default=True, type=str2bool,
                     help='Use CUDA to train model')
+parser.add_argument('--distributed', default=False, type=str2bool,
+                    help='CPU data-parallel training with torch.distributed gloo, '
+                         'one process per torchrun worker; --batch_size is split across them')
+parser.add_argument('--threads_per_process', default=None, type=int,
+                    help='Intra-op threads (and pinned cores) of every distributed process, '
+                         'default cores / processes on the host')
 parser.add_argument('--lr', '--learning-rate', default=0.001, type=float,
                     help='initial learning rate')
 parser.add_argument('--momentum', default=0.9, type=float,
@@ -65,7 +103,17 @@ parser.add_argument('--save_folder', default='weights/',
                     help='Directory for saving checkpoint models')
 parser.add_argument('--logdir', default='data/logs',
                     help='Directory for saving checkpoint models')
+args, _ = parser.parse_known_args()
+if args.loader_profile:
+    # profile中的设置作为默认值，命令行显式给出的参数优先
+    parser.set_defaults(**load_loader_profile(args.loader_profile))
 args = parser.parse_args()
+if args.shm_ring and args.match_in_workers:
+    parser.error('--shm_ring and --match_in_workers cannot be combined')
+if args.distributed and args.shm_ring:
+    parser.error('--distributed and --shm_ring cannot be combined')
+if (args.skip_empty or args.aspect_grouping) and (args.distributed or args.shm_ring):
+    parser.error('--skip_empty and --aspect_grouping need the default single process loader')
 
 model_env = torch.device("cpu")  # 初始模型训练环境为cpu
 if torch.cuda.is_available():
@@ -80,8 +128,47 @@ if torch.cuda.is_available():
 else:
     torch.set_default_tensor_type('torch.FloatTensor')
 
+if args.distributed and model_env.type != 'cpu':
+    parser.error('--distributed trains on the CPU, use --cuda false')
+
 if not os.path.exists(args.save_folder):
-    os.mkdir(args.save_folder)
+    os.makedirs(args.save_folder, exist_ok=True)
+
+
+def train_transform(cfg):
+    """训练时的数据增强；--match_in_workers时在worker中顺带完成先验框的匹配和编码"""
+    if args.shm_ring:
+        # uint8 images, normalized per batch by RingLoader
+        return FusedSSDAugmentation(cfg['min_dim'], MEANS, normalize=False)
+    augmentation = FusedSSDAugmentation if args.fused_augmentation else SSDAugmentation
+    transform = augmentation(cfg['min_dim'], MEANS)
+    if args.match_in_workers:
+        transform = Compose([transform, MatchPriors(cfg)])
+    return transform
+
+
+def loader_options():
+    """DataLoader的worker数、预取和锁页内存设置，单进程和多进程训练共用"""
+    options = {'num_workers': args.num_workers,
+               # 只有拷贝到gpu时锁页内存才有意义
+               'pin_memory': args.pin_memory and model_env.type == 'cuda'}
+    if args.num_workers > 0:
+        options.update(persistent_workers=args.persistent_workers,
+                       prefetch_factor=args.prefetch_factor)
+    return options
+
+
+def batches(data_loader):
+    """Endless stream of batches: at an epoch boundary the next pass starts on
+    the same (persistent) workers instead of rebuilding the iterator by hand"""
+    epoch = 0
+    while True:
+        sampler = getattr(data_loader, 'sampler', None)
+        if isinstance(sampler, data.distributed.DistributedSampler):
+            sampler.set_epoch(epoch)  # 每个epoch重新打乱
+        for batch in data_loader:
+            yield batch
+        epoch += 1
 
 
 def create_dataset():
@@ -92,26 +179,52 @@ def create_dataset():
             print("WARNING: Using default COCO dataset_root because " +
                   "--dataset_root was not specified.")
             args.dataset_root = COCO_ROOT
-        cfg = coco
+        cfg = configs[args.size]['COCO']
         dataset = COCODetection(root=args.dataset_root,
-                                transform=SSDAugmentation(cfg['min_dim'],
-                                                          MEANS))
+                                transform=train_transform(cfg))
     elif args.dataset == 'VOC':
         if args.dataset_root == COCO_ROOT:
             parser.error('Must specify dataset if specifying dataset_root')
-        cfg = voc
+        cfg = configs[args.size]['VOC']
         dataset = VOCDetection(root=args.dataset_root,
-                               transform=SSDAugmentation(cfg['min_dim'],
-                                                         MEANS))
-
-    print('Loading the dataset...')
-    print('Training SSD on:', dataset.name)
-    print('Using the specified args:')
-    print(args)
-    data_loader = data.DataLoader(dataset, args.batch_size,
-                                  num_workers=args.num_workers,
-                                  shuffle=True, collate_fn=detection_collate,
-                                  pin_memory=True)
+                               transform=train_transform(cfg))
+
+    if is_main_process():
+        print('Loading the dataset...')
+        print('Training SSD on:', dataset.name)
+        print('Using the specified args:')
+        print(args)
+    if args.shm_ring:
+        # worker将uint8图片直接写入共享内存中的batch槽位，主进程按batch归一化(pull_item已转为RGB)
+        data_loader = RingLoader(dataset, args.batch_size, cfg['min_dim'], MEANS[::-1],
+                                 num_workers=args.num_workers, shuffle=True,
+                                 prefetch_factor=args.prefetch_factor,
+                                 persistent_workers=args.persistent_workers,
+                                 device=model_env)
+        return cfg, data_loader
+    # 在DataLoader的worker中完成先验框匹配时，target已是编码后的(loc_t, conf_t)；
+    # 否则target补齐为一个[batch,max_objs,5]张量和每张图的目标数num_objs
+    collate_fn = matched_collate if args.match_in_workers else padded_collate
+    if args.distributed:
+        # 每个进程只读取自己的一份数据，batch_size在进程间平分
+        world_size = torch.distributed.get_world_size()
+        if args.batch_size % world_size:
+            parser.error('--batch_size must be divisible by the number of processes')
+        sampler = data.distributed.DistributedSampler(dataset, shuffle=True)
+        data_loader = data.DataLoader(dataset, args.batch_size // world_size,
+                                      sampler=sampler, collate_fn=collate_fn,
+                                      **loader_options())
+        return cfg, data_loader
+    if args.skip_empty or args.aspect_grouping:
+        # 从AnnotationStore读取每张图的目标数和宽高比，不加载图片
+        batch_sampler = AspectRatioBatchSampler.from_dataset(
+            dataset, args.batch_size, skip_empty=args.skip_empty,
+            group_edges=DEFAULT_GROUP_EDGES if args.aspect_grouping else None)
+        data_loader = data.DataLoader(dataset, batch_sampler=batch_sampler,
+                                      collate_fn=collate_fn, **loader_options())
+        return cfg, data_loader
+    data_loader = data.DataLoader(dataset, args.batch_size, shuffle=True,
+                                  collate_fn=collate_fn, **loader_options())
     return cfg, data_loader
 
 
@@ -144,75 +257,109 @@ def build_network(cfg):
 
 
 def train():
-
-    # 初始化data_loader、cfg
-    cfg, data_loader = create_dataset()
+    local_rank = 0
+    if args.distributed:
+        # 加入torchrun启动的gloo进程组，并给每个进程分配各自的cpu核
+        rank, world_size, local_rank, local_world_size = init_distributed('gloo')
+        threads = pin_threads(local_rank, local_world_size, args.threads_per_process)
+        print('Process {:d}/{:d} training with {:d} threads'.format(rank, world_size, threads))
+
+    # 初始化data_loader、cfg；多进程时先由每台机器的local rank 0建立(或检查)
+    # annotation store，其余进程等它完成后再读取，避免同时写同一个store
+    with local_rank_zero_first(local_rank):
+        cfg, data_loader = create_dataset()
     # build network
     ssd_net = build_network(cfg)
+    # 梯度在进程间all-reduce；保存checkpoint时仍使用未包装的ssd_net
+    net = DistributedDataParallel(ssd_net) if args.distributed else ssd_net
     # tf log
-    writer = SummaryWriter(args.logdir)
+    writer = SummaryWriter(args.logdir) if is_main_process() else None
     # 优化器
     optimizer = optim.SGD(ssd_net.parameters(), lr=args.lr, momentum=args.momentum,
                           weight_decay=args.weight_decay)
+    # 从train.py保存的checkpoint恢复时，同时恢复优化器状态(动量、学习率)和迭代次数
+    start_iter = args.start_iter
+    if args.resume:
+        checkpoint = torch.load(args.resume, map_location=model_env)
+        if model_state(checkpoint) is not checkpoint:
+            optimizer.load_state_dict(checkpoint['optimizer'])
+            start_iter = checkpoint['iteration'] + 1
+            print('Resuming at iter {:d}'.format(start_iter))
     # 损失函数
     criterion = MultiBoxLoss(cfg['num_classes'], 0.5, True, 0, True, 3, 0.5,
                              False, args.cuda)
     ssd_net.train()
-    # loss counters
-    loc_loss, conf_loss, step_index = 0, 0, 0
-
-    batch_iterator = iter(data_loader)  # create batch dataset
-    for iteration in range(args.start_iter, cfg['max_iter']):
+    # loss counters: 累加在训练设备上，只在打印日志时读取一次，避免每轮迭代都同步设备
+    loc_loss = torch.zeros((), device=model_env)
+    conf_loss = torch.zeros((), device=model_env)
+    num_iters = 0
+    step_index = sum(1 for step in cfg['lr_steps'] if step < start_iter)
+    if step_index:
+        adjust_learning_rate(optimizer, args.gamma, step_index)
+    # 后台线程保存checkpoint
+    checkpoint_writer = CheckpointWriter()
+
+    batch_iterator = batches(data_loader)  # create batch dataset
+    t0 = time.time()
+    for iteration in range(start_iter, cfg['max_iter']):
         if iteration in cfg['lr_steps']:
             step_index += 1
             adjust_learning_rate(optimizer, args.gamma, step_index)
 
         # load train data
-        # images, targets = next(batch_iterator)
-        try:
-            images, targets = next(batch_iterator)
-        except StopIteration as e:
-            batch_iterator = iter(data_loader)
-            images, targets = next(batch_iterator)
-
-        if args.cuda:
-            images = Variable(images.cuda())
-            targets = [Variable(ann.cuda(), volatile=True) for ann in targets]
-        else:
-            images = Variable(images)
-            targets = [Variable(ann, volatile=True) for ann in targets]
+        images, targets = next(batch_iterator)
+        # (loc_t, conf_t)已在worker中算好/(targets, num_objs)已补齐，从锁页内存异步拷贝到gpu
+        images = images.to(model_env, non_blocking=True)
+        targets = tuple(t.to(model_env, non_blocking=True) for t in targets)
 
         # forward得到网络输出
-        t0 = time.time()
-
-        out = ssd_net(images)
+        out = net(images)
         optimizer.zero_grad()   # 清空优化器之前累积的梯度
         loss_l, loss_c = criterion(out, targets)  # 将输出的out和target输入损失函数并前向传播，得到box回归和分类conf的loss
         loss = loss_l + loss_c
         loss.backward()         # 总损失应用backward反向传播
         optimizer.step()
-        loc_loss += loss_l.item()
-        conf_loss += loss_c.item()
-
-        # print loss and write tf log
-        t1 = time.time()
-        lr = optimizer.param_groups[0]['lr']
-        if iteration % 10 == 0:
-            print('timer: %.4f sec.' % (t1 - t0))
-            print('lr: ' + str(lr) + ' || iter: ' + repr(iteration) +
-                  ' || box_loss: %.4f || conf loss: %.4f || total loss: %.4f ||' % (loss_l, loss_c, loss.item()), end=' ')
-            writer.add_scalar("lr", lr, global_step=iteration)
-            writer.add_scalar("loss/box_loss", loss_l, global_step=iteration)
-            writer.add_scalar("loss/conf_loss", loss_c, global_step=iteration)
-            writer.add_scalar("loss/total_loss", loss, global_step=iteration)
-            writer.flush()
-
-        # 每迭1000轮多少轮存一次模型
-        if iteration != 0 and iteration % 1000 == 0:
+        loc_loss += loss_l.detach()
+        conf_loss += loss_c.detach()
+        num_iters += 1
+
+        # print loss and write tf log: 日志间隔内的平均loss，读取时才同步一次设备
+        if iteration % args.log_interval == 0:
+            # 多进程训练时取所有进程的平均loss
+            box_l, conf_l = all_reduce_mean(
+                torch.stack((loc_loss, conf_loss)) / num_iters).tolist()
+            loc_loss.zero_()
+            conf_loss.zero_()
+            t1 = time.time()
+            iter_time = (t1 - t0) / num_iters
+            num_iters = 0
+            t0 = t1
+            lr = optimizer.param_groups[0]['lr']
+            if is_main_process():
+                print('timer: %.4f sec.' % iter_time)
+                print('lr: ' + str(lr) + ' || iter: ' + repr(iteration) +
+                      ' || box_loss: %.4f || conf loss: %.4f || total loss: %.4f ||' % (
+                          box_l, conf_l, box_l + conf_l), end=' ')
+                writer.add_scalar("lr", lr, global_step=iteration)
+                writer.add_scalar("loss/box_loss", box_l, global_step=iteration)
+                writer.add_scalar("loss/conf_loss", conf_l, global_step=iteration)
+                writer.add_scalar("loss/total_loss", box_l + conf_l, global_step=iteration)
+                writer.flush()
+
+        # 每save_interval轮存一次模型，后台线程写文件，不阻塞训练；多进程时只由rank 0保存
+        if iteration != 0 and iteration % args.save_interval == 0 and is_main_process():
             print('Saving state, iter:', iteration)
-            torch.save(ssd_net.state_dict(), 'weights/ssd300_voc_iter' + repr(iteration) + '_loss' + loss.item() + '.pth')
+            checkpoint_writer.save(
+                {'model': ssd_net.state_dict(), 'optimizer': optimizer.state_dict(),
+                 'iteration': iteration},
+                os.path.join(args.save_folder, 'ssd' + repr(args.size) + '_' + args.dataset.lower() +
+                             '_iter' + repr(iteration) + '.pth'))
     # 保存最终模型
-    torch.save(ssd_net.state_dict(), args.save_folder + '' + args.dataset + '.pth')
+    if is_main_process():
+        checkpoint_writer.save(ssd_net.state_dict(), args.save_folder + '' + args.dataset + '.pth')
+    checkpoint_writer.close()
+    if args.distributed:
+        torch.distributed.destroy_process_group()
 
 
 def adjust_learning_rate(optimizer, gamma, step):
@@ -1 +1 @@
-from .augmentations import SSDAugmentation
\ No newline at end of file
+from .augmentations import SSDAugmentation, MatchPriors
\ No newline at end of file
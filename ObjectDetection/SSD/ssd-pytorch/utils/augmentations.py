@@ -4,6 +4,8 @@ import cv2
 import numpy as np
 import types
 from numpy import random
+from layers import PriorBox
+from layers.box_utils import match_batch
 
 
 def intersect(box_a, box_b):
@@ -235,7 +237,7 @@ class RandomSampleCrop(object):
         height, width, _ = image.shape
         while True:
             # randomly choose a mode
-            mode = random.choice(self.sample_options)
+            mode = self.sample_options[random.randint(len(self.sample_options))]
             if mode is None:
                 return image, boxes, labels
 
@@ -397,6 +399,205 @@ class PhotometricDistort(object):
         return self.rand_light_noise(im, boxes, labels)
 
 
+class MatchPriors(object):
+    """Match the (augmented) ground truth boxes against the default boxes and
+    encode them, so that target encoding runs in the DataLoader workers
+    instead of inside MultiBoxLoss on the training thread.
+    Meant to be composed after SSDAugmentation (boxes in percent coords):
+        Compose([SSDAugmentation(cfg['min_dim'], MEANS), MatchPriors(cfg)])
+    Returns loc_t [num_priors,4] in place of the boxes and conf_t [num_priors]
+    in place of the labels; use data.matched_collate to batch them.
+    """
+
+    def __init__(self, cfg, threshold=0.5):
+        self.threshold = threshold
+        self.variance = cfg['variance']
+        self.priors = PriorBox(cfg).forward()
+
+    def __call__(self, image, boxes=None, labels=None):
+        truths = torch.from_numpy(np.asarray(boxes)).float().unsqueeze(0)
+        labels = torch.from_numpy(np.asarray(labels)).float().unsqueeze(0)
+        # explicit cpu: train.py may set a cuda default tensor type, and
+        # cuda can not be initialised in a forked worker
+        num_objs = torch.tensor([truths.size(1)], dtype=torch.long, device='cpu')
+        loc_t, conf_t = match_batch(self.threshold, truths, self.priors,
+                                    self.variance, labels, num_objs)
+        return image, loc_t[0].numpy(), conf_t[0].numpy()
+
+
+class FusedSSDAugmentation(object):
+    """Same augmentation as SSDAugmentation, fused into one geometric and one
+    photometric pass over the final size x size image:
+      - Expand, RandomSampleCrop, RandomMirror and Resize are sampled on the
+        boxes only and applied to the pixels as a single cv2.warpAffine, so
+        neither the expanded canvas nor the crop is ever allocated
+      - brightness, contrast, saturation and hue run on uint8 pixels through
+        256 entry lookup tables (hue/saturation in cv2's uint8 HSV)
+      - the channel swap and the mean subtraction run on the output only
+    The random parameters follow the same distributions as SSDAugmentation.
+    Differences: pixels are clipped to [0, 255] between photometric steps
+    and hue shifts are rounded to cv2's 2 degree uint8 hue steps, and the
+    photometric distortion is applied after resampling instead of before.
+    Expects a uint8 BGR image and boxes in percent coords, like
+    SSDAugmentation; returns the mean subtracted float32 image, or with
+    normalize=False the uint8 image (to be normalized per batch later,
+    see data.batch_ring).
+    """
+
+    def __init__(self, size=300, mean=(104, 117, 123), normalize=True):
+        self.size = size
+        self.mean = np.array(mean, dtype=np.float32)
+        self.normalize = normalize
+        self.sample_options = RandomSampleCrop().sample_options
+        self.perms = RandomLightingNoise().perms
+        self.identity = np.arange(256, dtype=np.float32)
+
+    def sample_crop(self, width, height, boxes, labels):
+        """RandomSampleCrop on the boxes only, the 50 trials of a mode drawn
+        at once; returns the crop rect x1,y1,x2,y2 and the cropped boxes"""
+        while True:
+            mode = self.sample_options[random.randint(len(self.sample_options))]
+            if mode is None:
+                return np.array([0, 0, width, height]), boxes, labels
+            min_iou, max_iou = mode
+            if min_iou is None:
+                min_iou = float('-inf')
+            if max_iou is None:
+                max_iou = float('inf')
+
+            w = random.uniform(0.3 * width, width, 50)
+            h = random.uniform(0.3 * height, height, 50)
+            left = random.uniform(width - w)
+            top = random.uniform(height - h)
+            rects = np.stack((left, top, left + w, top + h), 1).astype(int)
+
+            # jaccard overlap of every trial with every gt box, [50,num_objs]
+            inter_wh = np.clip(np.minimum(rects[:, None, 2:], boxes[None, :, 2:]) -
+                               np.maximum(rects[:, None, :2], boxes[None, :, :2]),
+                               0, np.inf)
+            inter = inter_wh[..., 0] * inter_wh[..., 1]
+            area_a = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            area_b = (rects[:, 2] - rects[:, 0]) * (rects[:, 3] - rects[:, 1])
+            overlap = inter / (area_a[None, :] + area_b[:, None] - inter)
+
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+            mask = ((rects[:, None, 0] < centers[None, :, 0]) &
+                    (rects[:, None, 1] < centers[None, :, 1]) &
+                    (rects[:, None, 2] > centers[None, :, 0]) &
+                    (rects[:, None, 3] > centers[None, :, 1]))
+            # same acceptance test as RandomSampleCrop, in trial order
+            ok = ~((h / w < 0.5) | (h / w > 2))
+            ok &= ~((overlap.min(1) < min_iou) & (max_iou < overlap.max(1)))
+            ok &= mask.any(1)
+            if not ok.any():
+                continue
+            t = int(np.argmax(ok))
+            rect, mask = rects[t], mask[t]
+            current_boxes = boxes[mask, :].copy()
+            current_boxes[:, :2] = np.maximum(current_boxes[:, :2], rect[:2])
+            current_boxes[:, 2:] = np.minimum(current_boxes[:, 2:], rect[2:])
+            current_boxes -= np.tile(rect[:2], 2)
+            return rect, current_boxes, labels[mask]
+
+    def photometric_luts(self):
+        """Draw PhotometricDistort's random parameters, in the same order.
+        Returns the lookup table applied before the HSV round trip, the
+        (saturation, hue) tables or None when both are skipped, the table
+        applied after it or None, and the channel swap or None"""
+        pre = self.identity.copy()
+        if random.randint(2):
+            pre += random.uniform(-32, 32)
+        contrast_first = random.randint(2)
+        if contrast_first and random.randint(2):
+            pre *= random.uniform(0.5, 1.5)
+        saturation, hue = self.identity, np.arange(256)
+        use_hsv = False
+        if random.randint(2):
+            saturation = self.identity * random.uniform(0.5, 1.5)
+            use_hsv = True
+        if random.randint(2):
+            # cv2 uint8 hue is 0..179 in 2 degree steps
+            hue = (hue + int(round(random.uniform(-18.0, 18.0) / 2))) % 180
+            use_hsv = True
+        alpha = 1.
+        if not contrast_first and random.randint(2):
+            alpha = random.uniform(0.5, 1.5)
+        swap = None
+        if random.randint(2):
+            swap = self.perms[random.randint(len(self.perms))]
+
+        if not use_hsv:
+            # no HSV round trip in between: one table, clipped once
+            return np.clip(pre * alpha, 0, 255), None, None, swap
+        post = np.clip(self.identity * alpha, 0, 255) if alpha != 1. else None
+        return np.clip(pre, 0, 255), (np.clip(saturation, 0, 255), hue), post, swap
+
+    def __call__(self, img, boxes, labels):
+        height, width, _ = img.shape
+        boxes = boxes * np.array([width, height, width, height])
+
+        # Expand: only the offset of the image in the canvas
+        canvas_w, canvas_h, ox, oy = width, height, 0, 0
+        expand = not random.randint(2)
+        if expand:
+            ratio = random.uniform(1, 4)
+            left = random.uniform(0, width * ratio - width)
+            top = random.uniform(0, height * ratio - height)
+            canvas_w, canvas_h = int(width * ratio), int(height * ratio)
+            ox, oy = int(left), int(top)
+            boxes = boxes + (ox, oy, ox, oy)
+
+        rect, boxes, labels = self.sample_crop(canvas_w, canvas_h, boxes, labels)
+        crop_w, crop_h = rect[2] - rect[0], rect[3] - rect[1]
+        mirror = random.randint(2)
+        if mirror:
+            boxes = boxes.copy()
+            boxes[:, 0::2] = crop_w - boxes[:, 2::-2]
+        boxes = boxes / np.array([crop_w, crop_h, crop_w, crop_h])
+
+        # source pixel -> output pixel (pixel centers at +0.5):
+        # x_out = sx * (x + ox - rect_x1), mirrored: sx * (crop_w - ...)
+        sx, sy = self.size / float(crop_w), self.size / float(crop_h)
+        tx = ox - rect[0]
+        if mirror:
+            x_lo, x_hi = sx * (crop_w - tx - width), sx * (crop_w - tx)
+            M = np.array([[-sx, 0, sx * (crop_w - tx - 0.5) - 0.5],
+                          [0, sy, sy * (oy - rect[1] + 0.5) - 0.5]])
+        else:
+            x_lo, x_hi = sx * tx, sx * (tx + width)
+            M = np.array([[sx, 0, sx * (tx + 0.5) - 0.5],
+                          [0, sy, sy * (oy - rect[1] + 0.5) - 0.5]])
+        y_lo, y_hi = sy * (oy - rect[1]), sy * (oy - rect[1] + height)
+        image = cv2.warpAffine(img, M, (self.size, self.size), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_CONSTANT if expand else cv2.BORDER_REPLICATE,
+                               borderValue=tuple(float(m) for m in self.mean))
+
+        pre, hsv, post, swap = self.photometric_luts()
+        image = cv2.LUT(image, pre.astype(np.uint8))
+        if hsv is not None:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            image[:, :, 1] = cv2.LUT(image[:, :, 1], hsv[0].astype(np.uint8))
+            image[:, :, 0] = cv2.LUT(image[:, :, 0], hsv[1].astype(np.uint8))
+            image = cv2.cvtColor(image, cv2.COLOR_HSV2BGR)
+            if post is not None:
+                image = cv2.LUT(image, post.astype(np.uint8))
+        if swap is not None:
+            image = image[:, :, swap]
+
+        if expand:
+            # the canvas around the image is filled after the distortion
+            x0, x1 = [int(np.clip(np.ceil(v - 0.5), 0, self.size)) for v in (x_lo, x_hi)]
+            y0, y1 = [int(np.clip(np.ceil(v - 0.5), 0, self.size)) for v in (y_lo, y_hi)]
+            fill = np.round(self.mean)
+            image[:y0], image[y1:] = fill, fill
+            image[:, :x0], image[:, x1:] = fill, fill
+        if not self.normalize:
+            return image, boxes, labels
+        image = image.astype(np.float32)
+        image -= self.mean
+        return image, boxes, labels
+
+
 class SSDAugmentation(object):
     def __init__(self, size=300, mean=(104, 117, 123)):
         self.mean = mean
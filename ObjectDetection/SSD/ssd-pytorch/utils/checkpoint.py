@@ -0,0 +1,82 @@
+"""Training checkpoints written from a background thread
+
+A checkpoint is a dict {'model': state_dict, 'optimizer': state_dict,
+'iteration': int}. CheckpointWriter.save() copies the state to CPU memory
+on the training thread (the only part that waits for the device) and a
+writer thread pickles it to a temporary file that is renamed over the
+target, so a checkpoint on disk is never half written.
+"""
+import os
+import threading
+import queue
+import torch
+
+
+def snapshot(state):
+    """Detached CPU copy of every tensor of a (nested) state dict"""
+    if torch.is_tensor(state):
+        return state.detach().to('cpu', copy=True)
+    if isinstance(state, dict):
+        return type(state)((k, snapshot(v)) for k, v in state.items())
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(v) for v in state)
+    return state
+
+
+def model_state(checkpoint):
+    """The model state_dict of a checkpoint, or the checkpoint itself when it
+    is a plain state_dict (weights/*.pth, final training weights)"""
+    if isinstance(checkpoint, dict) and 'model' in checkpoint and \
+            'iteration' in checkpoint:
+        return checkpoint['model']
+    return checkpoint
+
+
+def atomic_save(obj, path):
+    tmp_path = '%s.tmp%d' % (path, os.getpid())
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter(object):
+    """Saves checkpoints from a daemon thread, one at a time
+
+    save() returns as soon as the state is copied; if the previous checkpoint
+    is still being written it waits for it, so at most one snapshot is held
+    in memory besides the one being written.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            state, path = item
+            try:
+                atomic_save(state, path)
+            except Exception as e:  # reported by the next save() / close()
+                self.error = e
+            self.queue.task_done()
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def save(self, state, path):
+        """Snapshot `state` to CPU and write it to `path` in the background"""
+        self._check()
+        self.queue.put((snapshot(state), path))
+
+    def close(self):
+        """Wait for the pending checkpoint and stop the thread"""
+        self.queue.put(None)
+        self.thread.join()
+        self._check()
@@ -0,0 +1,82 @@
+"""CPU inference profile of a test phase SSD
+
+A profile is a small dict, saved as json by benchmark/bench_cpu_inference.py
+and read by eval.py / demo/live.py with --cpu_profile:
+
+    num_threads       intra-op threads (torch.set_num_threads), None keeps
+                      the torch default
+    interop_threads   inter-op threads (torch.set_num_interop_threads), can
+                      only be set before the first parallel op of a process
+    channels_last     run the convolutions on NHWC (channels_last) tensors
+    freeze            trace the model and torch.jit.freeze it: weights become
+                      constants and conv/ReLU chains are fused
+    batch_size        batch size the profile was measured with
+
+CPUInference applies a profile to a model and runs it under
+torch.inference_mode().
+"""
+import json
+import torch
+
+DEFAULT_PROFILE = {
+    'num_threads': None,
+    'interop_threads': None,
+    'channels_last': True,
+    'freeze': False,
+    'batch_size': 1,
+}
+
+
+def load_profile(path=None):
+    """DEFAULT_PROFILE updated with the json profile at `path`"""
+    profile = dict(DEFAULT_PROFILE)
+    if path:
+        with open(path, 'r') as f:
+            profile.update(json.load(f))
+    return profile
+
+
+def save_profile(profile, path):
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+
+
+def set_threads(profile):
+    if profile['num_threads']:
+        torch.set_num_threads(profile['num_threads'])
+    if profile['interop_threads']:
+        try:
+            torch.set_num_interop_threads(profile['interop_threads'])
+        except RuntimeError:
+            # already set, or inter-op work already started in this process
+            pass
+
+
+class CPUInference(object):
+    """Callable running a test phase SSD with a CPU profile
+
+    Arguments:
+        net (SSD): test phase SSD on the cpu, converted in place to
+            channels_last if the profile asks for it
+        profile (dict): see load_profile()
+    """
+
+    def __init__(self, net, profile=None):
+        self.profile = profile or load_profile()
+        set_threads(self.profile)
+        self.memory_format = torch.channels_last \
+            if self.profile['channels_last'] else torch.contiguous_format
+        self.net = net.eval().to(memory_format=self.memory_format)
+        self.size = net.size
+        if self.profile['freeze']:
+            x = torch.randn(self.profile['batch_size'], 3, net.size, net.size)
+            with torch.no_grad():
+                traced = torch.jit.trace(
+                    self.net, x.contiguous(memory_format=self.memory_format),
+                    check_trace=False)
+            self.net = torch.jit.freeze(traced)
+
+    def __call__(self, images):
+        """[batch,3,size,size] images -> [batch,num_classes,top_k,5] detections"""
+        with torch.inference_mode():
+            return self.net(images.contiguous(memory_format=self.memory_format))
@@ -0,0 +1,127 @@
+"""Append-only columnar store of the detections of an evaluation run
+
+eval.py streams the detections of every batch into a store directory
+instead of collecting all_boxes[cls][image] lists and pickling them at the
+end, so an interrupted run resumes after the last written chunk:
+
+    meta.json                 num_images and the settings of the run (ids,
+                              model, ...); a store with different settings
+                              is cleared instead of resumed
+    chunk_<start>_<end>.npz   detections of images start:end
+        image   int32   [N]     image index
+        label   int16   [N]     class, 1-based (0 is the background)
+        score   float32 [N]
+        boxes   float32 [N,4]   x1, y1, x2, y2 in pixels
+
+Rows are kept in image, class, Detect layer order, the order of all_boxes
+and of the results files, see utils.voc_eval.detection_columns(). Every
+chunk is written to a temporary file and renamed, so the directory only
+ever holds complete chunks.
+"""
+import os
+import os.path as osp
+import re
+import json
+import shutil
+import numpy as np
+
+COLUMNS = (('image', np.int32, ()), ('label', np.int16, ()),
+           ('score', np.float32, ()), ('boxes', np.float32, (4,)))
+CHUNK = re.compile(r'^chunk_(\d+)_(\d+)\.npz$')
+
+
+def concat_columns(chunks):
+    return {name: np.concatenate([c[name] for c in chunks] +
+                                 [np.zeros((0,) + shape, dtype)])
+            for name, dtype, shape in COLUMNS}
+
+
+class DetectionStore(object):
+    """Writer and reader of a detection store directory
+
+    Arguments:
+        path (string): store directory
+        num_images (int): number of images of the evaluation set
+        chunk_images (int): images per chunk; a resumed run repeats at most
+            the images of one chunk
+        resume (bool): keep the chunks of a previous run with the same meta
+        meta: json serializable settings of the run
+    """
+
+    def __init__(self, path, num_images, chunk_images=500, resume=True, **meta):
+        self.path = path
+        self.num_images = num_images
+        self.chunk_images = chunk_images
+        meta = dict(meta, num_images=num_images)
+        # json round trip: tuples become lists, as in the stored meta.json
+        meta = json.loads(json.dumps(meta))
+        if not (resume and self._read_meta() == meta):
+            if osp.exists(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+            with open(osp.join(path, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+        self.meta = meta
+        self.chunks = self._scan()
+        self.completed = self.chunks[-1][1] if self.chunks else 0
+        self.pending = []
+        self.pending_images = 0
+
+    def _read_meta(self):
+        try:
+            with open(osp.join(self.path, 'meta.json'), 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _scan(self):
+        """(start, end) of the chunks covering images 0:completed; leftover
+        temporary files and chunks after a gap are removed"""
+        found = {}
+        for name in os.listdir(self.path):
+            match = CHUNK.match(name)
+            if match:
+                found[int(match.group(1))] = int(match.group(2))
+            elif name != 'meta.json':
+                os.remove(osp.join(self.path, name))
+        chunks, end = [], 0
+        while end in found:
+            chunks.append((end, found.pop(end)))
+            end = chunks[-1][1]
+        for start, stale_end in found.items():
+            os.remove(osp.join(self.path, self._chunk_name(start, stale_end)))
+        return chunks
+
+    @staticmethod
+    def _chunk_name(start, end):
+        return 'chunk_%07d_%07d.npz' % (start, end)
+
+    def append(self, columns, num_images):
+        """Append the detection columns of the next num_images images"""
+        self.pending.append(columns)
+        self.pending_images += num_images
+        if self.pending_images >= self.chunk_images:
+            self.flush()
+
+    def flush(self):
+        """Write the pending images as one chunk"""
+        if not self.pending_images:
+            return
+        start, end = self.completed, self.completed + self.pending_images
+        columns = concat_columns(self.pending)
+        name = self._chunk_name(start, end)
+        tmp_path = osp.join(self.path, name + '.tmp%d.npz' % os.getpid())
+        np.savez(tmp_path, **columns)
+        os.replace(tmp_path, osp.join(self.path, name))
+        self.chunks.append((start, end))
+        self.completed = end
+        self.pending = []
+        self.pending_images = 0
+
+    def columns(self):
+        """All detection columns of images 0:completed"""
+        chunks = []
+        for start, end in self.chunks:
+            with np.load(osp.join(self.path, self._chunk_name(start, end))) as f:
+                chunks.append({name: f[name] for name, _, _ in COLUMNS})
+        return concat_columns(chunks)
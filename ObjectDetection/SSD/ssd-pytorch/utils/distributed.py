@@ -0,0 +1,64 @@
+"""torch.distributed helpers for CPU data-parallel training with gloo
+
+train.py --distributed true is started once per process by torchrun, which
+sets RANK, WORLD_SIZE, LOCAL_RANK, LOCAL_WORLD_SIZE, MASTER_ADDR and
+MASTER_PORT:
+
+    torchrun --nproc_per_node 4 train.py --distributed true --cuda false
+"""
+import os
+import contextlib
+import torch
+import torch.distributed as dist
+
+
+def init_distributed(backend='gloo'):
+    """Join the process group described by the torchrun environment,
+    return (rank, world_size, local_rank, local_world_size)"""
+    rank = int(os.environ['RANK'])
+    world_size = int(os.environ['WORLD_SIZE'])
+    local_rank = int(os.environ.get('LOCAL_RANK', rank))
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+    dist.init_process_group(backend, rank=rank, world_size=world_size)
+    return rank, world_size, local_rank, local_world_size
+
+
+def is_main_process():
+    return not dist.is_initialized() or dist.get_rank() == 0
+
+
+@contextlib.contextmanager
+def local_rank_zero_first(local_rank):
+    """Run the body on local rank 0 before the other processes of the host,
+    e.g. to build a cache on disk once instead of in every process"""
+    if dist.is_initialized() and local_rank != 0:
+        dist.barrier()
+    yield
+    # an exception on local rank 0 skips the barrier: torchrun stops the
+    # waiting processes instead of letting them build the cache themselves
+    if dist.is_initialized() and local_rank == 0:
+        dist.barrier()
+
+
+def pin_threads(local_rank, local_world_size, num_threads=None):
+    """Give every process of the host its own block of cores: restrict the
+    process to cores [local_rank * n, (local_rank + 1) * n) where available
+    and run n intra-op threads, n = num_threads or cores / processes.
+    Without pinning every process starts one thread per core and they
+    oversubscribe the host."""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+        else list(range(os.cpu_count() or 1))
+    n = num_threads or max(len(cores) // local_world_size, 1)
+    block = cores[local_rank * n:(local_rank + 1) * n]
+    if block and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, block)
+    torch.set_num_threads(n)
+    return n
+
+
+def all_reduce_mean(tensor):
+    """Mean of `tensor` over all processes (in place)"""
+    if dist.is_initialized():
+        dist.all_reduce(tensor)
+        tensor /= dist.get_world_size()
+    return tensor
@@ -0,0 +1,46 @@
+"""TorchScript and ONNX export of a test phase SSD
+
+The whole network including the Detect layer is traced: while tracing,
+Detect suppresses boxes with box_utils.nms_batch_export(), so the exported
+graphs take a [batch,3,size,size] image batch and return the same
+[batch,num_classes,top_k,5] detections as the eager model, for any batch
+size. onnx and onnxruntime are only needed for the ONNX model.
+"""
+import torch
+
+
+def example_input(net, batch_size=1):
+    return torch.randn(batch_size, 3, net.size, net.size,
+                       device=net.priors.device)
+
+
+def export_torchscript(net, path, batch_size=1):
+    """Trace the test phase `net` and save it as a TorchScript model"""
+    net.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(net, example_input(net, batch_size),
+                                 check_trace=False)
+    torch.jit.save(traced, path)
+    return traced
+
+
+def export_onnx(net, path, batch_size=1, opset_version=17):
+    """Export the test phase `net` as an ONNX model with a dynamic batch axis"""
+    net.eval()
+    with torch.no_grad():
+        torch.onnx.export(net, (example_input(net, batch_size),), path,
+                          input_names=['images'], output_names=['detections'],
+                          dynamic_axes={'images': {0: 'batch'},
+                                        'detections': {0: 'batch'}},
+                          opset_version=opset_version, dynamo=False)
+    return path
+
+
+def onnx_session(path, num_threads=None):
+    """onnxruntime CPU inference session of an exported model"""
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    return onnxruntime.InferenceSession(path, options,
+                                        providers=['CPUExecutionProvider'])
@@ -0,0 +1,41 @@
+"""DataLoader profile of train.py
+
+A profile is a small json dict, written by benchmark/tune_data_loader.py
+for the host it ran on and read by train.py --loader_profile:
+
+    num_workers       DataLoader worker processes
+    prefetch_factor   batches prefetched per worker
+    pin_memory        collate into pinned memory (gpu training only)
+    measured          what the settings were picked from: host cpus,
+                      samples/s, cpu utilization, batch size (not applied)
+
+The profile only changes the defaults of train.py; options given on the
+command line still win.
+"""
+import json
+
+LOADER_KEYS = ('num_workers', 'prefetch_factor', 'pin_memory')
+
+
+def load_loader_profile(path):
+    """The train.py options of the json profile at `path`"""
+    with open(path, 'r') as f:
+        profile = json.load(f)
+    return {key: profile[key] for key in LOADER_KEYS if key in profile}
+
+
+def save_loader_profile(profile, path):
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+
+
+def cpu_times():
+    """(busy, total) cpu jiffies of the whole host from /proc/stat, None
+    where it is not available"""
+    try:
+        with open('/proc/stat', 'r') as f:
+            fields = [int(v) for v in f.readline().split()[1:]]
+    except (IOError, OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # idle + iowait
+    return sum(fields[:8]) - idle, sum(fields[:8])
@@ -0,0 +1,395 @@
+"""Asynchronous headless detection pipeline
+
+    source --capture--> [queue] --batched inference--> [queue] --sink-->
+
+Every stage runs in its own thread, connected by bounded queues. When a
+queue is full its drop policy decides what happens:
+    block        the producer waits (offline: every frame is processed)
+    drop_oldest  the oldest queued frame is discarded (live: stay current)
+    drop_newest  the incoming frame is discarded
+
+Sources yield (name, BGR frame): VideoSource (video file or webcam index)
+and ImageDirSource. Sinks consume the processed Frame objects: JSONLSink writes one json
+line per frame, ImageSink / VideoSink write the frames with the boxes drawn.
+Pipeline.run() returns the end-to-end FPS, the per-stage latencies and the
+number of dropped frames, see PipelineStats. An exception in any stage
+(source, detector or sink) closes the queues, so the other stages stop, and
+is raised again by run().
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import threading
+import collections
+import cv2
+import numpy as np
+import torch
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+class Frame(object):
+    """A captured frame and the time it spent in every stage"""
+
+    def __init__(self, index, name, image):
+        self.index = index
+        self.name = name
+        self.image = image
+        self.times = {'capture': time.time()}
+        self.detections = None
+
+
+class DropQueue(object):
+    """Bounded FIFO with a drop policy, see the module docstring"""
+
+    POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, maxsize, policy='block'):
+        if policy not in self.POLICIES:
+            raise ValueError('Unknown drop policy: %s' % policy)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = collections.deque()
+        self.dropped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, item, force=False):
+        """Queue `item`; `force` (end of stream marker) always blocks.
+        A closed queue discards the item."""
+        with self.cond:
+            if self.closed:
+                return
+            if len(self.items) >= self.maxsize:
+                if self.policy == 'block' or force:
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.cond.wait()
+                    if self.closed:
+                        return
+                elif self.policy == 'drop_oldest':
+                    self.items.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += 1
+                    return
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def get(self, timeout=None):
+        """Next item, or raise IndexError after `timeout` seconds; None (end
+        of stream) once a closed queue is empty"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items or self.closed, timeout):
+                raise IndexError('queue empty')
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        """Wake every waiting put() and get(), discard further items"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class VideoSource(object):
+    """Frames of a video file, or of a webcam when `path` is a device index"""
+
+    def __init__(self, path):
+        self.path = int(path) if str(path).isdigit() else path
+        self.capture = cv2.VideoCapture(self.path)
+        if not self.capture.isOpened():
+            raise IOError('Cannot open video source %s' % path)
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 25.
+
+    def __iter__(self):
+        index = 0
+        try:
+            while True:
+                ok, image = self.capture.read()
+                if not ok:
+                    return
+                yield '%06d' % index, image
+                index += 1
+        finally:
+            self.capture.release()
+
+
+class ImageDirSource(object):
+    """Images of a directory in file name order"""
+
+    def __init__(self, path):
+        self.path = path
+        self.files = sorted(f for f in os.listdir(path)
+                            if f.lower().endswith(IMAGE_EXTENSIONS))
+        self.fps = 25.
+
+    def __iter__(self):
+        for f in self.files:
+            image = cv2.imread(os.path.join(self.path, f), cv2.IMREAD_COLOR)
+            if image is not None:
+                yield os.path.splitext(f)[0], image
+
+
+def open_source(path):
+    """VideoSource or ImageDirSource for a path / webcam index"""
+    if os.path.isdir(str(path)):
+        return ImageDirSource(path)
+    return VideoSource(path)
+
+
+def draw(image, detections, labelmap):
+    """Draw (label, score, x1, y1, x2, y2) detections on a copy of image"""
+    image = image.copy()
+    for label, score, x1, y1, x2, y2 in detections:
+        color = COLORS[label % 3]
+        cv2.rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
+        cv2.putText(image, '%s: %.2f' % (labelmap[label - 1], score),
+                    (int(x1), int(y1)), FONT, 0.6, (255, 255, 255), 1,
+                    cv2.LINE_AA)
+    return image
+
+
+class JSONLSink(object):
+    """One json line per frame: name, index, detections (label, score, box)
+    in pixels; `path` '-' writes to stdout"""
+
+    def __init__(self, path, labelmap):
+        self.file = sys.stdout if path == '-' else open(path, 'w')
+        self.labelmap = labelmap
+
+    def write(self, frame):
+        self.file.write(json.dumps({
+            'frame': frame.index, 'name': frame.name,
+            'detections': [{'label': self.labelmap[label - 1],
+                            'score': round(score, 4),
+                            'box': [round(v, 1) for v in box]}
+                           for label, score, *box in frame.detections]}) + '\n')
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+class ImageSink(object):
+    """Annotated frames written as <dir>/<name>.jpg"""
+
+    def __init__(self, path, labelmap):
+        self.path = path
+        self.labelmap = labelmap
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def write(self, frame):
+        cv2.imwrite(os.path.join(self.path, frame.name + '.jpg'),
+                    draw(frame.image, frame.detections, self.labelmap))
+
+    def close(self):
+        pass
+
+
+class VideoSink(object):
+    """Annotated frames written to a video file, resized to the size of the
+    first frame"""
+
+    def __init__(self, path, labelmap, fps=25.):
+        self.path = path
+        self.labelmap = labelmap
+        self.fps = fps
+        self.size = None
+        self.writer = None
+
+    def write(self, frame):
+        image = draw(frame.image, frame.detections, self.labelmap)
+        if self.writer is None:
+            self.size = image.shape[1], image.shape[0]
+            self.writer = cv2.VideoWriter(
+                self.path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, self.size)
+        if (image.shape[1], image.shape[0]) != self.size:
+            image = cv2.resize(image, self.size)
+        self.writer.write(image)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+
+class PipelineStats(object):
+    """Frame counts and latencies collected by the sink stage"""
+
+    STAGES = (('capture queue', 'capture', 'infer_start'),
+              ('inference', 'infer_start', 'infer_end'),
+              ('result queue', 'infer_end', 'sink_start'),
+              ('sink', 'sink_start', 'sink_end'),
+              ('end-to-end', 'capture', 'sink_end'))
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.frames = 0
+        self.batches = []
+        self.start = self.end = time.time()
+        self.dropped = {}
+
+    def add(self, frame):
+        self.frames += 1
+        for name, begin, end in self.STAGES:
+            self.latencies[name].append(frame.times[end] - frame.times[begin])
+
+    @property
+    def fps(self):
+        return self.frames / max(self.end - self.start, 1e-9)
+
+    def report(self):
+        lines = ['frames: {:d} | dropped: {} | mean batch: {:.2f} | '
+                 'FPS: {:.2f}'.format(self.frames, self.dropped,
+                                      np.mean(self.batches) if self.batches else 0,
+                                      self.fps)]
+        for name, _, _ in self.STAGES:
+            ms = np.array(self.latencies[name] or [0.]) * 1000
+            lines.append('{:14s} latency ms | mean {:8.2f} | p50 {:8.2f} | '
+                         'p95 {:8.2f}'.format(name, ms.mean(),
+                                              np.percentile(ms, 50),
+                                              np.percentile(ms, 95)))
+        return '\n'.join(lines)
+
+
+class Pipeline(object):
+    """Capture, batched inference and sink stages of a test phase SSD
+
+    Arguments:
+        detector: callable [batch,3,size,size] -> [batch,num_classes,top_k,5],
+            e.g. the SSD or utils.cpu_inference.CPUInference
+        transform: BaseTransform of the network input
+        source: iterable of (name, BGR image), see open_source()
+        sinks (list): objects with write(frame) and close()
+        batch_size (int): maximum frames per forward pass
+        max_wait (float): seconds inference waits to fill a batch
+        queue_size (int): capacity of the capture and result queues
+        capture_policy / result_policy (string): drop policy of the queues
+        thresh (float): minimum score of a reported detection
+    """
+
+    def __init__(self, detector, transform, source, sinks, batch_size=4,
+                 max_wait=0.01, queue_size=8, capture_policy='block',
+                 result_policy='block', thresh=0.6):
+        self.detector = detector
+        self.transform = transform
+        self.source = source
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.thresh = thresh
+        self.captured = DropQueue(queue_size, capture_policy)
+        self.results = DropQueue(queue_size, result_policy)
+        self.stats = PipelineStats()
+        self.error = None
+        self.lock = threading.Lock()
+
+    def _fail(self, error):
+        """Keep the first error of any stage and close the queues, so no
+        stage blocks on a stage that is gone"""
+        with self.lock:
+            if self.error is None:
+                self.error = error
+        self.captured.close()
+        self.results.close()
+
+    def _capture(self):
+        try:
+            for index, (name, image) in enumerate(self.source):
+                if self.error is not None:
+                    break
+                self.captured.put(Frame(index, name, image))
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self.captured.put(None, force=True)
+
+    def _batch(self):
+        """Block for one frame, then take what arrives within max_wait"""
+        frames = [self.captured.get()]
+        deadline = time.time() + self.max_wait
+        while frames[-1] is not None and len(frames) < self.batch_size:
+            try:
+                frames.append(self.captured.get(max(deadline - time.time(), 0)))
+            except IndexError:
+                break
+        return frames
+
+    def _infer(self):
+        try:
+            self._infer_batches()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self.results.put(None, force=True)
+
+    def _infer_batches(self):
+        done = False
+        while not done:
+            frames = self._batch()
+            if frames[-1] is None:
+                frames.pop()
+                done = True
+            if not frames:
+                break
+            start = time.time()
+            x = torch.stack([torch.from_numpy(self.transform(f.image)[0][:, :, (2, 1, 0)])
+                             .permute(2, 0, 1) for f in frames], 0)
+            with torch.no_grad():
+                detections = self.detector(x).cpu().numpy()
+            end = time.time()
+            self.stats.batches.append(len(frames))
+            for frame, dets in zip(frames, detections):
+                frame.times['infer_start'] = start
+                frame.times['infer_end'] = end
+                h, w = frame.image.shape[:2]
+                cls, idx = np.nonzero(dets[:, :, 0] >= self.thresh)
+                boxes = dets[cls, idx, 1:] * (w, h, w, h)
+                frame.detections = [(int(c), float(s)) + tuple(map(float, b))
+                                    for c, s, b in zip(cls, dets[cls, idx, 0], boxes)]
+                self.results.put(frame)
+
+    def _sink(self):
+        while True:
+            frame = self.results.get()
+            if frame is None:
+                break
+            frame.times['sink_start'] = time.time()
+            for sink in self.sinks:
+                sink.write(frame)
+            frame.times['sink_end'] = time.time()
+            self.stats.add(frame)
+
+    def run(self):
+        """Run until the source is exhausted, return the PipelineStats;
+        raises the first exception of any stage"""
+        self.stats = PipelineStats()
+        self.error = None
+        threads = [threading.Thread(target=self._capture, daemon=True),
+                   threading.Thread(target=self._infer, daemon=True)]
+        for thread in threads:
+            thread.start()
+        try:
+            self._sink()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for sink in self.sinks:
+                sink.close()
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        self.stats.end = time.time()
+        self.stats.dropped = {'capture': self.captured.dropped,
+                              'result': self.results.dropped}
+        return self.stats
@@ -0,0 +1,128 @@
+"""Post-training static INT8 quantization of a test phase SSD
+
+Eager mode flow of torch.ao.quantization:
+  1. QuantizableSSD wraps the layers of an SSD with QuantStub/DeQuantStub,
+     so vgg, extras and the loc/conf heads run quantized while L2Norm,
+     softmax and Detect stay in float
+  2. every conv followed by a ReLU is fused into one ConvReLU2d
+  3. observers collect activation ranges on calibration images
+  4. convert() replaces the observed modules by their INT8 versions
+
+    qnet = quantize_ssd(net, calibration_batches)
+    torch.save(qnet.state_dict(), 'weights/ssd300_int8.pth')
+    qnet = load_quantized_ssd('weights/ssd300_int8.pth')
+"""
+import copy
+import torch
+import torch.nn as nn
+from torch.ao import quantization
+
+
+class QuantizableSSD(nn.Module):
+    """Test phase SSD with quantization stubs around the quantized parts
+
+    Arguments:
+        net (SSD): test phase SSD, its layers are shared, not copied
+    """
+
+    def __init__(self, net):
+        super(QuantizableSSD, self).__init__()
+        self.num_classes = net.num_classes
+        self.size = net.size
+        self.register_buffer('priors', net.priors, persistent=False)
+        self.vgg = net.vgg
+        self.L2Norm = net.L2Norm
+        # the extras are applied with F.relu in SSD.forward, a ReLU module
+        # after every conv lets them be fused and quantized
+        self.extras = nn.ModuleList([nn.Sequential(conv, nn.ReLU(inplace=True))
+                                     for conv in net.extras])
+        self.loc = net.loc
+        self.conf = net.conf
+        self.softmax = net.softmax
+        self.detect = net.detect
+        self.quant = quantization.QuantStub()
+        # L2Norm runs in float between its own dequant and quant stubs
+        self.l2norm_dequant = quantization.DeQuantStub()
+        self.l2norm_quant = quantization.QuantStub()
+        self.dequant = quantization.DeQuantStub()
+
+    def fuse(self):
+        """Fuse every conv + ReLU pair of vgg and extras"""
+        pairs = [['vgg.%d' % k, 'vgg.%d' % (k + 1)]
+                 for k in range(len(self.vgg) - 1)
+                 if isinstance(self.vgg[k], nn.Conv2d) and
+                 isinstance(self.vgg[k + 1], nn.ReLU)]
+        pairs += [['extras.%d.0' % k, 'extras.%d.1' % k]
+                  for k in range(len(self.extras))]
+        quantization.fuse_modules(self, pairs, inplace=True)
+        return self
+
+    def forward(self, x):
+        """Same computation as SSD.forward in the test phase"""
+        sources = list()
+        loc = list()
+        conf = list()
+
+        x = self.quant(x)
+        # apply vgg up to conv4_3 relu
+        for k in range(23):
+            x = self.vgg[k](x)
+
+        s = self.l2norm_quant(self.L2Norm(self.l2norm_dequant(x)))
+        sources.append(s)
+
+        # apply vgg up to fc7
+        for k in range(23, len(self.vgg)):
+            x = self.vgg[k](x)
+        sources.append(x)
+
+        # apply extra layers and cache source layer outputs
+        for k, v in enumerate(self.extras):
+            x = v(x)
+            if k % 2 == 1:
+                sources.append(x)
+
+        # apply multibox head to source layers, back to float
+        for (x, l, c) in zip(sources, self.loc, self.conf):
+            loc.append(self.dequant(l(x)).permute(0, 2, 3, 1).contiguous())
+            conf.append(self.dequant(c(x)).permute(0, 2, 3, 1).contiguous())
+
+        loc = torch.cat([o.view(o.size(0), -1) for o in loc], 1)
+        conf = torch.cat([o.view(o.size(0), -1) for o in conf], 1)
+        return self.detect(
+            loc.view(loc.size(0), -1, 4),
+            self.softmax(conf.view(conf.size(0), -1, self.num_classes)),
+            self.priors
+        )
+
+
+def prepare_ssd(net, backend='x86'):
+    """Copy of the test phase `net` fused and with observers inserted"""
+    torch.backends.quantized.engine = backend
+    qnet = QuantizableSSD(copy.deepcopy(net).cpu()).eval().fuse()
+    qnet.qconfig = quantization.get_default_qconfig(backend)
+    # stay in float
+    qnet.L2Norm.qconfig = None
+    qnet.softmax.qconfig = None
+    qnet.detect.qconfig = None
+    quantization.prepare(qnet, inplace=True)
+    return qnet
+
+
+def quantize_ssd(net, calibration_batches, backend='x86'):
+    """INT8 copy of the test phase `net`, activation ranges calibrated on
+    the [batch,3,size,size] image batches of `calibration_batches`"""
+    qnet = prepare_ssd(net, backend)
+    with torch.no_grad():
+        for images in calibration_batches:
+            qnet(images)
+    return quantization.convert(qnet, inplace=True)
+
+
+def load_quantized_ssd(path, size=300, num_classes=21, backend='x86'):
+    """Load a checkpoint saved from the state_dict of quantize_ssd()"""
+    from ssd import build_ssd
+    qnet = quantization.convert(prepare_ssd(build_ssd('test', size, num_classes),
+                                            backend), inplace=True)
+    qnet.load_state_dict(torch.load(path, map_location='cpu'))
+    return qnet.eval()
@@ -0,0 +1,111 @@
+"""Cache of the raw SSD head outputs of a whole evaluation set
+
+eval.py --raw_outputs <dir> stores the inputs of the Detect layer of every
+image, so post-processing parameters (conf_thresh, nms_thresh, top_k) can be
+swept with sweep.py without running the network again:
+
+    loc.npy     float16 [num_images,num_priors,4]            loc preds
+    conf.npy    float16 [num_images,num_priors,num_classes]  softmax scores
+                (float32 with eval.py --raw_dtype float32)
+    priors.npy  float32 [num_priors,4]                       default boxes
+    sizes.npy   int32   [num_images,2]                       height, width
+    meta.json   ids, voc_root, image_sets and variance
+
+float16 halves the files (about 1.8GB of scores for VOC07 test with
+SSD300) and they are read back with np.load(mmap_mode='r'), so every sweep
+worker pages in the outputs instead of holding a copy.
+
+float16 is lossy: scores and box offsets are rounded to 11 significant
+bits, which moves scores across conf_thresh, reorders near ties and shifts
+boxes slightly. The mAP of sweep.py on a float16 cache can therefore differ
+from the mAP eval.py gives for the same settings (typically in the 4th
+decimal). Write the cache with dtype float32 (eval.py --raw_dtype float32)
+to reproduce eval.py exactly, at twice the size.
+"""
+import os
+import os.path as osp
+import json
+import shutil
+import numpy as np
+
+
+class RawOutputWriter(object):
+    """Writes the outputs batch by batch into preallocated .npy memory maps
+
+    Arguments:
+        path (string): cache directory, replaced when close() is called
+        num_images (int): number of images of the evaluation set
+        priors (tensor): [num_priors,4] default boxes of the network
+        num_classes (int): number of classes, including the background
+        dtype (string): float16 (default, lossy) or float32 loc/conf files
+    """
+
+    def __init__(self, path, num_images, priors, num_classes, dtype='float16'):
+        self.path = path
+        # written into a temporary directory, renamed in close()
+        self.tmp_path = path + '.tmp%d' % os.getpid()
+        os.makedirs(self.tmp_path)
+        num_priors = priors.size(0)
+        np.save(osp.join(self.tmp_path, 'priors.npy'),
+                priors.detach().cpu().float().numpy())
+        self.loc = np.lib.format.open_memmap(
+            osp.join(self.tmp_path, 'loc.npy'), mode='w+', dtype=dtype,
+            shape=(num_images, num_priors, 4))
+        self.conf = np.lib.format.open_memmap(
+            osp.join(self.tmp_path, 'conf.npy'), mode='w+', dtype=dtype,
+            shape=(num_images, num_priors, num_classes))
+        self.count = 0
+
+    def append(self, loc, conf):
+        """Append the [batch,num_priors,4] loc and [batch,num_priors,num_classes]
+        conf outputs of the next batch of images"""
+        num = loc.size(0)
+        self.loc[self.count:self.count + num] = \
+            loc.detach().view(num, -1, 4).cpu().numpy()
+        self.conf[self.count:self.count + num] = \
+            conf.detach().view(num, self.conf.shape[1], -1).cpu().numpy()
+        self.count += num
+
+    def close(self, sizes, **meta):
+        """Flush the memory maps and publish the cache
+
+        Arguments:
+            sizes (list): (height, width) of every image
+            meta: json serializable fields, e.g. ids, voc_root, variance
+        """
+        self.loc.flush()
+        self.conf.flush()
+        self.loc = self.conf = None
+        np.save(osp.join(self.tmp_path, 'sizes.npy'),
+                np.asarray(sizes, dtype=np.int32).reshape(-1, 2))
+        with open(osp.join(self.tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        if osp.exists(self.path):
+            shutil.rmtree(self.path)
+        os.rename(self.tmp_path, self.path)
+        return RawOutputs(self.path)
+
+
+class RawOutputs(object):
+    """Read-only view of a cache written by RawOutputWriter
+
+    Arguments:
+        path (string): cache directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(osp.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.loc = np.load(osp.join(path, 'loc.npy'), mmap_mode='r')
+        self.conf = np.load(osp.join(path, 'conf.npy'), mmap_mode='r')
+        self.priors = np.load(osp.join(path, 'priors.npy'))
+        self.sizes = np.load(osp.join(path, 'sizes.npy'))
+
+    def __len__(self):
+        return self.loc.shape[0]
+
+    def batch(self, start, end):
+        """float32 (loc, conf) arrays of images start:end"""
+        return (np.asarray(self.loc[start:end], dtype=np.float32),
+                np.asarray(self.conf[start:end], dtype=np.float32))
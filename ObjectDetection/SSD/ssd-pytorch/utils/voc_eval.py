@@ -0,0 +1,249 @@
+"""In-memory PASCAL VOC evaluation
+
+Evaluates the all_boxes[cls][image] structure of eval.py::test_net, or the
+flat detection columns of utils.detection_store, directly without writing
+and re-reading the per-class detection text files:
+  - the ground truth of every class is grouped once per image from the
+    dataset's AnnotationStore
+  - detections are matched to the ground truth with vectorized IoU, and
+    the "first detection of a ground truth box" rule of voc_eval is
+    resolved with np.unique instead of a loop over detections
+  - classes are evaluated in parallel worker processes
+
+Scores and boxes are rounded exactly like the text files written by
+write_voc_results_file ('%.3f' scores, '%.1f' 1-based boxes) and kept in
+file order, so the APs are the same as eval.py's text file voc_eval.
+"""
+from multiprocessing import Pool
+import numpy as np
+
+
+def voc_ap(rec, prec, use_07_metric=True):
+    """ ap = voc_ap(rec, prec, [use_07_metric])
+    Compute VOC AP given precision and recall.
+    If use_07_metric is true, uses the
+    VOC 07 11 point method (default:True).
+    """
+    if use_07_metric:
+        # 11 point metric
+        ap = 0.
+        for t in np.arange(0., 1.1, 0.1):
+            if np.sum(rec >= t) == 0:
+                p = 0
+            else:
+                p = np.max(prec[rec >= t])
+            ap = ap + p / 11.
+    else:
+        # correct AP calculation
+        # first append sentinel values at the end
+        mrec = np.concatenate(([0.], rec, [1.]))
+        mpre = np.concatenate(([0.], prec, [0.]))
+
+        # compute the precision envelope
+        for i in range(mpre.size - 1, 0, -1):
+            mpre[i - 1] = np.maximum(mpre[i - 1], mpre[i])
+
+        # to calculate area under PR curve, look for points
+        # where X axis (recall) changes value
+        i = np.where(mrec[1:] != mrec[:-1])[0]
+
+        # and sum (\Delta recall) * prec
+        ap = np.sum((mrec[i + 1] - mrec[i]) * mpre[i + 1])
+    return ap
+
+
+def add_detections(all_boxes, detections, sizes, start):
+    """Store the [batch,num_classes,top_k,5] output of the Detect layer of
+    images start:start+batch into all_boxes[cls][image] as N x 5 float32
+    (x1, y1, x2, y2, score) arrays in pixels of the original (h, w) sizes"""
+    for i, (dets_i, (h, w)) in enumerate(zip(detections, sizes), start):
+        scale = np.array([w, h, w, h], dtype=np.float32)
+        # skip j = 0, because it's the background class
+        for j in range(1, dets_i.shape[0]):
+            dets = dets_i[j][dets_i[j][:, 0] > 0.]
+            if dets.shape[0] == 0:
+                continue
+            all_boxes[j][i] = np.hstack((dets[:, 1:] * scale,
+                                         dets[:, :1])).astype(np.float32, copy=False)
+
+
+def detection_columns(detections, sizes, start):
+    """Same detections as add_detections(), as flat columns: image index [N],
+    class [N], score [N] and pixel boxes [N,4], in the order all_boxes keeps
+    them (image, then class, then Detect layer order)"""
+    scale = np.array([[w, h, w, h] for h, w in sizes], dtype=np.float32)
+    # skip class 0, because it's the background class
+    image, label, k = np.nonzero(detections[:, 1:, :, 0] > 0.)
+    dets = detections[image, label + 1, k]
+    return {'image': (image + start).astype(np.int32),
+            'label': (label + 1).astype(np.int16),
+            'score': dets[:, 0].astype(np.float32),
+            'boxes': (dets[:, 1:] * scale[image]).astype(np.float32, copy=False)}
+
+
+def all_boxes_from_columns(columns, num_images, num_classes):
+    """all_boxes[cls][image] lists of N x 5 arrays of detection columns"""
+    all_boxes = [[[] for _ in range(num_images)] for _ in range(num_classes)]
+    dets = np.hstack((columns['boxes'], columns['score'][:, None]))
+    order = np.lexsort((columns['image'], columns['label']))  # stable
+    keys = columns['label'][order].astype(np.int64) * num_images + columns['image'][order]
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    for rows in np.split(order, bounds) if len(order) else []:
+        all_boxes[columns['label'][rows[0]]][columns['image'][rows[0]]] = dets[rows]
+    return all_boxes
+
+
+def ground_truth_from_store(store, classes=None):
+    """Flat ground truth of every image of an AnnotationStore:
+    image index [N], label [N], integer pixel boxes as float [N,4] and
+    difficult flags [N], the same boxes eval.py::parse_rec reads.
+    With `classes`, labels are mapped from the store's meta['classes'] to
+    indices into `classes` (-1 for classes not in the list)."""
+    columns = store.columns
+    counts = np.diff(columns['offsets'])
+    labels = np.asarray(columns['labels'], dtype=np.int64)
+    if classes is not None:
+        lut = np.array([classes.index(c) if c in classes else -1
+                        for c in store.meta['classes']] + [-1])
+        labels = lut[labels]
+    return {'image': np.repeat(np.arange(len(counts)), counts),
+            'label': labels,
+            'boxes': np.asarray(columns['boxes']).astype(int).astype(float),
+            'difficult': np.asarray(columns['difficult'], dtype=bool)}
+
+
+def quantize_detections(dets):
+    """Round [N,5] (x1, y1, x2, y2, score) float32 detections like the text
+    files: boxes written 1-based with '%.1f', scores with '%.3f'.
+    float32 values times 10 or 1000 are exact in float64, so np.round
+    (round half to even on the exact value) matches the string formatting.
+    """
+    boxes = (dets[:, :4] + 1).astype(np.float64)  # +1 in float32, as written
+    scores = dets[:, 4].astype(np.float64)
+    return np.round(boxes * 10) / 10, np.round(scores * 1000) / 1000
+
+
+def class_ap(task):
+    """rec, prec, ap of one class, same as eval.py::voc_eval
+    task: (image index [N] and N x 5 detections of the class in file order,
+    ground truth of the class, number of images, ovthresh, use_07_metric)"""
+    image_ids, dets, gt, num_images, ovthresh, use_07_metric = task
+    npos = int(np.sum(~gt['difficult']))
+
+    image_ids = np.asarray(image_ids, dtype=np.int64)
+    if len(image_ids) == 0:
+        return -1., -1., -1.
+    BB, confidence = quantize_detections(dets)
+
+    # sort by confidence, same (unstable) argsort of the same array
+    sorted_ind = np.argsort(-confidence)
+    BB = BB[sorted_ind, :]
+    image_ids = image_ids[sorted_ind]
+    nd = len(image_ids)
+
+    # ground truth of every image padded to [num_images, max_gt, 4]
+    counts = np.bincount(gt['image'], minlength=num_images)
+    max_gt = max(int(counts.max()) if len(counts) else 0, 1)
+    order = np.argsort(gt['image'], kind='stable')
+    slot = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+    BBGT = np.zeros((num_images, max_gt, 4))
+    BBGT[gt['image'][order], slot] = gt['boxes'][order]
+    difficult = np.zeros((num_images, max_gt), dtype=bool)
+    difficult[gt['image'][order], slot] = gt['difficult'][order]
+    valid = np.arange(max_gt)[None, :] < counts[:, None]
+
+    # overlaps of every detection with the ground truth of its image
+    G = BBGT[image_ids]
+    bb = BB[:, None, :]
+    ixmin = np.maximum(G[:, :, 0], bb[:, :, 0])
+    iymin = np.maximum(G[:, :, 1], bb[:, :, 1])
+    ixmax = np.minimum(G[:, :, 2], bb[:, :, 2])
+    iymax = np.minimum(G[:, :, 3], bb[:, :, 3])
+    iw = np.maximum(ixmax - ixmin, 0.)
+    ih = np.maximum(iymax - iymin, 0.)
+    inters = iw * ih
+    uni = ((bb[:, :, 2] - bb[:, :, 0]) * (bb[:, :, 3] - bb[:, :, 1]) +
+           (G[:, :, 2] - G[:, :, 0]) *
+           (G[:, :, 3] - G[:, :, 1]) - inters)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overlaps = np.where(valid[image_ids], inters / uni, -np.inf)
+    jmax = np.argmax(overlaps, 1)
+    ovmax = overlaps[np.arange(nd), jmax]
+
+    # a non difficult ground truth box is a TP for the first (highest
+    # scoring) detection matching it and a FP for every later one;
+    # detections matching difficult boxes are ignored
+    hit = ovmax > ovthresh
+    hit_difficult = hit & difficult[image_ids, jmax]
+    candidates = np.where(hit & ~hit_difficult)[0]
+    _, first = np.unique(image_ids[candidates] * max_gt + jmax[candidates],
+                         return_index=True)
+    tp = np.zeros(nd)
+    tp[candidates[first]] = 1.
+    fp = 1. - tp
+    fp[hit_difficult] = 0.
+
+    # compute precision recall
+    fp = np.cumsum(fp)
+    tp = np.cumsum(tp)
+    rec = tp / float(npos)
+    # avoid divide by zero in case the first detection matches a difficult
+    # ground truth
+    prec = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+    ap = voc_ap(rec, prec, use_07_metric)
+    return rec, prec, ap
+
+
+def _evaluate(tasks, processes):
+    # tasks may be a generator: evaluated one class at a time without workers
+    if processes == 1:
+        return [class_ap(task) for task in tasks]
+    pool = Pool(processes)
+    try:
+        return pool.map(class_ap, list(tasks))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def evaluate_all_boxes(all_boxes, gt, ovthresh=0.5, use_07_metric=True,
+                       processes=None):
+    """rec, prec, ap of every class of all_boxes[cls][image] (class 0 is the
+    background and skipped), classes evaluated in `processes` workers
+    Args:
+        all_boxes: all_boxes[cls][image] = N x 5 array (x1, y1, x2, y2, score)
+            or [] , as built by eval.py::test_net
+        gt: ground truth, see ground_truth_from_store(); labels are
+            0-based, all_boxes class cls has label cls - 1
+    """
+    num_images = len(all_boxes[0])
+    tasks = []
+    for cls in range(1, len(all_boxes)):
+        cls_dets = all_boxes[cls]
+        image_ids = np.concatenate([np.full(len(d), i, dtype=np.int64)
+                                    for i, d in enumerate(cls_dets)] + [np.zeros(0, np.int64)])
+        dets = np.concatenate([d for d in cls_dets if len(d)] +
+                              [np.zeros((0, 5), np.float32)]).reshape(-1, 5)
+        mask = gt['label'] == cls - 1
+        tasks.append((image_ids, dets, {k: v[mask] for k, v in gt.items()},
+                      num_images, ovthresh, use_07_metric))
+    return _evaluate(tasks, processes)
+
+
+def evaluate_columns(columns, gt, num_images, num_classes, ovthresh=0.5,
+                     use_07_metric=True, processes=None):
+    """Same as evaluate_all_boxes(), from detection columns (see
+    detection_columns() and utils.detection_store)"""
+    # rows of every class in image order, as in the results files
+    order = np.argsort(columns['label'], kind='stable')
+    bounds = np.searchsorted(columns['label'][order], np.arange(num_classes + 1))
+
+    def tasks():
+        for cls in range(1, num_classes):
+            rows = order[bounds[cls]:bounds[cls + 1]]
+            mask = gt['label'] == cls - 1
+            yield (columns['image'][rows],
+                   np.hstack((columns['boxes'][rows], columns['score'][rows, None])),
+                   {k: v[mask] for k, v in gt.items()},
+                   num_images, ovthresh, use_07_metric)
+    return _evaluate(tasks(), processes)
@@ -14,6 +14,10 @@ __C.YOLO                      = edict()
 __C.YOLO.CLASSES              = "./data/classes/voc.names"            # voc.names  coco.names
 __C.YOLO.ANCHORS              = "./data/anchors/basline_anchors.txt"   # 先验框的尺寸，每种采样率下各3个尺寸，共计3×3 = 9种尺寸比例(此基准尺寸需要乘以8,16,32进行还原)
 __C.YOLO.STRIDES              = [8, 16, 32]
+# 设为True则使用YOLOv3-tiny(2种采样率16,32)，适合CPU上的低延迟推理；测试时需搭配yolov3-tiny.weights
+__C.YOLO.TINY                 = False
+__C.YOLO.ANCHORS_TINY         = "./data/anchors/tiny_anchors.txt"      # tiny的先验框，每种采样率下各3个尺寸，共计2×3 = 6种(需要乘以16,32进行还原)
+__C.YOLO.STRIDES_TINY         = [16, 32]
 __C.YOLO.ANCHOR_PER_SCALE     = 3
 __C.YOLO.IOU_LOSS_THRESH      = 0.5
 
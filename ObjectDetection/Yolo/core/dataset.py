@@ -18,10 +18,13 @@ class Dataset(object):
         self.data_aug    = cfg.TRAIN.DATA_AUG   if dataset_type == 'train' else cfg.TEST.DATA_AUG
 
         self.train_input_sizes = cfg.TRAIN.INPUT_SIZE                # 输入图像尺寸
-        self.strides = np.array(cfg.YOLO.STRIDES)                    # FPN采样尺寸：[8, 16, 32]
+        # FPN采样尺寸：[8, 16, 32]，YOLOv3-tiny则为[16, 32]
+        self.strides = np.array(cfg.YOLO.STRIDES_TINY if cfg.YOLO.TINY else cfg.YOLO.STRIDES)
+        self.num_scales = len(self.strides)                          # 采样率的个数
         self.classes = utils.read_class_names(cfg.YOLO.CLASSES)  
         self.num_classes = len(self.classes)                         # 图像类别总数
-        self.anchors = np.array(utils.get_anchors(cfg.YOLO.ANCHORS)) # 9种尺寸的先验框anchor box
+        # 9种(tiny为6种)尺寸的先验框anchor box
+        self.anchors = np.array(utils.get_anchors(cfg.YOLO.ANCHORS_TINY if cfg.YOLO.TINY else cfg.YOLO.ANCHORS))
         self.anchor_per_scale = cfg.YOLO.ANCHOR_PER_SCALE            # 每个网格中anchor的个数，值 = 3
         self.max_bbox_per_scale = 150                                # 每个采样率下许存在的目标框最大数量
 
@@ -48,17 +51,12 @@ class Dataset(object):
             self.train_output_sizes = self.train_input_size // self.strides  # 输出图片尺寸 = 输入//下采样缩放倍数
 
             batch_image = np.zeros((self.batch_size, self.train_input_size, self.train_input_size, 3), dtype=np.float32)
-            # 这里s,m,l分别对应三种下采样缩放率8,16,32
-            batch_label_sbbox = np.zeros((self.batch_size, self.train_output_sizes[0], self.train_output_sizes[0],
-                                          self.anchor_per_scale, 5 + self.num_classes), dtype=np.float32)
-            batch_label_mbbox = np.zeros((self.batch_size, self.train_output_sizes[1], self.train_output_sizes[1],
-                                          self.anchor_per_scale, 5 + self.num_classes), dtype=np.float32)
-            batch_label_lbbox = np.zeros((self.batch_size, self.train_output_sizes[2], self.train_output_sizes[2],
-                                          self.anchor_per_scale, 5 + self.num_classes), dtype=np.float32)
-
-            batch_sbboxes = np.zeros((self.batch_size, self.max_bbox_per_scale, 4), dtype=np.float32)
-            batch_mbboxes = np.zeros((self.batch_size, self.max_bbox_per_scale, 4), dtype=np.float32)
-            batch_lbboxes = np.zeros((self.batch_size, self.max_bbox_per_scale, 4), dtype=np.float32)
+            # 每种下采样缩放率(8,16,32)各对应一组label和bboxes
+            batch_label = [np.zeros((self.batch_size, self.train_output_sizes[i], self.train_output_sizes[i],
+                                     self.anchor_per_scale, 5 + self.num_classes), dtype=np.float32)
+                           for i in range(self.num_scales)]
+            batch_bboxes = [np.zeros((self.batch_size, self.max_bbox_per_scale, 4), dtype=np.float32)
+                            for _ in range(self.num_scales)]
 
             num = 0
             if self.batch_count < self.num_batchs:
@@ -67,22 +65,18 @@ class Dataset(object):
                     if index >= self.num_samples: index -= self.num_samples
                     annotation = self.annotations[index]
                     image, bboxes = self.parse_annotation(annotation)
-                    # 根据给定的真实标记bbox来解析出三种采样率下对应的label和box
-                    label_sbbox, label_mbbox, label_lbbox, sbboxes, mbboxes, lbboxes = self.preprocess_true_boxes(bboxes)
+                    # 根据给定的真实标记bbox来解析出各采样率下对应的label和box
+                    labels, bboxes_xywh = self.preprocess_true_boxes(bboxes)
                     batch_image[num, :, :, :] = image
-                    batch_label_sbbox[num, :, :, :, :] = label_sbbox
-                    batch_label_mbbox[num, :, :, :, :] = label_mbbox
-                    batch_label_lbbox[num, :, :, :, :] = label_lbbox
-                    batch_sbboxes[num, :, :] = sbboxes
-                    batch_mbboxes[num, :, :] = mbboxes
-                    batch_lbboxes[num, :, :] = lbboxes
+                    for i in range(self.num_scales):
+                        batch_label[i][num, :, :, :, :] = labels[i]
+                        batch_bboxes[i][num, :, :] = bboxes_xywh[i]
                     num += 1
                 self.batch_count += 1
-                batch_smaller_target = batch_label_sbbox, batch_sbboxes
-                batch_medium_target  = batch_label_mbbox, batch_mbboxes
-                batch_larger_target  = batch_label_lbbox, batch_lbboxes
+                # 依次为smaller, medium, larger target
+                batch_target = tuple(zip(batch_label, batch_bboxes))
 
-                return batch_image, (batch_smaller_target, batch_medium_target, batch_larger_target)
+                return batch_image, batch_target
             else:
                 self.batch_count = 0
                 # 随机打乱annotation
@@ -188,19 +182,19 @@ class Dataset(object):
         return inter_area / union_area
 
     def preprocess_true_boxes(self, bboxes):
-        """根据给定的真实标记bbox来解析出三种采样率下对应的label和box
+        """根据给定的真实标记bbox来解析出各采样率下对应的label和box
            即用先验的anchor box来铆定对应的真实box
         """
         # label[i]的shape——(train_output_sizes × train_output_sizes × anchor_per_scale × (5 + num_classes))
         # 5 + num_classes：x,y,w,h,置信度 + num_classes:分类概率矩阵
         labels = [np.zeros((self.train_output_sizes[i], self.train_output_sizes[i], self.anchor_per_scale,
-                           5 + self.num_classes)) for i in range(3)]
+                           5 + self.num_classes)) for i in range(self.num_scales)]
 
         # bboxes_xywh[i]的shape——max_bbox_per_scale × 4
         # max_bbox_per_scale即该采样率下最多可以包含的真实box数量150；4即x,y,h,w
-        bboxes_xywh = [np.zeros((self.max_bbox_per_scale, 4)) for _ in range(3)] # [(150,4),(150,4),(150,4)]
-        # 三种采样率下bbox的数量，每种采样率下最多包含max_bbox_per_scale个box
-        bbox_count = np.zeros((3,))
+        bboxes_xywh = [np.zeros((self.max_bbox_per_scale, 4)) for _ in range(self.num_scales)] # [(150,4),(150,4),(150,4)]
+        # 各采样率下bbox的数量，每种采样率下最多包含max_bbox_per_scale个box
+        bbox_count = np.zeros((self.num_scales,))
         # 遍历真实标记的boxes,找到对应box在相应网格中的label（即充当label的anchor box）
         for bbox in bboxes:
             # 获取x_min, y_min, x_max, y_max
@@ -222,7 +216,7 @@ class Dataset(object):
             iou = []
             # 这里exist_positive表示标记的box所落在的网格中，存在和其iou值大于0.3的anchor box,即用此anchor来表示标记box
             exist_positive = False
-            for i in range(3):
+            for i in range(self.num_scales):
                 # 根据缩放后的bbox_xywh_scaled在3个缩放率下计算iou从而找到用来对应真实box的anchor box
                 anchors_xywh = np.zeros((self.anchor_per_scale, 4)) # shape 3×4，存放该下采样缩放率下的三个anchor box
                 # 定位anchor的x,y坐标位置(+0.5是神马意思？？？！！！)
@@ -274,10 +268,8 @@ class Dataset(object):
                 bbox_count[best_detect] += 1
 
 
-        label_sbbox, label_mbbox, label_lbbox = labels
-        sbboxes, mbboxes, lbboxes = bboxes_xywh
-        # 返回三个缩放尺度下的label，和true box数据对
-        return label_sbbox, label_mbbox, label_lbbox, sbboxes, mbboxes, lbboxes
+        # 返回各缩放尺度下的label，和true box数据对
+        return labels, bboxes_xywh
 
     def __len__(self):
         return self.num_batchs
\ No newline at end of file
@@ -0,0 +1,90 @@
+import numpy as np
+import tensorflow as tf
+import core.utils as utils
+from core import yolov3
+from core.config import cfg
+
+
+# detect()/detect_batch()返回的结构化数组格式：原图上的box坐标、分类置信度和类别index
+DETECTION_DTYPE = np.dtype([('xmin', np.float32), ('ymin', np.float32),
+                            ('xmax', np.float32), ('ymax', np.float32),
+                            ('score', np.float32), ('class_id', np.int32)])
+
+
+def to_bboxes(detections):
+    """将结构化数组转换回 [x_min, y_min, x_max, y_max, probability, cls_id] 格式，供utils.draw_bbox使用"""
+    bboxes = np.zeros((len(detections), 6), dtype=np.float32)
+    for i, name in enumerate(DETECTION_DTYPE.names):
+        bboxes[:, i] = detections[name]
+    return bboxes
+
+
+class YoloDetector(object):
+    """常驻内存的yolo检测器
+    模型只构建和加载一次，并在初始化时预热(trace)计算图，之后可以反复调用detect()/detect_batch()
+    letterbox >> predict >> postprocess >> nms 的流程由test.py和evaluate.py共用
+
+    Args:
+        model_path:      权重路径，tf格式(model.save_weights保存)或darknet的.weights
+        darknet:         True则按darknet格式加载权重(utils.load_weights)
+        input_size:      网络输入尺寸，默认416
+        score_threshold: 分类置信度阈值
+        iou_threshold:   nms的iou阈值
+    """
+    def __init__(self, model_path, darknet=False, input_size=cfg.TEST.INPUT_SIZE,
+                 score_threshold=cfg.TEST.SCORE_THRESHOLD, iou_threshold=cfg.TEST.IOU_THRESHOLD):
+        self.input_size = input_size
+        self.score_threshold = score_threshold
+        self.iou_threshold = iou_threshold
+
+        self.model = yolov3.build_for_test(input_size)
+        if darknet:
+            utils.load_weights(self.model, model_path, cfg.YOLO.TINY)
+        else:
+            self.model.load_weights(model_path)
+
+        # batch维度为None，任意batch size只trace一次
+        self._predict = tf.function(self._forward, input_signature=[
+            tf.TensorSpec([None, input_size, input_size, 3], tf.float32)])
+        self.warm_up()
+
+    def _forward(self, image_data):
+        """网络前向，并将各采样率下的输出拼接为 (batch, num_boxes, 5 + num_classes)"""
+        pred_bbox = self.model(image_data, training=False)
+        batch_size = tf.shape(image_data)[0]
+        pred_bbox = [tf.reshape(x, (batch_size, -1, tf.shape(x)[-1])) for x in pred_bbox]
+        return tf.concat(pred_bbox, axis=1)
+
+    def warm_up(self):
+        """用一张空白图预热计算图，避免第一次检测时的trace耗时"""
+        self._predict(tf.zeros((1, self.input_size, self.input_size, 3), dtype=tf.float32))
+
+    def preprocess(self, image):
+        """letterbox：等比缩放并填充到input_size × input_size"""
+        return utils.image_preporcess(np.copy(image), [self.input_size, self.input_size]).astype(np.float32)
+
+    def postprocess(self, pred_bbox, image_size):
+        """将单张图的预测结果还原到原图坐标，去掉低分box并做nms，返回 (N, 6) 的bboxes"""
+        bboxes = utils.postprocess_boxes(pred_bbox, image_size, self.input_size, self.score_threshold)
+        bboxes = utils.nms(bboxes, self.iou_threshold, method='nms')
+        return np.array(bboxes, dtype=np.float32).reshape(-1, 6)
+
+    def detect(self, image):
+        """检测单张RGB图片(任意尺寸)，返回DETECTION_DTYPE格式的结构化数组"""
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        """批量检测多张RGB图片(尺寸可以各不相同)，返回每张图的结构化数组列表"""
+        if len(images) == 0:
+            return []
+        image_data = np.stack([self.preprocess(image) for image in images], axis=0)
+        pred_bbox = self._predict(tf.constant(image_data)).numpy()
+
+        results = []
+        for i, image in enumerate(images):
+            bboxes = self.postprocess(pred_bbox[i], image.shape[:2])
+            detections = np.zeros(len(bboxes), dtype=DETECTION_DTYPE)
+            for j, name in enumerate(DETECTION_DTYPE.names):
+                detections[name] = bboxes[:, j]
+            results.append(detections)
+        return results
@@ -4,15 +4,21 @@ import colorsys
 import numpy as np
 from core.config import cfg
 
-def load_weights(model, weights_file):
+def load_weights(model, weights_file, tiny=False):
     """
     I agree that this code is very ugly, but I don’t know any better way of doing it.
+    tiny=True时加载yolov3-tiny.weights(13个卷积层，第9、12层为输出层)
     """
+    if tiny:
+        num_conv, output_layers = 13, [9, 12]
+    else:
+        num_conv, output_layers = 75, [58, 66, 74]
+
     wf = open(weights_file, 'rb')
     major, minor, revision, seen, _ = np.fromfile(wf, dtype=np.int32, count=5)
 
     j = 0
-    for i in range(75):
+    for i in range(num_conv):
         conv_layer_name = 'conv2d_%d' %i if i > 0 else 'conv2d'
         bn_layer_name = 'batch_normalization_%d' %j if j > 0 else 'batch_normalization'
 
@@ -21,7 +27,7 @@ def load_weights(model, weights_file):
         k_size = conv_layer.kernel_size[0]
         in_dim = conv_layer.input_shape[-1]
 
-        if i not in [58, 66, 74]:
+        if i not in output_layers:
             # darknet weights: [beta, gamma, mean, variance]
             bn_weights = np.fromfile(wf, dtype=np.float32, count=4 * filters)
             # tf weights: [gamma, beta, mean, variance]
@@ -37,7 +43,7 @@ def load_weights(model, weights_file):
         # tf shape (height, width, in_dim, out_dim)
         conv_weights = conv_weights.reshape(conv_shape).transpose([2, 3, 1, 0])
 
-        if i not in [58, 66, 74]:
+        if i not in output_layers:
             conv_layer.set_weights([conv_weights])
             bn_layer.set_weights(bn_weights)
         else:
@@ -61,7 +67,7 @@ def get_anchors(anchors_path):
     with open(anchors_path) as f:
         anchors = f.readline()
     anchors = np.array(anchors.split(','), dtype=np.float32)
-    return anchors.reshape(3, 3, 2)
+    return anchors.reshape(-1, 3, 2)
 
 
 def image_preporcess(image, target_size, gt_boxes=None):
@@ -18,8 +18,9 @@ from core.config import cfg
 
 
 NUM_CLASS       = len(utils.read_class_names(cfg.YOLO.CLASSES))
-ANCHORS         = utils.get_anchors(cfg.YOLO.ANCHORS)
-STRIDES         = np.array(cfg.YOLO.STRIDES)
+# cfg.YOLO.TINY切换为YOLOv3-tiny时，decode和compute_loss使用tiny自己的先验框和采样率
+ANCHORS         = utils.get_anchors(cfg.YOLO.ANCHORS_TINY if cfg.YOLO.TINY else cfg.YOLO.ANCHORS)
+STRIDES         = np.array(cfg.YOLO.STRIDES_TINY if cfg.YOLO.TINY else cfg.YOLO.STRIDES)
 IOU_LOSS_THRESH = cfg.YOLO.IOU_LOSS_THRESH
 
 
@@ -139,6 +140,48 @@ def YOLOv3(input_layer, class_num=NUM_CLASS):
     return [master, branch_2, branch_1]
 
 
+def darknet_tiny(input_data):
+    """YOLOV3-tiny的分类网络，由7个卷积层和6个maxpool组成"""
+    input_data = convolutional(input_data, (3, 3,   3,  16))
+    input_data = tf.keras.layers.MaxPool2D(2, 2, 'same')(input_data)
+    input_data = convolutional(input_data, (3, 3,  16,  32))
+    input_data = tf.keras.layers.MaxPool2D(2, 2, 'same')(input_data)
+    input_data = convolutional(input_data, (3, 3,  32,  64))
+    input_data = tf.keras.layers.MaxPool2D(2, 2, 'same')(input_data)
+    input_data = convolutional(input_data, (3, 3,  64, 128))
+    input_data = tf.keras.layers.MaxPool2D(2, 2, 'same')(input_data)
+    input_data = convolutional(input_data, (3, 3, 128, 256))
+    route_1 = input_data
+    input_data = tf.keras.layers.MaxPool2D(2, 2, 'same')(input_data)
+    input_data = convolutional(input_data, (3, 3, 256, 512))
+    # stride为1的maxpool，保持13×13的尺寸不变
+    input_data = tf.keras.layers.MaxPool2D(2, 1, 'same')(input_data)
+    input_data = convolutional(input_data, (3, 3, 512, 1024))
+    # (None, 26, 26, 256) (None, 13, 13, 1024)
+    return route_1, input_data
+
+
+def YOLOv3_tiny(input_layer, class_num=NUM_CLASS):
+    """YOLOV3-tiny网络主体，只有16,32两种采样率的输出
+    注意：卷积层的创建顺序需和darknet的yolov3-tiny.cfg保持一致，utils.load_weights才能按顺序加载权重
+    """
+    route_1, conv = darknet_tiny(input_layer)
+    conv = convolutional(conv, (1, 1, 1024, 256))
+
+    conv_branch_1 = convolutional(conv, (3, 3, 256, 512))
+    branch_1 = convolutional(conv_branch_1, (1, 1, 512, 3*(class_num + 5)), activate=False, bn=False)
+
+    conv = convolutional(conv, (1, 1, 256, 128))
+    conv = upsample(conv)
+
+    conv = tf.concat([conv, route_1], axis=-1)
+
+    conv_branch_2 = convolutional(conv, (3, 3, 384, 256))
+    branch_2 = convolutional(conv_branch_2, (1, 1, 256, 3*(class_num + 5)), activate=False, bn=False)
+    # (None, 26, 26, 75) (None, 13, 13, 75)
+    return [branch_2, branch_1]
+
+
 def upsample(input_layer):
     """下采样，缩放特征"""
     return tf.image.resize(input_layer, (input_layer.shape[1] * 2, input_layer.shape[2] * 2), method='nearest')
@@ -162,10 +205,20 @@ def build_yolov3():
     return model
 
 
-def build_for_test():
-    """构建测试和验证的yolo模型"""
-    inputs = tf.keras.layers.Input([416, 416, 3])
-    feature_maps = YOLOv3(inputs)
+def build_yolov3_tiny():
+    """构建包含两种采样率输出的YOLOv3-tiny网络
+    输入图像为416×416时，输出tensor的尺寸分别为26,13，分别对应16,32倍下采样
+    """
+    input_tensor = tf.keras.layers.Input([416, 416, 3])
+    output_tensor = YOLOv3_tiny(input_tensor)
+    model = tf.keras.Model(input_tensor, output_tensor)
+    return model
+
+
+def build_for_test(input_size=416):
+    """构建测试和验证的yolo模型，cfg.YOLO.TINY = True时构建YOLOv3-tiny"""
+    inputs = tf.keras.layers.Input([input_size, input_size, 3])
+    feature_maps = YOLOv3_tiny(inputs) if cfg.YOLO.TINY else YOLOv3(inputs)
     outputs = []
     for i, feature_map in enumerate(feature_maps):
         bbox_tensor = decode(feature_map, i)
@@ -0,0 +1,205 @@
+"""后台评估训练中保存的checkpoint
+和train.py同时运行(单独的进程)，监视checkpoint目录，每出现一个新的 N_epoch_yolov3_weights 就在
+voc_test.txt的固定子集上用YoloDetector批量检测并计算mAP，写入和训练相同的TensorBoard logdir。
+评估进程会降低自身优先级(nice)、只使用指定数量的cpu核，默认不占用GPU，不会阻塞或拖慢训练。
+
+python eval_checkpoints.py --ckpt_dir ./ --logdir ./data/log --num_images 500 --cores 2
+"""
+import os
+import re
+import glob
+import time
+import random
+import argparse
+import numpy as np
+import cv2
+import tensorflow as tf
+from core import utils
+from core.config import cfg
+
+CKPT_PATTERN = re.compile(r'^(\d+)_epoch_yolov3_weights$')
+
+
+def str2bool(v):
+    return v.lower() in ("yes", "true", "t", "1")
+
+
+parser = argparse.ArgumentParser(description='Background YOLOv3 checkpoint evaluator')
+parser.add_argument('--ckpt_dir', default='./', type=str,
+                    help='Directory where train.py saves N_epoch_yolov3_weights')
+parser.add_argument('--logdir', default='./data/log', type=str,
+                    help='TensorBoard logdir, same as train.py')
+parser.add_argument('--num_images', default=500, type=int,
+                    help='Size of the fixed voc_test.txt subset used for evaluation')
+parser.add_argument('--seed', default=0, type=int,
+                    help='Random seed used to pick the subset')
+parser.add_argument('--batch_size', default=8, type=int,
+                    help='Batch size of YoloDetector.detect_batch')
+parser.add_argument('--cores', default=2, type=int,
+                    help='Number of cpu cores the evaluator may use')
+parser.add_argument('--nice', default=10, type=int,
+                    help='Niceness increment of the evaluator process')
+parser.add_argument('--gpu', default=False, type=str2bool,
+                    help='Allow the evaluator to use the GPU')
+parser.add_argument('--interval', default=30, type=int,
+                    help='Seconds between two scans of ckpt_dir')
+
+
+def limit_resources(cores, nice, use_gpu):
+    """降低进程优先级并限制可用的cpu核数/线程数，需在tensorflow初始化之前调用"""
+    if hasattr(os, 'nice'):
+        os.nice(nice)
+    if hasattr(os, 'sched_setaffinity'):
+        available = sorted(os.sched_getaffinity(0))
+        # 使用最后几个核，尽量避开训练进程的数据加载线程
+        os.sched_setaffinity(0, available[-cores:])
+    cv2.setNumThreads(cores)
+    tf.config.threading.set_intra_op_parallelism_threads(cores)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    if not use_gpu:
+        tf.config.set_visible_devices([], 'GPU')
+    else:
+        for gpu in tf.config.experimental.list_physical_devices('GPU'):
+            tf.config.experimental.set_memory_growth(gpu, True)
+
+
+def load_subset(annot_path, num_images, seed):
+    """从voc_test.txt中按固定随机种子选出评估子集，每次评估都使用相同的图片"""
+    with open(annot_path, 'r') as f:
+        annotations = [line.strip().split() for line in f if len(line.strip()) != 0]
+    if num_images < len(annotations):
+        indices = sorted(random.Random(seed).sample(range(len(annotations)), num_images))
+        annotations = [annotations[i] for i in indices]
+    return annotations
+
+
+def steps_per_epoch():
+    """和core/dataset.py中一致的每轮迭代步数，用于将mAP对齐到训练的global_steps"""
+    with open(cfg.TRAIN.ANNOT_PATH, 'r') as f:
+        num_samples = len([line for line in f if len(line.strip().split()[1:]) != 0])
+    return int(np.ceil(num_samples / cfg.TRAIN.BATCH_SIZE))
+
+
+def compute_map(ground_truths, predictions, num_classes, min_overlap=0.5):
+    """和data/mAP/main.py一致的VOC2012 mAP计算(只统计出现在ground truth中的类别)
+    ground_truths: 每张图一个 (N, 5) 数组：xmin, ymin, xmax, ymax, class_id
+    predictions:   每张图一个 (M, 6) 数组：xmin, ymin, xmax, ymax, score, class_id
+    """
+    aps = {}
+    for cls in range(num_classes):
+        gt_boxes = [gt[gt[:, 4] == cls, :4].astype(np.float64) for gt in ground_truths]
+        num_gt = sum(len(boxes) for boxes in gt_boxes)
+        if num_gt == 0:
+            continue
+        used = [np.zeros(len(boxes), dtype=bool) for boxes in gt_boxes]
+
+        dets = [(pred[k, 4], i, pred[k, :4]) for i, pred in enumerate(predictions)
+                for k in np.where(pred[:, 5] == cls)[0]]
+        dets.sort(key=lambda d: -d[0])
+        tp = np.zeros(len(dets))
+        fp = np.zeros(len(dets))
+        for d, (_, i, bb) in enumerate(dets):
+            bbgt = gt_boxes[i]
+            if len(bbgt) == 0:
+                fp[d] = 1
+                continue
+            iw = np.minimum(bb[2], bbgt[:, 2]) - np.maximum(bb[0], bbgt[:, 0]) + 1
+            ih = np.minimum(bb[3], bbgt[:, 3]) - np.maximum(bb[1], bbgt[:, 1]) + 1
+            inter = np.where((iw > 0) & (ih > 0), iw * ih, 0)
+            ua = (bb[2] - bb[0] + 1) * (bb[3] - bb[1] + 1) + \
+                 (bbgt[:, 2] - bbgt[:, 0] + 1) * (bbgt[:, 3] - bbgt[:, 1] + 1) - inter
+            overlaps = np.where(inter > 0, inter / ua, -1)
+            jmax = int(np.argmax(overlaps))
+            if overlaps[jmax] >= min_overlap and not used[i][jmax]:
+                tp[d] = 1
+                used[i][jmax] = True
+            else:
+                fp[d] = 1
+
+        tp, fp = np.cumsum(tp), np.cumsum(fp)
+        rec = tp / num_gt
+        prec = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+        mrec = np.concatenate(([0.], rec, [1.]))
+        mpre = np.concatenate(([0.], prec, [0.]))
+        mpre = np.maximum.accumulate(mpre[::-1])[::-1]
+        i = np.where(mrec[1:] != mrec[:-1])[0] + 1
+        aps[cls] = np.sum((mrec[i] - mrec[i - 1]) * mpre[i])
+    return float(np.mean(list(aps.values()))) if aps else 0., aps
+
+
+def evaluate_checkpoint(detector, ckpt_path, annotations, num_classes, batch_size):
+    """加载checkpoint并在评估子集上批量检测，返回mAP、各类别AP和每张图的检测耗时"""
+    detector.model.load_weights(ckpt_path)
+    ground_truths, predictions = [], []
+    detect_time = 0.
+    for batch_start in range(0, len(annotations), batch_size):
+        batch_annotations = annotations[batch_start: batch_start + batch_size]
+        images = [cv2.cvtColor(cv2.imread(annotation[0]), cv2.COLOR_BGR2RGB) for annotation in batch_annotations]
+        start_time = time.time()
+        batch_detections = detector.detect_batch(images)
+        detect_time += time.time() - start_time
+        for annotation, detections in zip(batch_annotations, batch_detections):
+            gt = np.array([list(map(int, box.split(','))) for box in annotation[1:]]).reshape(-1, 5)
+            pred = np.stack([detections['xmin'], detections['ymin'], detections['xmax'], detections['ymax'],
+                             detections['score'], detections['class_id']], axis=-1).reshape(-1, 6)
+            # evaluate.py写入predicted文件时box坐标取整，这里保持一致
+            pred[:, :4] = pred[:, :4].astype(np.int32)
+            ground_truths.append(gt)
+            predictions.append(pred)
+    mAP, aps = compute_map(ground_truths, predictions, num_classes)
+    return mAP, aps, detect_time / max(len(annotations), 1)
+
+
+def find_new_checkpoints(ckpt_dir, evaluated):
+    """返回ckpt_dir中还未评估且已经写完(.index文件存在且数据文件不再变化)的checkpoint"""
+    checkpoints = []
+    for index_file in glob.glob(os.path.join(ckpt_dir, '*_epoch_yolov3_weights.index')):
+        ckpt_path = index_file[:-len('.index')]
+        match = CKPT_PATTERN.match(os.path.basename(ckpt_path))
+        if match is None or ckpt_path in evaluated:
+            continue
+        data_files = glob.glob(ckpt_path + '.data-*')
+        if len(data_files) == 0:
+            continue
+        # 最近几秒内仍在写入的checkpoint留到下一次再评估
+        if time.time() - max(os.path.getmtime(f) for f in data_files + [index_file]) < 5:
+            continue
+        checkpoints.append((int(match.group(1)), ckpt_path))
+    return sorted(checkpoints)
+
+
+def main(args):
+    limit_resources(args.cores, args.nice, args.gpu)
+    # 在限制线程数之后再构建模型
+    from core.detector import YoloDetector
+
+    annotations = load_subset(cfg.TEST.ANNOT_PATH, args.num_images, args.seed)
+    classes = utils.read_class_names(cfg.YOLO.CLASSES)
+    epoch_steps = steps_per_epoch()
+    print('=> evaluating %d images of %s, %d cores, nice +%d' % (
+        len(annotations), cfg.TEST.ANNOT_PATH, args.cores, args.nice))
+
+    detector = None
+    evaluated = set()
+    writer = tf.summary.create_file_writer(os.path.join(args.logdir, 'eval'))
+    while True:
+        for epoch, ckpt_path in find_new_checkpoints(args.ckpt_dir, evaluated):
+            if detector is None:
+                detector = YoloDetector(ckpt_path)
+            print('=> evaluating %s' % ckpt_path)
+            mAP, aps, detect_time = evaluate_checkpoint(detector, ckpt_path, annotations, len(classes),
+                                                        args.batch_size)
+            evaluated.add(ckpt_path)
+            print('=> epoch %d mAP: %.4f (%.2f ms/image)' % (epoch, mAP, 1000 * detect_time))
+            # step和train.py的global_steps对齐
+            step = epoch * epoch_steps
+            with writer.as_default():
+                tf.summary.scalar("eval/mAP", mAP, step=step)
+                for cls, ap in aps.items():
+                    tf.summary.scalar("eval_ap/%s" % classes[cls], ap, step=step)
+            writer.flush()
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -1,18 +1,53 @@
 import cv2
 import os
+import time
 import shutil
 import numpy as np
 import tensorflow as tf
-from core import utils, yolov3
+from core import utils
 from core.config import cfg
+from core.detector import YoloDetector, to_bboxes
 
 print("Num GPUs Available: ", len(tf.config.experimental.list_physical_devices('GPU')))
 for gpu in tf.config.experimental.list_physical_devices('GPU'):
     tf.config.experimental.set_memory_growth(gpu, True)
 
 
-def evaluate(model_path):
-    INPUT_SIZE = 416
+def write_ground_truth(ground_truth_path, annotation, classes):
+    """将一行annotation中的真实标记box写入ground-truth文件"""
+    bbox_data_gt = np.array([list(map(int, box.split(','))) for box in annotation[1:]])
+
+    if len(bbox_data_gt) == 0:
+        bboxes_gt = []
+        classes_gt = []
+    else:
+        bboxes_gt, classes_gt = bbox_data_gt[:, :4], bbox_data_gt[:, 4]
+
+    num_bbox_gt = len(bboxes_gt)
+    with open(ground_truth_path, 'w') as f:
+        for i in range(num_bbox_gt):
+            class_name = classes[classes_gt[i]]
+            xmin, ymin, xmax, ymax = list(map(str, bboxes_gt[i]))
+            bbox_mess = ' '.join([class_name, xmin, ymin, xmax, ymax]) + '\n'
+            f.write(bbox_mess)
+            print('\t' + str(bbox_mess).strip())
+
+
+def write_predicted(predict_result_path, detections, classes):
+    """将YoloDetector输出的结构化数组写入predicted文件"""
+    with open(predict_result_path, 'w') as f:
+        # bbox：xmin,ymin,xmax,ymax,score(分类置信度),class_ind(分类index)
+        for det in detections:
+            coor = np.array([det['xmin'], det['ymin'], det['xmax'], det['ymax']], dtype=np.int32)
+            class_name = classes[int(det['class_id'])]
+            score = '%.4f' % det['score']
+            xmin, ymin, xmax, ymax = list(map(str, coor))
+            bbox_mess = ' '.join([class_name, score, xmin, ymin, xmax, ymax]) + '\n'
+            f.write(bbox_mess)
+            print('\t' + str(bbox_mess).strip())
+
+
+def evaluate(model_path, darknet=False):
     CLASSES = utils.read_class_names(cfg.YOLO.CLASSES)
 
     predicted_dir_path = './data/mAP/predicted'
@@ -26,66 +61,48 @@ def evaluate(model_path):
     os.mkdir(cfg.TEST.DECTECTED_IMAGE_PATH)
 
     # Build Model
-    model = yolov3.build_for_test()
-    model.load_weights(model_path)
-    # 加载利用darknet训练的权重文件
-    # utils.load_weights(model, "./weight/yolov3-voc_10000.weights")
-    print(model.summary())
+    # 加载利用darknet训练的权重文件: evaluate("./weight/yolov3-voc_10000.weights", darknet=True)
+    detector = YoloDetector(model_path, darknet=darknet)
+    print(detector.model.summary())
+    # 统计推理耗时，用于对比YOLOv3和YOLOv3-tiny的吞吐量
+    predict_time, num_images = 0., 0
 
     with open(cfg.TEST.ANNOT_PATH, 'r') as annotation_file:
-        for num, line in enumerate(annotation_file):
-            annotation = line.strip().split()
-            image_path = annotation[0]
-            image_name = image_path.split('/')[-1]
-            image = cv2.imread(image_path)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            bbox_data_gt = np.array([list(map(int, box.split(','))) for box in annotation[1:]])
-
-            if len(bbox_data_gt) == 0:
-                bboxes_gt = []
-                classes_gt = []
-            else:
-                bboxes_gt, classes_gt = bbox_data_gt[:, :4], bbox_data_gt[:, 4]
+        annotations = [line.strip().split() for line in annotation_file]
+
+    # 按cfg.TEST.BATCH_SIZE批量检测
+    for batch_start in range(0, len(annotations), cfg.TEST.BATCH_SIZE):
+        batch_annotations = annotations[batch_start: batch_start + cfg.TEST.BATCH_SIZE]
+        images = []
+        for num, annotation in enumerate(batch_annotations, batch_start):
+            image = cv2.imread(annotation[0])
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
             ground_truth_path = os.path.join(ground_truth_dir_path, str(num) + '.txt')
+            write_ground_truth(ground_truth_path, annotation, CLASSES)
 
-            # print('=> ground truth of %s:' % image_name)
-            num_bbox_gt = len(bboxes_gt)
-            with open(ground_truth_path, 'w') as f:
-                for i in range(num_bbox_gt):
-                    class_name = CLASSES[classes_gt[i]]
-                    xmin, ymin, xmax, ymax = list(map(str, bboxes_gt[i]))
-                    bbox_mess = ' '.join([class_name, xmin, ymin, xmax, ymax]) + '\n'
-                    f.write(bbox_mess)
-                    print('\t' + str(bbox_mess).strip())
+        # Predict
+        start_time = time.time()
+        batch_detections = detector.detect_batch(images)
+        predict_time += time.time() - start_time
+        num_images += len(images)
+
+        for num, (annotation, image, detections) in enumerate(zip(batch_annotations, images, batch_detections),
+                                                              batch_start):
+            image_name = annotation[0].split('/')[-1]
             print('=> predict result of %s:' % image_name)
             predict_result_path = os.path.join(predicted_dir_path, str(num) + '.txt')
-            image_size = image.shape[:2]
-            image_data = utils.image_preporcess(np.copy(image), [INPUT_SIZE, INPUT_SIZE])
-            image_data = image_data[np.newaxis, ...].astype(np.float32)
-            # Predict
-            pred_bbox = model.predict(image_data)
-            pred_bbox = [tf.reshape(x, (-1, tf.shape(x)[-1])) for x in pred_bbox]
-            pred_bbox = tf.concat(pred_bbox, axis=0)
-            bboxes = utils.postprocess_boxes(pred_bbox, image_size, INPUT_SIZE, cfg.TEST.SCORE_THRESHOLD)
-            bboxes = utils.nms(bboxes, cfg.TEST.IOU_THRESHOLD, method='nms')
 
             if cfg.TEST.DECTECTED_IMAGE_PATH is not None:
-                image = utils.draw_bbox(image, bboxes)
+                image = utils.draw_bbox(image, to_bboxes(detections))
                 cv2.imwrite(cfg.TEST.DECTECTED_IMAGE_PATH + image_name, image)
 
-            print('bboxes length >>>>>>>>>>>>>>>>> ', bboxes.__len__())
-            with open(predict_result_path, 'w') as f:
-                # bbox：xmin,ymin,xmax,ymax,score(分类置信度),class_ind(分类index)
-                for bbox in bboxes:
-                    coor = np.array(bbox[:4], dtype=np.int32)
-                    score = bbox[4]
-                    class_ind = int(bbox[5])
-                    class_name = CLASSES[class_ind]
-                    score = '%.4f' % score
-                    xmin, ymin, xmax, ymax = list(map(str, coor))
-                    bbox_mess = ' '.join([class_name, score, xmin, ymin, xmax, ymax]) + '\n'
-                    f.write(bbox_mess)
-                    print('\t' + str(bbox_mess).strip())
+            print('bboxes length >>>>>>>>>>>>>>>>> ', len(detections))
+            write_predicted(predict_result_path, detections, CLASSES)
+
+    if num_images > 0:
+        print('=> %s: %d images, average detection time: %.2f ms, FPS: %.2f' % (
+            'YOLOv3-tiny' if cfg.YOLO.TINY else 'YOLOv3', num_images,
+            1000 * predict_time / num_images, num_images / predict_time))
 
 
 if __name__ == '__main__':
@@ -2,8 +2,7 @@ import cv2
 import numpy as np
 import core.utils as utils
 import tensorflow as tf
-from core import yolov3
-from core.yolov3 import YOLOv3, decode
+from core.detector import YoloDetector, to_bboxes
 import time
 from PIL import Image
 
@@ -12,43 +11,24 @@ assert len(physical_devices) > 0, "Not enough GPU hardware devices available"
 tf.config.experimental.set_memory_growth(physical_devices[0], True)
 
 
-def test_image(image_path, model_path):
-    input_size = 416
+def test_image(image_path, detector):
     original_image      = cv2.imread(image_path)
     original_image      = cv2.cvtColor(original_image, cv2.COLOR_BGR2RGB)
-    original_image_size = original_image.shape[:2]
 
-    image_data = utils.image_preporcess(np.copy(original_image), [input_size, input_size])
-    image_data = image_data[np.newaxis, ...].astype(np.float32)
-
-    model = yolov3.build_for_test()
-    # 加载tf model:model.load_weights(model_path);加载darknet model: utils.load_weights(model, model_path)
-    utils.load_weights(model, model_path)
-    model.summary()
     start_time = time.time()
-    pred_bbox = model.predict(image_data)
-    print('pred_bbox>>>>>>>>>>>>>>>>>', pred_bbox)
+    # letterbox >> predict >> 还原到原图坐标并删除部分无效box >> nms
+    detections = detector.detect(original_image)
     end_time = time.time()
+    print('detections>>>>>>>>>>>>>>>>>', detections)
     print("time: %.2f ms" %(1000*(end_time-start_time)))
 
-    pred_bbox = [tf.reshape(x, (-1, tf.shape(x)[-1])) for x in pred_bbox]
-    pred_bbox = tf.concat(pred_bbox, axis=0)
-    # 将416×416下的bbox坐标转换为原图上的坐标并删除部分无效box
-    bboxes = utils.postprocess_boxes(pred_bbox, original_image_size, input_size, 0.3)
-    bboxes = utils.nms(bboxes, 0.45, method='nms')
     # 构建原图和bbox画出坐标框
-    image = utils.draw_bbox(original_image, bboxes)
+    image = utils.draw_bbox(original_image, to_bboxes(detections))
     image = Image.fromarray(image)
     image.show()
 
 
-def test_video(video_path, model_path):
-    input_size      = 416
-
-    model = yolov3.build_for_test()
-    # model.load_weights(model_path)
-    utils.load_weights(model, model_path)
-    model.summary()
+def test_video(video_path, detector):
     vid = cv2.VideoCapture(video_path)
     while True:
         return_value, frame = vid.read()
@@ -56,20 +36,13 @@ def test_video(video_path, model_path):
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         else:
             raise ValueError("No image!")
-        frame_size = frame.shape[:2]
-        image_data = utils.image_preporcess(np.copy(frame), [input_size, input_size])
-        image_data = image_data[np.newaxis, ...].astype(np.float32)
 
         prev_time = time.time()
-        pred_bbox = model.predict_on_batch(image_data)
+        detections = detector.detect(frame)
         curr_time = time.time()
         exec_time = curr_time - prev_time
 
-        pred_bbox = [tf.reshape(x, (-1, tf.shape(x)[-1])) for x in pred_bbox]
-        pred_bbox = tf.concat(pred_bbox, axis=0)
-        bboxes = utils.postprocess_boxes(pred_bbox, frame_size, input_size, 0.3)
-        bboxes = utils.nms(bboxes, 0.45, method='nms')
-        image = utils.draw_bbox(frame, bboxes)
+        image = utils.draw_bbox(frame, to_bboxes(detections))
 
         result = np.asarray(image)
         info = "time: %.2f ms" %(1000*exec_time)
@@ -84,12 +57,18 @@ def test_video(video_path, model_path):
 if __name__=='__main__':
 
     model_path = "./weight/yolov3.weights"
+    # model_path = "./weight/yolov3-tiny.weights"  # 需设置cfg.YOLO.TINY = True
     # model_path = "./weight/60_epoch_yolov3_weights"
 
+    # 检测器只需构建一次，加载权重并预热后可反复调用
+    # 加载tf model: YoloDetector(model_path);加载darknet model: YoloDetector(model_path, darknet=True)
+    detector = YoloDetector(model_path, darknet=True)
+    detector.model.summary()
+
     # 测试图片
-    test_image("./resource/kite.jpg", model_path)
+    test_image("./resource/kite.jpg", detector)
 
     # 测试视频
-    # test_video("./resource/road.mp4", model_path)
+    # test_video("./resource/road.mp4", detector)
 
 
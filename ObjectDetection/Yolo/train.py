@@ -49,9 +49,9 @@ def train_step(image_data, target):
 
 
 def yolo_loss(target, output):
-    """计算损失，for循环计算三个采样率下的损失，注意：此处取三种采样率下的总损失而不是平均损失"""
+    """计算损失，for循环计算各采样率(tiny为两种)下的损失，注意：此处取各采样率下的总损失而不是平均损失"""
     giou_loss=conf_loss=prob_loss=0
-    for i in range(3):
+    for i in range(len(output)):
         # pred.shape (8, 52, 52, 3, 25) -----  output[i].shape  (8, 52, 52, 75)
         pred = yolov3.decode(output[i], i)
         loss_items = yolov3.compute_loss(pred, output[i], *target[i], i)
@@ -78,8 +78,8 @@ if __name__=='__main__':
     logdir = "./data/log"
     if os.path.exists(logdir): shutil.rmtree(logdir)
     writer = tf.summary.create_file_writer(logdir)
-    # 构建yolov3网络
-    model = yolov3.build_yolov3()
+    # 构建yolov3网络(cfg.YOLO.TINY = True时构建YOLOv3-tiny)
+    model = yolov3.build_yolov3_tiny() if cfg.YOLO.TINY else yolov3.build_yolov3()
     # model.load_weights('./weight/60_epoch_yolov3_weights')
     # 定义优化器
     optimizer = tf.keras.optimizers.Adam()